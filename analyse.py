@@ -0,0 +1,229 @@
+"""
+This file replays large numbers of games, or positions, across several processes and writes what it finds about
+each one to a file, one JSON object per line, in the same order as the input.
+
+    python analyse.py games.pgn more.pgn positions.bin --output results.jsonl --workers 8 --depth 2
+
+PGN files (ending .pgn) are read a game at a time and files of packed positions (anything else, see packed.py)
+a position at a time, and handed to the workers in chunks. Only a few chunks are ever waiting to be written,
+so reading stops while the workers or the disk catch up instead of filling memory.
+After every chunk written, a checkpoint file next to the output records how far it has got. Run the same command
+again with --resume and it carries on from there.
+"""
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from constants import WHITE, BLACK
+from board import Board
+from pgn import read_games, san, IllegalMoveError
+from packed import PositionFile, unpack
+
+CHUNK_SIZE = 64
+# chunks sent to the workers but not yet written, per worker
+PENDING_PER_WORKER = 2
+PROGRESS_SECONDS = 2.0
+
+_engine = None
+_depth = 0
+
+
+def _start_worker(depth, hash_mb):
+    """Runs once in each worker process, setting up the engine used for the evaluations."""
+    global _engine, _depth
+    _depth = depth
+    if depth:
+        from engine import Engine
+        _engine = Engine(hash_mb)
+
+
+def read_items(paths):
+    """Yields ("game", path, PGNGame) or ("position", path, packed bytes) for everything in the input files."""
+    for path in paths:
+        if path.endswith(".pgn"):
+            for game in read_games(path):
+                yield "game", path, game
+        else:
+            with PositionFile(path) as positions:
+                for index in range(len(positions)):
+                    yield "position", path, bytes(positions.raw(index))
+
+
+def analyse_chunk(chunk):
+    """Runs in a worker: analyses a list of (index, kind, path, item) and returns a result dict for each."""
+    results = []
+    board = Board()
+    for index, kind, path, item in chunk:
+        if kind == "game":
+            result = analyse_game(item)
+        else:
+            result = analyse_position(unpack(item, board))
+        result["index"] = index
+        result["source"] = path
+        results.append(result)
+    return results
+
+
+def analyse_game(game):
+    """Replays a PGNGame and reports its length, the checks given, whether it ended by the rules (mate, stalemate
+    or a draw by rule), whether that agrees with the result it claims, and the first illegal move if there is one.
+    A game whose starting position can't be set up, such as one with a malformed FEN tag, is reported with the reason
+    in its error field and nothing else, so one bad game doesn't stop a batch.
+    """
+    checks = {"white": 0, "black": 0}
+    illegal = None
+    plies = 0
+    try:
+        board = game.start_board()
+    except ValueError as error:
+        return {
+            "white": game.headers.get("White", "?"),
+            "black": game.headers.get("Black", "?"),
+            "result": game.result,
+            "plies": 0,
+            "checks": checks,
+            "termination": None,
+            "result_matches": None,
+            "illegal": None,
+            "final_fen": None,
+            "error": str(error),
+        }
+    try:
+        for move, board in game.positions(board):
+            plies += 1
+            mover = WHITE if board.turn == BLACK else BLACK
+            if board.isCheck(mover, board.last_move):
+                checks["white" if mover == WHITE else "black"] += 1
+    except IllegalMoveError:
+        illegal = {"ply": plies + 1, "move": game.moves[plies], "fen": board.to_fen()}
+    outcome = board.outcome()
+    termination = outcome[1] if outcome else None
+    detected = outcome[0] if outcome else None
+    result = {
+        "white": game.headers.get("White", "?"),
+        "black": game.headers.get("Black", "?"),
+        "result": game.result,
+        "plies": plies,
+        "checks": checks,
+        "termination": termination,
+        "result_matches": detected is None or detected == game.result,
+        "illegal": illegal,
+        "final_fen": board.to_fen(),
+        "error": None,
+    }
+    if _depth:
+        result.update(_evaluate(board))
+    return result
+
+
+def analyse_position(board):
+    """Reports the number of legal moves in a position, whether it is check and whether the game is over."""
+    enemy = WHITE if board.turn == BLACK else BLACK
+    outcome = board.outcome()
+    result = {
+        "fen": board.to_fen(),
+        "legal_moves": len(board.legal_moves()),
+        "check": board.isCheck(enemy, board.last_move),
+        "termination": outcome[1] if outcome else None,
+    }
+    if _depth:
+        result.update(_evaluate(board))
+    return result
+
+
+def _evaluate(board):
+    """A shallow search of the board's position. The score is in centipawns from white's point of view."""
+    move, stats = _engine.search(board, depth=_depth)
+    score = stats["score"] if board.turn == WHITE else -stats["score"]
+    return {"eval": score, "best_move": san(board, move) if move is not None else None}
+
+
+def _chunks(items, start, size):
+    """Numbers the items from start and groups them into lists of size."""
+    numbered = ((index, *item) for index, item in enumerate(items, start))
+    while True:
+        chunk = list(itertools.islice(numbered, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"items": 0, "bytes": 0}
+
+
+def _write_checkpoint(path, items, output_bytes):
+    """Replaces the checkpoint in one step, so a crash leaves either the old one or the new one."""
+    with open(path + ".tmp", "w") as file:
+        json.dump({"items": items, "bytes": output_bytes}, file)
+    os.replace(path + ".tmp", path)
+
+
+def run(paths, output, workers=None, depth=0, hash_mb=16, resume=False, chunk_size=CHUNK_SIZE, progress=sys.stderr):
+    """Analyses everything in the input files into the output file and returns how many items were analysed."""
+    workers = workers or multiprocessing.cpu_count()
+    checkpoint_path = output + ".checkpoint"
+    checkpoint = _read_checkpoint(checkpoint_path) if resume else {"items": 0, "bytes": 0}
+    done = checkpoint["items"]
+    # anything written after the last checkpoint is written again, so cut it off
+    with open(output, "ab") as file:
+        file.truncate(checkpoint["bytes"])
+
+    items = itertools.islice(read_items(paths), done, None)
+    started = time.perf_counter()
+    last_report = started
+    analysed = 0
+    pending = collections.deque()
+    with open(output, "ab") as file, \
+            multiprocessing.Pool(workers, initializer=_start_worker, initargs=(depth, hash_mb)) as pool:
+
+        def write_next():
+            nonlocal done, analysed, last_report
+            results = pending.popleft().get()
+            file.write("".join(json.dumps(result) + "\n" for result in results).encode())
+            file.flush()
+            done += len(results)
+            analysed += len(results)
+            _write_checkpoint(checkpoint_path, done, file.tell())
+            now = time.perf_counter()
+            if progress and now - last_report >= PROGRESS_SECONDS:
+                last_report = now
+                print(f"{done} done, {analysed / (now - started):.1f} games/s", file=progress, flush=True)
+
+        for chunk in _chunks(items, done, chunk_size):
+            pending.append(pool.apply_async(analyse_chunk, (chunk,)))
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                write_next()
+        while pending:
+            write_next()
+
+    seconds = time.perf_counter() - started
+    if progress:
+        print(f"{analysed} analysed in {seconds:.1f}s, {analysed / seconds if seconds else 0:.1f} games/s, "
+              f"{done} in {output}", file=progress, flush=True)
+    return analysed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay and analyse games or positions in bulk.")
+    parser.add_argument("inputs", nargs="+", help=".pgn files of games, or files of packed positions")
+    parser.add_argument("--output", required=True, help="file to write one JSON result per line to")
+    parser.add_argument("--workers", type=int, help="processes to use, one per core if not given")
+    parser.add_argument("--depth", type=int, default=0, help="search the final position this deep (0 for none)")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB per worker")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="games or positions sent to a worker at once")
+    parser.add_argument("--resume", action="store_true", help="carry on from the last checkpoint")
+    args = parser.parse_args()
+    run(args.inputs, args.output, args.workers, args.depth, args.hash, args.resume, args.chunk)
+
+
+if __name__ == "__main__":
+    main()
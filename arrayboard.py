@@ -0,0 +1,202 @@
+"""
+This file holds a position as a NumPy array of 64 int8 piece codes, for scoring large numbers of positions at once.
+A square holds 0 when empty, 1 to 6 for a white pawn, knight, bishop, rook, queen or king and -1 to -6 for black,
+in the same square order as bitboard.py (square 0 is a8, square 63 is h1).
+
+Positions are stacked into an (N, 64) array and material, piece-square and mobility are worked out for every row
+at once with array operations, instead of walking Piece objects one square at a time.
+With mobility left out, evaluate_batch gives exactly the same scores as evaluation.evaluate.
+"""
+import numpy as np
+from constants import WHITE, BLACK, RANKS, FILES
+from bitboard import squares, FILE_A, FILE_H
+from evaluation import VALUES, TABLES, KING_ENDGAME_TABLE, ENDGAME_MATERIAL
+from piece import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, KIND_NAMES, PIECE_CODES, piece_code
+
+NAMES = tuple(KIND_NAMES[kind] for kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING))
+EMPTY = 0
+
+
+def signed_code(code):
+    """Turns a Board piece code into the code used here: the kind, negated for black."""
+    return -(code & 7) if code >> 3 == BLACK else code & 7
+
+
+def board_code(signed):
+    """The reverse of signed_code."""
+    return piece_code(BLACK, -signed) if signed < 0 else piece_code(WHITE, signed)
+
+
+# centipawns per square a knight, bishop, rook or queen can move to
+MOBILITY_WEIGHT = 4
+# how many positions evaluate_batch works on at a time, which bounds the memory its temporary arrays use
+CHUNK = 16384
+
+# Tables are indexed [code + 6], so row 0 is a black king and row 12 a white king, with white counted positive
+_MATERIAL = np.zeros(13, dtype=np.int32)
+_PIECE_SQUARE = np.zeros((13, RANKS * FILES), dtype=np.int32)
+_KING_ENDGAME = np.zeros((2, RANKS * FILES), dtype=np.int32)
+_mirror = np.arange(RANKS * FILES) ^ 56
+for _code, _name in enumerate(NAMES, 1):
+    _table = np.array(TABLES[_name], dtype=np.int32)
+    if _name != "king":
+        _MATERIAL[6 + _code] = VALUES[_name]
+        _MATERIAL[6 - _code] = -VALUES[_name]
+    _PIECE_SQUARE[6 + _code] = _table
+    _PIECE_SQUARE[6 - _code] = -_table[_mirror]
+_KING_ENDGAME[0] = KING_ENDGAME_TABLE
+_KING_ENDGAME[1] = -np.array(KING_ENDGAME_TABLE, dtype=np.int32)[_mirror]
+_NON_PAWN = np.array([0, VALUES["knight"], VALUES["bishop"], VALUES["rook"], VALUES["queen"], 0], dtype=np.int32)
+
+# Mobility is worked out on one uint64 bitboard per piece code, with bit sq set for square sq as in bitboard.py
+_ALL = np.uint64(0xFFFFFFFFFFFFFFFF)
+_NOT_FILE_A = np.uint64(0xFFFFFFFFFFFFFFFF ^ FILE_A)
+_NOT_FILE_H = np.uint64(0xFFFFFFFFFFFFFFFF ^ FILE_H)
+_NOT_FILES_AB = np.uint64(0xFFFFFFFFFFFFFFFF ^ FILE_A ^ FILE_A << 1)
+_NOT_FILES_GH = np.uint64(0xFFFFFFFFFFFFFFFF ^ FILE_H ^ FILE_H >> 1)
+
+# (shift, the squares a shifted bit may land on). A positive shift moves towards higher squares (down or right),
+# and the mask drops bits that wrapped round from one edge of the board to the other
+_ROOK_DIRECTIONS = ((-8, _ALL), (8, _ALL), (-1, _NOT_FILE_H), (1, _NOT_FILE_A))
+_BISHOP_DIRECTIONS = ((-9, _NOT_FILE_H), (-7, _NOT_FILE_A), (7, _NOT_FILE_H), (9, _NOT_FILE_A))
+_KNIGHT_DIRECTIONS = ((-17, _NOT_FILE_H), (-15, _NOT_FILE_A), (-10, _NOT_FILES_GH), (-6, _NOT_FILES_AB),
+                      (6, _NOT_FILES_GH), (10, _NOT_FILES_AB), (15, _NOT_FILE_H), (17, _NOT_FILE_A))
+
+
+def _shift(bitboards, amount):
+    if amount > 0:
+        return bitboards << np.uint64(amount)
+    return bitboards >> np.uint64(-amount)
+
+
+def _slide(sliders, empty, amount, wrap):
+    """The squares sliders attack in one direction, found for every row at once by doubling the distance filled
+    through empty squares three times (a Kogge-Stone fill), so 1 + 2 + 4 squares covers the longest ray.
+    """
+    empty = empty & wrap
+    sliders = sliders | empty & _shift(sliders, amount)
+    empty = empty & _shift(empty, amount)
+    sliders = sliders | empty & _shift(sliders, 2 * amount)
+    empty = empty & _shift(empty, 2 * amount)
+    sliders = sliders | empty & _shift(sliders, 4 * amount)
+    return _shift(sliders, amount) & wrap
+
+
+def _popcount(bitboards):
+    bitboards = bitboards - (bitboards >> np.uint64(1) & np.uint64(0x5555555555555555))
+    bitboards = (bitboards & np.uint64(0x3333333333333333)) + (bitboards >> np.uint64(2) & np.uint64(0x3333333333333333))
+    bitboards = (bitboards + (bitboards >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (bitboards * np.uint64(0x0101010101010101) >> np.uint64(56)).astype(np.int32)
+
+
+class ArrayBoard:
+    """A position as an int8 array of 64 piece codes, plus the side to move, castling rights and en passant pawn
+    that Board keeps alongside its pieces, so it can be turned back into a Board.
+    """
+
+    def __init__(self, squares_array, turn=WHITE, castling_rights=0, last_move=None):
+        self.squares = squares_array
+        self.turn = turn
+        self.castling_rights = castling_rights
+        self.last_move = last_move
+
+    @classmethod
+    def from_board(cls, board):
+        return cls(board_array(board), board.turn, board.castling_rights, board.last_move)
+
+    def to_board(self):
+        from board import Board
+        board = Board()
+        pieces = [(int(sq), board_code(int(self.squares[sq]))) for sq in np.flatnonzero(self.squares)]
+        board.set_position(pieces, self.turn, self.castling_rights, self.last_move)
+        return board
+
+
+def board_array(board):
+    """Returns the 64 piece codes of a Board's position, read from its bitboards."""
+    array = np.zeros(RANKS * FILES, dtype=np.int8)
+    for code in PIECE_CODES:
+        signed = signed_code(code)
+        for sq in squares(board.bitboards[code]):
+            array[sq] = signed
+    return array
+
+
+def stack(boards):
+    """Stacks Boards or ArrayBoards into an (N, 64) int8 array and an (N,) array that is True where white is to move."""
+    arrays = [board.squares if isinstance(board, ArrayBoard) else board_array(board) for board in boards]
+    batch = np.stack(arrays) if arrays else np.zeros((0, RANKS * FILES), dtype=np.int8)
+    white_to_move = np.array([board.turn == WHITE for board in boards], dtype=bool)
+    return batch, white_to_move
+
+
+def material(batch):
+    """White's material minus black's, in centipawns, for every row of an (N, 64) batch."""
+    return _MATERIAL[batch.astype(np.intp) + 6].sum(axis=1)
+
+
+def is_endgame(batch):
+    """True for every row in which neither side has more than a rook and a minor piece besides pawns."""
+    codes = batch.astype(np.intp)
+    white = np.where(codes > 0, _NON_PAWN[np.clip(codes, 1, 6) - 1], 0).sum(axis=1)
+    black = np.where(codes < 0, _NON_PAWN[np.clip(-codes, 1, 6) - 1], 0).sum(axis=1)
+    return (white <= ENDGAME_MATERIAL) & (black <= ENDGAME_MATERIAL)
+
+
+def piece_square(batch):
+    """White's piece-square bonuses minus black's, with the kings on their endgame table in endgame rows."""
+    codes = batch.astype(np.intp) + 6
+    scores = _PIECE_SQUARE[codes, np.arange(RANKS * FILES)]
+    endgame = is_endgame(batch)
+    if endgame.any():
+        kings = np.where(codes == 6 + KING, _KING_ENDGAME[0], 0) + np.where(codes == 6 - KING, _KING_ENDGAME[1], 0)
+        scores = np.where(endgame[:, None] & (np.abs(batch) == KING), kings, scores)
+    return scores.sum(axis=1)
+
+
+def bitplanes(batch):
+    """Returns an (N, 13) uint64 array of bitboards, one per piece code, indexed [code + 6] like the tables above."""
+    codes = np.asarray(batch, dtype=np.int8)
+    planes = np.empty((len(codes), 13), dtype=np.uint64)
+    for code in range(-6, 7):
+        planes[:, code + 6] = np.packbits(codes == code, axis=1, bitorder="little").view("<u8")[:, 0]
+    return planes
+
+
+def mobility(batch):
+    """The number of squares white's knights, bishops, rooks and queens can move to, minus black's.
+    Pins and checks are ignored, so this counts pseudo-legal moves.
+    A shift moves every piece of a kind by the same offset, so no two land on the same square, and a ray stops
+    at the first piece in its way, so no two pieces' rays in the same direction overlap. Counting the bits of each
+    shift or ray set therefore counts every piece's moves separately.
+    """
+    planes = bitplanes(batch)
+    empty = planes[:, 6]
+    score = np.zeros(len(planes), dtype=np.int32)
+    for sign, own in ((1, planes[:, 7:]), (-1, planes[:, :6])):
+        targets = ~np.bitwise_or.reduce(own, axis=1)
+        knights, bishops, rooks, queens = (planes[:, 6 + sign * code] for code in (KNIGHT, BISHOP, ROOK, QUEEN))
+        for amount, wrap in _KNIGHT_DIRECTIONS:
+            score += sign * _popcount(_shift(knights, amount) & wrap & targets)
+        for sliders, directions in ((rooks | queens, _ROOK_DIRECTIONS), (bishops | queens, _BISHOP_DIRECTIONS)):
+            for amount, wrap in directions:
+                score += sign * _popcount(_slide(sliders, empty, amount, wrap) & targets)
+    return score
+
+
+def evaluate_batch(batch, white_to_move=None, mobility_weight=MOBILITY_WEIGHT):
+    """Scores every row of an (N, 64) batch in centipawns.
+    Scores are from white's point of view, or from the side to move's if white_to_move is given,
+    the same as evaluation.evaluate when mobility_weight is 0.
+    """
+    batch = np.asarray(batch, dtype=np.int8)
+    scores = np.empty(len(batch), dtype=np.int32)
+    for start in range(0, len(batch), CHUNK):
+        chunk = batch[start:start + CHUNK]
+        chunk_scores = material(chunk) + piece_square(chunk)
+        if mobility_weight:
+            chunk_scores += mobility_weight * mobility(chunk)
+        scores[start:start + CHUNK] = chunk_scores
+    if white_to_move is not None:
+        scores = np.where(white_to_move, scores, -scores)
+    return scores
@@ -1,18 +1,87 @@
+"""
+This file loads the piece images. Nothing is loaded when it is imported: piece_images(square_size) is called the
+first time a board of that size is drawn, and returns the image for each piece code, scaled to fit the square.
+
+The twelve images are packed side by side into one sprite atlas, assets/pieces.png, which is built from the
+separate PNGs the first time it is needed. For every square size a board is drawn at, the whole atlas is scaled once
+and saved to assets/cache/pieces_<square size>.png, so the next run loads it straight from there without scaling.
+Within a run each size is kept in memory, and its images are subsurfaces of the one scaled atlas,
+so boards of the same size share them and drawing never scales anything.
+"""
+import os
 import pygame
+from piece import PIECE_CODES, PIECE_NAMES
+
+ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+ATLAS = os.path.join(ASSETS, "pieces.png")
+CACHE = os.path.join(ASSETS, "cache")
+# the width and height of a piece image as a share of the square, 60 pixels on a 100 pixel square
+PIECE_SCALE = 0.6
+
+# square size -> {piece code: image}
+_images = {}
+
+
+def source_path(code):
+    return os.path.join(ASSETS, f"{PIECE_NAMES[code]}_2x_ns.png")
+
+
+def build_atlas(path=ATLAS):
+    """Packs the twelve piece images into one row, in the order of PIECE_CODES, and saves it to path if given."""
+    sources = [pygame.image.load(source_path(code)) for code in PIECE_CODES]
+    cell = max(max(image.get_width(), image.get_height()) for image in sources)
+    atlas = pygame.Surface((cell * len(sources), cell), pygame.SRCALPHA)
+    for index, image in enumerate(sources):
+        atlas.blit(image, image.get_rect(center=(index * cell + cell // 2, cell // 2)))
+    if path:
+        _save(atlas, path)
+    return atlas
+
+
+def _save(surface, path):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pygame.image.save(surface, path)
+    except (OSError, pygame.error):
+        # a read-only install still works, it just builds or scales again next time
+        pass
+
+
+def _newer(path, than):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(than)
+
+
+def _load_atlas():
+    if os.path.exists(ATLAS):
+        return pygame.image.load(ATLAS)
+    return build_atlas()
+
+
+def scaled_atlas(square_size):
+    """The atlas with every piece scaled for squares of square_size pixels, from the cache if it is there."""
+    path = os.path.join(CACHE, f"pieces_{square_size}.png")
+    if os.path.exists(ATLAS) and _newer(path, ATLAS):
+        return pygame.image.load(path)
+    atlas = _load_atlas()
+    side = max(1, round(square_size * PIECE_SCALE))
+    scaled = pygame.transform.scale(atlas, (side * len(PIECE_CODES), side))
+    _save(scaled, path)
+    return scaled
+
+
+def piece_images(square_size):
+    """Returns {piece code: image} for squares of square_size pixels, loading them the first time they are asked for."""
+    images = _images.get(square_size)
+    if images is None:
+        atlas = scaled_atlas(square_size)
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        side = atlas.get_height()
+        images = {code: atlas.subsurface((index * side, 0, side, side)) for index, code in enumerate(PIECE_CODES)}
+        _images[square_size] = images
+    return images
+
 
-WIDTH = 60
-HEIGHT = 60
-
-B_PAWN = pygame.transform.scale(pygame.image.load('assets/b_pawn_2x_ns.png'), (WIDTH, HEIGHT))
-B_ROOK = pygame.transform.scale(pygame.image.load('assets/b_rook_2x_ns.png'), (WIDTH, HEIGHT))
-B_KNIGHT = pygame.transform.scale(pygame.image.load('assets/b_knight_2x_ns.png'), (WIDTH, HEIGHT))
-B_BISHOP = pygame.transform.scale(pygame.image.load('assets/b_bishop_2x_ns.png'), (WIDTH, HEIGHT))
-B_QUEEN = pygame.transform.scale(pygame.image.load('assets/b_queen_2x_ns.png'), (WIDTH, HEIGHT))
-B_KING = pygame.transform.scale(pygame.image.load('assets/b_king_2x_ns.png'), (WIDTH, HEIGHT))
-
-W_PAWN = pygame.transform.scale(pygame.image.load('assets/w_pawn_2x_ns.png'), (WIDTH, HEIGHT))
-W_ROOK = pygame.transform.scale(pygame.image.load('assets/w_rook_2x_ns.png'), (WIDTH, HEIGHT))
-W_KNIGHT = pygame.transform.scale(pygame.image.load('assets/w_knight_2x_ns.png'), (WIDTH, HEIGHT))
-W_BISHOP = pygame.transform.scale(pygame.image.load('assets/w_bishop_2x_ns.png'), (WIDTH, HEIGHT))
-W_QUEEN = pygame.transform.scale(pygame.image.load('assets/w_queen_2x_ns.png'), (WIDTH, HEIGHT))
-W_KING = pygame.transform.scale(pygame.image.load('assets/w_king_2x_ns.png'), (WIDTH, HEIGHT))
\ No newline at end of file
+def clear():
+    """Forgets the images loaded so far, e.g. once a size is no longer shown. The files on disk are kept."""
+    _images.clear()
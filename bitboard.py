@@ -0,0 +1,170 @@
+"""
+This file holds the precomputed attack tables used to generate moves from 64-bit bitboards.
+Squares are numbered rank * 8 + file, the same way Board.board is laid out,
+so square 0 is the top left corner (a8) and square 63 is the bottom right corner (h1).
+"""
+from constants import RANKS, FILES, WHITE, BLACK
+
+
+def square(rank, file):
+    return rank * FILES + file
+
+
+def rank_file(sq):
+    return sq >> 3, sq & 7
+
+
+def lowest_square(bb):
+    """Returns the index of the lowest set bit of a bitboard."""
+    return (bb & -bb).bit_length() - 1
+
+
+def squares(bb):
+    """Yields the index of every set bit of a bitboard, lowest first."""
+    while bb:
+        bit = bb & -bb
+        yield bit.bit_length() - 1
+        bb ^= bit
+
+
+def _on_board(rank, file):
+    return 0 <= rank < RANKS and 0 <= file < FILES
+
+
+def _leaper_table(offsets):
+    """Builds a table of the squares a piece that jumps by fixed offsets attacks from every square."""
+    table = []
+    for sq in range(RANKS * FILES):
+        rank, file = rank_file(sq)
+        attacks = 0
+        for rank_offset, file_offset in offsets:
+            if _on_board(rank + rank_offset, file + file_offset):
+                attacks |= 1 << square(rank + rank_offset, file + file_offset)
+        table.append(attacks)
+    return table
+
+
+def _ray_table(rank_offset, file_offset):
+    """Builds a table of every square in one direction from every square, up to the edge of the board."""
+    table = []
+    for sq in range(RANKS * FILES):
+        rank, file = rank_file(sq)
+        ray = 0
+        rank += rank_offset
+        file += file_offset
+        while _on_board(rank, file):
+            ray |= 1 << square(rank, file)
+            rank += rank_offset
+            file += file_offset
+        table.append(ray)
+    return table
+
+
+FILE_A = sum(1 << square(rank, 0) for rank in range(RANKS))
+FILE_H = FILE_A << (FILES - 1)
+RANK_MASKS = [0xFF << (FILES * rank) for rank in range(RANKS)]
+PROMOTION_PIECES = ("queen", "rook", "bishop", "knight")
+# a8 is a light square, so the dark squares are the ones whose rank and file add up to an odd number
+DARK_SQUARES = sum(1 << square(rank, file) for rank in range(RANKS) for file in range(FILES) if (rank + file) % 2)
+
+KNIGHT_ATTACKS = _leaper_table(((-1, -2), (-1, 2), (-2, -1), (-2, 1), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _leaper_table(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# The squares a pawn of each colour attacks. White pawns move up the board (towards rank 0), black pawns down.
+PAWN_ATTACKS = {
+    WHITE: _leaper_table(((-1, -1), (-1, 1))),
+    BLACK: _leaper_table(((1, -1), (1, 1))),
+}
+
+# Rays are split by whether they run towards higher or lower square numbers,
+# as that decides whether the nearest blocker is the lowest or the highest set bit.
+UP = _ray_table(-1, 0)
+DOWN = _ray_table(1, 0)
+LEFT = _ray_table(0, -1)
+RIGHT = _ray_table(0, 1)
+UP_LEFT = _ray_table(-1, -1)
+UP_RIGHT = _ray_table(-1, 1)
+DOWN_LEFT = _ray_table(1, -1)
+DOWN_RIGHT = _ray_table(1, 1)
+
+ROOK_RAYS = ((DOWN, True), (RIGHT, True), (UP, False), (LEFT, False))
+BISHOP_RAYS = ((DOWN_LEFT, True), (DOWN_RIGHT, True), (UP_LEFT, False), (UP_RIGHT, False))
+
+
+def _line_tables():
+    """Builds BETWEEN[a][b], the squares strictly between two squares on a rank, file or diagonal,
+    and LINE[a][b], the whole line through both of them, edge to edge. Both are 0 for squares not in line.
+    """
+    between = [[0] * (RANKS * FILES) for _ in range(RANKS * FILES)]
+    line = [[0] * (RANKS * FILES) for _ in range(RANKS * FILES)]
+    for forwards, backwards in ((UP, DOWN), (LEFT, RIGHT), (UP_LEFT, DOWN_RIGHT), (UP_RIGHT, DOWN_LEFT)):
+        for a in range(RANKS * FILES):
+            whole_line = forwards[a] | backwards[a] | 1 << a
+            for table in (forwards, backwards):
+                ray = table[a]
+                while ray:
+                    b = (ray & -ray).bit_length() - 1
+                    ray ^= 1 << b
+                    between[a][b] = table[a] ^ table[b] ^ 1 << b
+                    line[a][b] = whole_line
+    return between, line
+
+
+BETWEEN, LINE = _line_tables()
+
+
+def _slide(sq, occupied, rays):
+    """Walks each ray from a square, stopping at (and including) the first occupied square."""
+    attacks = 0
+    for table, increasing in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if increasing:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def _relevant_mask(sq, rays):
+    """The squares whose occupancy can change a slider's attacks. The last square of each ray never blocks anything."""
+    mask = 0
+    for table, increasing in rays:
+        ray = table[sq]
+        if ray:
+            edge = (ray & -ray).bit_length() - 1 if not increasing else ray.bit_length() - 1
+            mask |= ray & ~(1 << edge)
+    return mask
+
+
+ROOK_MASKS = [_relevant_mask(sq, ROOK_RAYS) for sq in range(RANKS * FILES)]
+BISHOP_MASKS = [_relevant_mask(sq, BISHOP_RAYS) for sq in range(RANKS * FILES)]
+
+# Sliding attacks are looked up by (square, relevant occupancy), the same idea as magic bitboards,
+# with a dict standing in for the magic multiply. The tables fill in as positions are met instead of at import.
+_rook_cache = [{} for _ in range(RANKS * FILES)]
+_bishop_cache = [{} for _ in range(RANKS * FILES)]
+
+
+def rook_attacks(sq, occupied):
+    occupied &= ROOK_MASKS[sq]
+    cache = _rook_cache[sq]
+    attacks = cache.get(occupied)
+    if attacks is None:
+        attacks = cache[occupied] = _slide(sq, occupied, ROOK_RAYS)
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    occupied &= BISHOP_MASKS[sq]
+    cache = _bishop_cache[sq]
+    attacks = cache.get(occupied)
+    if attacks is None:
+        attacks = cache[occupied] = _slide(sq, occupied, BISHOP_RAYS)
+    return attacks
+
+
+def queen_attacks(sq, occupied):
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
@@ -1,570 +1,834 @@
 """
 This file handles most of the code relating to the board, such as the visual set up and how the pieces move across it
 """
-from constants import LIGHT_SQUARES, RANKS, FILES, SQUARE_SIZE, DARK_SQUARES, BLACK, WHITE, BLUE
-from asset_imgs import *
-from piece import Piece
+from collections import OrderedDict
+from constants import RANKS, FILES, BLACK, WHITE
+from piece import Piece, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, KINDS_BY_NAME, CODE_COUNT, piece_code
+from bitboard import square, rank_file, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, FILE_A, FILE_H, RANK_MASKS, \
+    PROMOTION_PIECES, BETWEEN, LINE, DARK_SQUARES, rook_attacks, bishop_attacks, queen_attacks
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, hash_board
+
+# Castling rights are kept as four bits. A move to or from a king or rook starting square clears the matching bits,
+# which covers the king or rook moving as well as a rook being captured at home.
+WHITE_SHORT = 1
+WHITE_LONG = 2
+BLACK_SHORT = 4
+BLACK_LONG = 8
+ALL_CASTLING = WHITE_SHORT | WHITE_LONG | BLACK_SHORT | BLACK_LONG
+CASTLING_MASKS = [ALL_CASTLING] * (RANKS * FILES)
+CASTLING_MASKS[square(0, 0)] = ALL_CASTLING & ~BLACK_LONG
+CASTLING_MASKS[square(0, 4)] = ALL_CASTLING & ~(BLACK_SHORT | BLACK_LONG)
+CASTLING_MASKS[square(0, 7)] = ALL_CASTLING & ~BLACK_SHORT
+CASTLING_MASKS[square(7, 0)] = ALL_CASTLING & ~WHITE_LONG
+CASTLING_MASKS[square(7, 4)] = ALL_CASTLING & ~(WHITE_SHORT | WHITE_LONG)
+CASTLING_MASKS[square(7, 7)] = ALL_CASTLING & ~WHITE_SHORT
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# how many positions' legal moves Board.legal_moves keeps
+MOVE_CACHE_SIZE = 4096
+
+
+def move_name(move):
+    """Names a move by its start and end squares in coordinate notation, e.g. e2e4 or e7e8q."""
+    start, end, tag, promotion = move
+    name = square_name(start) + square_name(end)
+    if promotion:
+        name += "n" if promotion == "knight" else promotion[0]
+    return name
+
+
+def square_name(sq):
+    rank, file = rank_file(sq)
+    return "abcdefgh"[file] + str(8 - rank)
+
+
+class LegalMoveCache:
+    """Remembers the legal moves of recently seen positions by their Zobrist key, dropping the least recently
+    used position once it is full. A move changes the key, so an entry never has to be thrown away when a move is
+    made or taken back: the position it describes is simply looked up again if the game comes back to it.
+    """
+
+    def __init__(self, size=MOVE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        moves = self.entries.get(key)
+        if moves is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return moves
+
+    def put(self, key, moves):
+        self.entries[key] = moves
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def en_passant_key(bitboards, turn, last_move):
+    """The en passant part of the key. It only counts when a pawn of the side to move is beside the pawn that
+    has just moved two spaces, so positions that only differ by an en passant capture nobody can make share a key.
+    """
+    if last_move is None:
+        return 0
+    rank, file = last_move
+    beside = 0
+    if file > 0:
+        beside |= 1 << square(rank, file - 1)
+    if file < FILES - 1:
+        beside |= 1 << square(rank, file + 1)
+    if beside & bitboards[piece_code(turn, PAWN)]:
+        return EN_PASSANT_KEYS[file]
+    return 0
+
+
+FEN_PIECES = {"p": PAWN, "n": KNIGHT, "b": BISHOP, "r": ROOK, "q": QUEEN, "k": KING}
+FEN_LETTERS = {kind: char for char, kind in FEN_PIECES.items()}
+FEN_CASTLING = {"K": WHITE_SHORT, "Q": WHITE_LONG, "k": BLACK_SHORT, "q": BLACK_LONG}
+# the (square, piece code) of the king and the rook each castling right needs at home
+CASTLING_HOMES = {
+    WHITE_SHORT: ((square(7, 4), piece_code(WHITE, KING)), (square(7, 7), piece_code(WHITE, ROOK))),
+    WHITE_LONG: ((square(7, 4), piece_code(WHITE, KING)), (square(7, 0), piece_code(WHITE, ROOK))),
+    BLACK_SHORT: ((square(0, 4), piece_code(BLACK, KING)), (square(0, 7), piece_code(BLACK, ROOK))),
+    BLACK_LONG: ((square(0, 4), piece_code(BLACK, KING)), (square(0, 0), piece_code(BLACK, ROOK))),
+}
 
 
 class Board:
-    black_piece_list = ["b_rook", "b_knight", "b_bishop", "b_queen", "b_king", "b_bishop", "b_knight", "b_rook"]
-    white_piece_list = ["w_rook", "w_knight", "w_bishop", "w_queen", "w_king", "w_bishop", "w_knight", "w_rook"]
+    # shared by every board in the process, as the moves of a position don't depend on which board it is on.
+    # As a class attribute it also stays out of a pickled board
+    move_cache = LegalMoveCache()
+    back_rank = (ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK)
 
     def __init__(self):
         self.board = []
+        # One bitboard per piece code plus one per colour, kept in step with self.board by _place and _lift
+        self.bitboards = [0] * CODE_COUNT
+        self.occupied = [0, 0]
+        self.turn = WHITE
+        self.castling_rights = ALL_CASTLING
+        # the square of a pawn that has just moved two spaces, the same as Game.lastMove
+        self.last_move = None
+        # moves since the last capture or pawn move, for the fifty-move rule, and the move number, as in FEN
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # the undo stack, one record per move made with make_move
+        self.history = []
+        # the Zobrist key of the position, updated with every change to the board
+        self.key = 0
         self.create_board()
-        self.function_mapping = {
-            "pawn": self.pawn,
-            "rook": self.rook,
-            "knight": self.knight,
-            "bishop": self.bishop,
-            "queen": self.queen,
-            "king": self.king,
-        }
+        self.key = hash_board(self)
+        # indexed by the kind of piece, PAWN to KING
+        self.function_mapping = [None, self.pawn, self.knight, self.bishop, self.rook, self.queen, self.king]
 
     def create_board(self):
         """Creates the embedded array from the starting position of a chess game.
         Add pieces where applicable, else adds a 0 for empty squares
         """
-        for rank in range(RANKS):
-            self.board.append([])
-            for file in range(FILES):
-                if rank == 0:
-                    piece_type = self.black_piece_list[file]
-                    self.board[rank].append(Piece(rank, file, BLACK, piece_type))
-                elif rank == 1:
-                    self.board[rank].append(Piece(rank, file, BLACK, "b_pawn"))
-                elif rank == 6:
-                    self.board[rank].append(Piece(rank, file, WHITE, "w_pawn"))
-                elif rank == 7:
-                    piece_type = self.white_piece_list[file]
-                    self.board[rank].append(Piece(rank, file, WHITE, piece_type))
-                else:
-                    self.board[rank].append(0)
-
-    def _draw_squares(self, win, highlight_square):
-        """Draws the visual dark and light squares for the board.
-        If a square is currently selected by a player, colour it blue.
+        self.board = [[0] * FILES for _ in range(RANKS)]
+        for file in range(FILES):
+            self._place(Piece(0, file, piece_code(BLACK, self.back_rank[file])), 0, file)
+            self._place(Piece(1, file, piece_code(BLACK, PAWN)), 1, file)
+            self._place(Piece(6, file, piece_code(WHITE, PAWN)), 6, file)
+            self._place(Piece(7, file, piece_code(WHITE, self.back_rank[file])), 7, file)
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Creates a board from a FEN string, e.g. to start tests or workers from any position."""
+        board = cls()
+        board.set_fen(fen)
+        return board
+
+    def set_fen(self, fen):
+        """Replaces the position with the one described by a FEN string.
+        FEN lists rank 8 first, which is rank 0 of the embedded array. The en passant target square is turned back
+        into the square of the pawn that moved two spaces, which is what last_move holds.
+        The move clocks may be left off the end, in which case they start at 0 and 1.
+        Raises ValueError, leaving the position as it was, if the FEN is malformed: it needs eight ranks of eight
+        squares, one king of each colour and an en passant square, if any, behind a pawn that could have just moved
+        two spaces. Castling rights whose king or rook isn't on its starting square are dropped.
+        """
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"{fen!r} has fewer than four fields")
+        placement, turn, castling, en_passant = fields[:4]
+        rows = placement.split("/")
+        if len(rows) != RANKS:
+            raise ValueError(f"{placement!r} doesn't have {RANKS} ranks")
+        pieces = []
+        for rank, row in enumerate(rows):
+            file = 0
+            for char in row:
+                if char.isdigit():
+                    file += int(char)
+                    continue
+                if char.lower() not in FEN_PIECES:
+                    raise ValueError(f"{char!r} is not a piece")
+                if file < FILES:
+                    pieces.append((square(rank, file), piece_code(WHITE if char.isupper() else BLACK, FEN_PIECES[char.lower()])))
+                file += 1
+            if file != FILES:
+                raise ValueError(f"rank {RANKS - rank} of {placement!r} has {file} squares, not {FILES}")
+        for colour in (WHITE, BLACK):
+            kings = sum(1 for _, code in pieces if code == piece_code(colour, KING))
+            if kings != 1:
+                raise ValueError(f"{placement!r} has {kings} {'white' if colour == WHITE else 'black'} kings")
+        if turn not in ("w", "b"):
+            raise ValueError(f"{turn!r} is not a side to move")
+        turn = WHITE if turn == "w" else BLACK
+        if castling != "-" and any(char not in FEN_CASTLING for char in castling):
+            raise ValueError(f"{castling!r} is not a set of castling rights")
+        placed = dict(pieces)
+        castling_rights = 0
+        for char in castling:
+            right = FEN_CASTLING.get(char, 0)
+            # a right is only kept while its king and rook are still on their starting squares
+            if right and all(placed.get(sq) == code for sq, code in CASTLING_HOMES[right]):
+                castling_rights |= right
+        last_move = None
+        if en_passant != "-":
+            # the target square is behind a pawn of the side that has just moved, on rank 3 or 6
+            if len(en_passant) != 2 or en_passant[0] not in "abcdefgh" or en_passant[1] != ("6" if turn == WHITE else "3"):
+                raise ValueError(f"{en_passant!r} is not an en passant square with {'white' if turn == WHITE else 'black'} to move")
+            target_rank = RANKS - int(en_passant[1])
+            last_move = (target_rank - 1 if turn == BLACK else target_rank + 1, ord(en_passant[0]) - ord("a"))
+            if placed.get(square(*last_move)) != piece_code(BLACK if turn == WHITE else WHITE, PAWN):
+                raise ValueError(f"there is no pawn in front of the en passant square {en_passant}")
+        halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        self.set_position(pieces, turn, castling_rights, last_move, halfmove_clock, fullmove_number)
+
+    def set_position(self, pieces, turn, castling_rights, last_move, halfmove_clock=0, fullmove_number=1):
+        """Replaces the position with the given (square, piece code) pieces and state, and clears the undo stack.
+        Pawns off their starting rank and kings and rooks without castling rights are marked as having moved,
+        so get_valid_moves and the castling rules treat them the same as in the game the position came from.
         """
-        win.fill(DARK_SQUARES)
-        for rank in range(RANKS):
-            for file in range(rank % 2, RANKS, 2):
-                pygame.draw.rect(win, LIGHT_SQUARES, (rank * SQUARE_SIZE, file * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-        if highlight_square:
-            pygame.draw.rect(win, BLUE, [highlight_square.x - (SQUARE_SIZE/2), highlight_square.y - (SQUARE_SIZE/2), SQUARE_SIZE, SQUARE_SIZE])
+        self.board = [[0] * FILES for _ in range(RANKS)]
+        self.bitboards = [0] * CODE_COUNT
+        self.occupied = [0, 0]
+        self.history = []
+        self.key = 0
+        for sq, code in pieces:
+            rank, file = rank_file(sq)
+            piece = Piece(rank, file, code)
+            colour = piece.colour
+            if piece.kind == PAWN:
+                piece.has_moved = rank != (6 if colour == WHITE else 1)
+            elif piece.kind == KING:
+                piece.has_moved = not castling_rights & (WHITE_SHORT | WHITE_LONG if colour == WHITE else BLACK_SHORT | BLACK_LONG)
+            elif piece.kind == ROOK:
+                piece.has_moved = not castling_rights & ~CASTLING_MASKS[sq]
+            else:
+                piece.has_moved = True
+            self._place(piece, rank, file)
+        self.turn = turn
+        self.castling_rights = castling_rights
+        self.last_move = last_move
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.key = hash_board(self)
+
+    def to_fen(self):
+        """Describes the position as a FEN string, the reverse of set_fen."""
+        rows = []
+        for row in self.board:
+            text = ""
+            empty = 0
+            for piece in row:
+                if piece == 0:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[piece.kind]
+                text += letter.upper() if piece.colour == WHITE else letter
+            rows.append(text + (str(empty) if empty else ""))
+        castling = "".join(char for char, right in FEN_CASTLING.items() if self.castling_rights & right) or "-"
+        en_passant = "-"
+        if self.last_move is not None:
+            rank, file = self.last_move
+            target_rank = rank + 1 if self.turn == BLACK else rank - 1
+            en_passant = "abcdefgh"[file] + str(RANKS - target_rank)
+        return f"{'/'.join(rows)} {'w' if self.turn == WHITE else 'b'} {castling} {en_passant} " \
+               f"{self.halfmove_clock} {self.fullmove_number}"
+
+    def snapshot(self):
+        """Returns the position as an immutable position.Position, which later moves on this board don't change."""
+        from position import Position
+        return Position.from_board(self)
 
     def draw_pieces(self, win, highlight_square):
-        """Draws or blits the piece images onto the squares of the board."""
-        self._draw_squares(win, highlight_square)
-        for rank in range(RANKS):
-            for file in range(FILES):
-                piece = self.board[rank][file]
-                if piece != 0:
-                    piece.draw(win)
+        """Draws the board and pieces onto the window.
+        pygame and the piece images are only imported here, the first time a board is actually drawn.
+        """
+        import render
+        render.draw_pieces(win, self, highlight_square)
+
+    def _place(self, piece, rank, file):
+        """Puts a piece on a square, keeping the bitboards in step with the embedded array."""
+        sq = square(rank, file)
+        self.board[rank][file] = piece
+        self.bitboards[piece.code] |= 1 << sq
+        self.occupied[piece.colour] |= 1 << sq
+        self.key ^= PIECE_KEYS[piece.code][sq]
+
+    def _lift(self, rank, file):
+        """Takes whatever is on a square off the board and returns it, or 0 if the square was empty."""
+        piece = self.board[rank][file]
+        if piece != 0:
+            sq = square(rank, file)
+            self.board[rank][file] = 0
+            self.bitboards[piece.code] ^= 1 << sq
+            self.occupied[piece.colour] ^= 1 << sq
+            self.key ^= PIECE_KEYS[piece.code][sq]
+        return piece
+
+    def _en_passant_key(self):
+        return en_passant_key(self.bitboards, self.turn, self.last_move)
+
+    def make_move(self, move):
+        """Plays a (start, end, tag, promotion) move, with squares numbered as in bitboard.py, and pushes an undo record.
+        No legality test is made here. The record holds everything the move overwrites, so unmake_move can put
+        the board back exactly without copying it.
+        """
+        start, end, tag, promotion = move
+        rank, file = end >> 3, end & 7
+        key = self.key
+        # the pieces update the key as they are lifted and placed, the rest of the position is swapped here
+        self.key ^= en_passant_key(self.bitboards, self.turn, self.last_move) ^ CASTLING_KEYS[self.castling_rights] ^ SIDE_KEY
+        piece = self._lift(start >> 3, start & 7)
+        if tag == "en passant":
+            captured = self._lift(start >> 3, file)
+        else:
+            captured = self._lift(rank, file)
+        self.history.append((move, captured, piece.has_moved, self.castling_rights, self.last_move, key, self.halfmove_clock))
+        if captured != 0 or piece.code & 7 == PAWN:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.turn == BLACK:
+            self.fullmove_number += 1
+        if promotion:
+            piece.code = piece.code & 8 | KINDS_BY_NAME[promotion]
+        self._place(piece, rank, file)
+        piece.move(rank, file)
+        if tag == "shortCastle":
+            rook = self._lift(rank, file + 1)
+            self._place(rook, rank, file - 1)
+            rook.move(rank, file - 1)
+        elif tag == "longCastle":
+            rook = self._lift(rank, file - 2)
+            self._place(rook, rank, file + 1)
+            rook.move(rank, file + 1)
+        self.castling_rights &= CASTLING_MASKS[start] & CASTLING_MASKS[end]
+        self.last_move = (rank, file) if tag == "pawnTwoSpaces" else None
+        self.turn = BLACK if self.turn == WHITE else WHITE
+        self.key ^= CASTLING_KEYS[self.castling_rights] ^ en_passant_key(self.bitboards, self.turn, self.last_move)
+
+    def unmake_move(self):
+        """Takes back the last move made with make_move and returns it."""
+        move, captured, has_moved, castling_rights, last_move, key, halfmove_clock = self.history.pop()
+        start, end, tag, promotion = move
+        start_rank, start_file = start >> 3, start & 7
+        rank, file = end >> 3, end & 7
+        piece = self._lift(rank, file)
+        if promotion:
+            piece.code = piece.code & 8 | PAWN
+        self._place(piece, start_rank, start_file)
+        piece.move(start_rank, start_file)
+        piece.has_moved = has_moved
+        if captured != 0:
+            # a captured piece was never moved, so it still knows its own square (behind the pawn for en passant)
+            self._place(captured, captured.rank, captured.file)
+        if tag == "shortCastle":
+            rook = self._lift(rank, file - 1)
+            self._place(rook, rank, file + 1)
+            rook.move(rank, file + 1)
+            rook.has_moved = False
+        elif tag == "longCastle":
+            rook = self._lift(rank, file + 1)
+            self._place(rook, rank, file - 2)
+            rook.move(rank, file - 2)
+            rook.has_moved = False
+        self.castling_rights = castling_rights
+        self.last_move = last_move
+        self.turn = BLACK if self.turn == WHITE else WHITE
+        if self.turn == BLACK:
+            self.fullmove_number -= 1
+        self.halfmove_clock = halfmove_clock
+        self.key = key
+        return move
+
+    def is_legal(self, move):
+        """Tests a move from generate_moves by the same rules as Game._move: castling may not start in or pass through
+        check, and no move may leave the mover's own king in check.
+        """
+        start, end, tag, promotion = move
+        enemy = WHITE if self.turn == BLACK else BLACK
+        if tag == "shortCastle" or tag == "longCastle":
+            if self.isCheck(enemy, self.last_move) or self._attacked((start + end) // 2, enemy):
+                return False
+        self.make_move(move)
+        legal = not self.isCheck(enemy, self.last_move)
+        self.unmake_move()
+        return legal
+
+    def legal_moves(self):
+        """Returns every legal move for the side to move as (start, end, tag, promotion) tuples.
+        They are worked out once per position and kept in move_cache, and a new list is returned each time,
+        so the caller may change it.
+        """
+        moves = self.move_cache.get(self.key)
+        if moves is None:
+            moves = tuple(self.generate_legal_moves())
+            self.move_cache.put(self.key, moves)
+        return list(moves)
+
+    def generate_legal_moves(self):
+        """Returns a list of only the legal moves for the side to move, see _legal_moves."""
+        return list(self._legal_moves())
+
+    def has_legal_move(self):
+        """True if the side to move has any legal move. It stops at the first one found, so it is cheaper than
+        generating them all unless they are already in move_cache.
+        """
+        moves = self.move_cache.entries.get(self.key)
+        if moves is not None:
+            return bool(moves)
+        # most of the time the king has a safe square to step to, which is found without generating anything
+        colour = self.turn
+        enemy = WHITE if colour == BLACK else BLACK
+        king = self.bitboards[piece_code(colour, KING)]
+        if king:
+            king_sq = king.bit_length() - 1
+            without_king = (self.occupied[colour] | self.occupied[enemy]) ^ king
+            targets = KING_ATTACKS[king_sq] & ~self.occupied[colour]
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                if not self._attackers(bit.bit_length() - 1, enemy, without_king):
+                    return True
+        for _ in self._legal_moves():
+            return True
+        return False
+
+    def repetition_count(self):
+        """How many times the current position has occurred, counting this time, going back through the undo stack.
+        Only positions since the last capture or pawn move can repeat, which the halfmove clock counts,
+        and only every other one has the same side to move. Positions before the board was set up aren't known.
+        """
+        count = 1
+        key = self.key
+        history = self.history
+        length = len(history)
+        for distance in range(2, min(self.halfmove_clock, length) + 1, 2):
+            # each record holds the key from before its move
+            if history[length - distance][5] == key:
+                count += 1
+        return count
+
+    def insufficient_material(self):
+        """True if neither side could ever checkmate: no pawns, rooks or queens, and at most one knight or bishop,
+        or only bishops that all stand on squares of the same colour.
+        """
+        bitboards = self.bitboards
+        if bitboards[PAWN] | bitboards[PAWN | 8] | bitboards[ROOK] | bitboards[ROOK | 8] \
+                | bitboards[QUEEN] | bitboards[QUEEN | 8]:
+            return False
+        knights = bitboards[KNIGHT] | bitboards[KNIGHT | 8]
+        bishops = bitboards[BISHOP] | bitboards[BISHOP | 8]
+        minors = knights | bishops
+        if not minors & (minors - 1):
+            return True
+        return not knights and (not bishops & DARK_SQUARES or not bishops & ~DARK_SQUARES)
+
+    def outcome(self, tablebases=None):
+        """Returns (result, reason) if the game is over in this position, or None.
+        The result is "1-0", "0-1" or "1/2-1/2", and the reason is "checkmate", "stalemate", "insufficient material",
+        "fifty-move rule" or "threefold repetition". The draws by rule are treated as claimed straight away.
+        Given a tablebase.Tablebases, a position they cover is also over, as a "tablebase win" or "tablebase draw".
+        """
+        if not self.has_legal_move():
+            if self.isCheck(WHITE if self.turn == BLACK else BLACK, self.last_move):
+                return ("0-1" if self.turn == WHITE else "1-0"), "checkmate"
+            return "1/2-1/2", "stalemate"
+        if self.insufficient_material():
+            return "1/2-1/2", "insufficient material"
+        if self.halfmove_clock >= 100:
+            return "1/2-1/2", "fifty-move rule"
+        if self.halfmove_clock >= 8 and self.repetition_count() >= 3:
+            return "1/2-1/2", "threefold repetition"
+        if tablebases is not None:
+            return tablebases.adjudicate(self)
+        return None
+
+    def _legal_moves(self):
+        """Yields only the legal moves for the side to move, without making any of them to test for check.
+        The pieces giving check and the pieces pinned to the king are found once, and then:
+        the king may only step to squares no enemy piece attacks once the king has left its square,
+        in double check nothing else may move, in single check the other pieces may only take the checking piece
+        or block its line, and a pinned piece may only move along the line of its pin.
+        En passant can uncover a check along the rank both pawns leave, so it is still tested by making it.
+        """
+        colour = self.turn
+        enemy = WHITE if colour == BLACK else BLACK
+        side, enemy_side = colour << 3, enemy << 3
+        bitboards = self.bitboards
+        king = bitboards[KING | side]
+        moves = self.generate_moves(colour, self.last_move)
+        if not king:
+            yield from (move for move in moves if self.is_legal(move))
+            return
+        king_sq = king.bit_length() - 1
+        own = self.occupied[colour]
+        occupied = own | self.occupied[enemy]
+        checkers = self._attackers(king_sq, enemy, occupied)
+
+        # a piece is pinned if it is the only piece between the king and an enemy slider on the same line
+        pins = {}
+        enemy_queens = bitboards[QUEEN | enemy_side]
+        snipers = rook_attacks(king_sq, 0) & (bitboards[ROOK | enemy_side] | enemy_queens) \
+            | bishop_attacks(king_sq, 0) & (bitboards[BISHOP | enemy_side] | enemy_queens)
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            sniper = bit.bit_length() - 1
+            blockers = BETWEEN[king_sq][sniper] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pins[blockers.bit_length() - 1] = LINE[king_sq][sniper]
+
+        if checkers:
+            checker = checkers.bit_length() - 1
+            targets = checkers | BETWEEN[king_sq][checker] if not checkers & (checkers - 1) else 0
+        else:
+            targets = ~0
+        without_king = occupied ^ king
+        for move in moves:
+            start, end, tag, promotion = move
+            if start == king_sq:
+                if tag == "shortCastle" or tag == "longCastle":
+                    if not checkers and not self._attacked((start + end) // 2, enemy) and not self._attacked(end, enemy):
+                        yield move
+                elif not self._attackers(end, enemy, without_king):
+                    yield move
+            elif tag == "en passant":
+                if self.is_legal(move):
+                    yield move
+            elif targets >> end & 1 and (start not in pins or pins[start] >> end & 1):
+                yield move
+
+    def _try_move(self, move):
+        """Makes a move and keeps it only if it does not leave the side that moved in check."""
+        colour = self.turn
+        self.make_move(move)
+        if self.isCheck(WHITE if colour == BLACK else BLACK, self.last_move):
+            self.unmake_move()
+            return False
+        return True
 
     def move(self, piece, rank, file, last_move):
         """Attempts to move a piece to a new location.
         This will only allow the move to occur if the resulting position won't leave the side that moved in check.
-        It saves the original position of the piece and if it will result in check, it moves it back and returns False,
-        so that the player may make another choice.
+        If it would, the move is taken back and it returns False, so that the player may make another choice.
         """
-        start_rank = piece.rank
-        start_file = piece.file
-        self.board[piece.rank][piece.file], self.board[rank][file] = self.board[rank][file], self.board[piece.rank][piece.file]
-        if not self.isCheck(WHITE if piece.colour == BLACK else BLACK, last_move):
-            piece.move(rank, file)
-            return True
+        if piece.kind == PAWN and abs(rank - piece.rank) == 2:
+            tag = "pawnTwoSpaces"
         else:
-            self.board[start_rank][start_file], self.board[rank][file] = piece, 0
-            return False
+            tag = 0
+        return self._try_move((square(piece.rank, piece.file), square(rank, file), tag, None))
 
     def capture_piece(self, piece, rank, file, last_move):
         """If a capture is to occur, this replaces the selected square with the capturing piece."""
-        start_rank = piece.rank
-        start_file = piece.file
-        captured_piece = self.get_piece(rank, file)
-        self.board[piece.rank][piece.file], self.board[rank][file] = 0, self.board[piece.rank][piece.file]
-        if not self.isCheck(WHITE if piece.colour == BLACK else BLACK, last_move):
-            piece.move(rank, file)
-            return True
-        else:
-            self.board[start_rank][start_file], self.board[rank][file] = piece, captured_piece
-            return False
+        return self._try_move((square(piece.rank, piece.file), square(rank, file), 0, None))
 
     def get_piece(self, rank, file):
         return self.board[rank][file]
 
     def get_valid_moves(self, piece, last_move):
-        """Traverses the possible movement of a selected piece and returns a dict of possible valid moves"""
+        """Looks up the squares a selected piece can reach in the attack tables and returns a dict of possible valid moves"""
+        kind = piece.kind
+        return self.function_mapping[kind](kind, piece.colour, piece.has_moved, piece.rank, piece.file, last_move)
+
+    def _to_moves(self, targets):
+        """Turns a bitboard of target squares into the moves dict, storing the piece on the square (or 0) for each."""
         moves = {}
-        starting_rank = piece.rank
-        starting_file = piece.file
-        colour = piece.colour
-        has_moved = piece.has_moved
-        piece_type = piece.piece_type[2:]
-        moves.update(self.function_mapping[piece_type](piece_type, colour, has_moved, starting_rank, starting_file, last_move))
+        while targets:
+            bit = targets & -targets
+            rank, file = rank_file(bit.bit_length() - 1)
+            moves[(rank, file)] = self.board[rank][file]
+            targets ^= bit
         return moves
 
     # The following code lays out how to determine a piece's valid moves.
-    # Specific code written for the pawn and knight, and some extra functions for the king.
-    def pawn(self, piece_type, colour, has_moved, starting_rank, starting_file, last_move):
+    # Knights, bishops, rooks, queens and kings look up their attacks from the tables in bitboard.py,
+    # and the pawn and the king's castling have some extra rules of their own.
+    def pawn(self, kind, colour, has_moved, starting_rank, starting_file, last_move):
         """Determines a pawns valid moves, including en passant and whether it can move two squares forward"""
         moves = {}
-
-        # check forward moves
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
         if colour == WHITE:
-            if starting_rank - 1 > 0:
-                if self.board[starting_rank-1][starting_file] == 0:
-                    moves[(starting_rank-1, starting_file)] = 0
-                    if not has_moved and self.board[starting_rank-2][starting_file] == 0:
-                        moves[(starting_rank - 2, starting_file)] = "pawnTwoSpaces"
-
-        elif colour == BLACK:
-            if starting_rank + 1 < 8:
-                if self.board[starting_rank + 1][starting_file] == 0:
-                    moves[(starting_rank + 1, starting_file)] = 0
-                    if not has_moved and self.board[starting_rank + 2][starting_file] == 0:
-                        moves[(starting_rank + 2, starting_file)] = "pawnTwoSpaces"
+            enemy = BLACK
+            direction = -1
+            last_rank = 0
+        else:
+            enemy = WHITE
+            direction = 1
+            last_rank = 7
+
+        # check forward moves, including promotion
+        rank = starting_rank + direction
+        if 0 <= rank < RANKS and not occupied >> square(rank, starting_file) & 1:
+            if rank == last_rank:
+                moves[(rank, starting_file)] = "promotion"
+            else:
+                moves[(rank, starting_file)] = 0
+                if not has_moved and not occupied >> square(rank + direction, starting_file) & 1:
+                    moves[(rank + direction, starting_file)] = "pawnTwoSpaces"
 
         # check if pawn can make a capture
-        if colour == WHITE:
-            if starting_file > 0 and starting_rank > 0:
-                left_capture = self.get_piece(starting_rank - 1, starting_file - 1)
-                if left_capture and left_capture.colour == BLACK:
-                    if starting_rank - 1 == 0:
-                        moves[(starting_rank-1, starting_file-1)] = "promotion"
-                    else:
-                        moves[(starting_rank - 1, starting_file - 1)] = 0
-            if starting_file < 7 and starting_rank > 0:
-                right_capture = self.get_piece(starting_rank - 1, starting_file + 1)
-                if right_capture and right_capture.colour == BLACK:
-                    if starting_rank - 1 == 0:
-                        moves[(starting_rank - 1, starting_file+1)] = "promotion"
-                    else:
-                        moves[(starting_rank - 1, starting_file + 1)] = 0
-
-        elif colour == BLACK:
-            if starting_file > 0 and starting_rank < 7:
-                left_capture = self.get_piece(starting_rank + 1, starting_file - 1)
-                if left_capture and left_capture.colour == WHITE:
-                    if starting_rank + 1 == 7:
-                        moves[(starting_rank + 1, starting_file - 1)] = "promotion"
-                    else:
-                        moves[(starting_rank + 1, starting_file - 1)] = 0
-            if starting_file < 7 and starting_rank < 7:
-                right_capture = self.get_piece(starting_rank + 1, starting_file + 1)
-                if right_capture and right_capture.colour == WHITE:
-                    if starting_rank + 1 == 7:
-                        moves[(starting_rank + 1, starting_file + 1)] = "promotion"
-                    else:
-                        moves[(starting_rank + 1, starting_file + 1)] = 0
+        targets = PAWN_ATTACKS[colour][square(starting_rank, starting_file)] & self.occupied[enemy]
+        while targets:
+            bit = targets & -targets
+            moves[rank_file(bit.bit_length() - 1)] = "promotion" if rank == last_rank else 0
+            targets ^= bit
 
         # check en passant
-        if colour == WHITE:
-            if last_move == (starting_rank, starting_file-1):
-                moves[(starting_rank-1, starting_file - 1)] = "en passant"
-            elif last_move == (starting_rank, starting_file+1):
-                moves[(starting_rank-1, starting_file + 1)] = "en passant"
-        elif colour == BLACK:
-            if last_move == (starting_rank, starting_file-1):
-                moves[(starting_rank+1, starting_file - 1)] = "en passant"
-            elif last_move == (starting_rank, starting_file+1):
-                moves[(starting_rank+1, starting_file + 1)] = "en passant"
-
-        # promotion
-        if colour == WHITE:
-            if starting_rank - 1 == 0:
-                if self.board[starting_rank - 1][starting_file] == 0:
-                    moves[(starting_rank - 1, starting_file)] = "promotion"
-        else:
-            if starting_rank + 1 == 7:
-                if self.board[starting_rank + 1][starting_file] == 0:
-                    moves[(starting_rank + 1, starting_file)] = "promotion"
+        if last_move and last_move[0] == starting_rank and abs(last_move[1] - starting_file) == 1:
+            passed_pawn = self.get_piece(*last_move)
+            if passed_pawn != 0 and passed_pawn.colour == enemy and passed_pawn.kind == PAWN:
+                moves[(rank, last_move[1])] = "en passant"
         return moves
 
-    def rook(self, piece_type, colour, has_moved, starting_rank, starting_file, last_move):
-        moves = {}
-        moves.update(self._traverseUp(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDown(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseRight(piece_type, colour, starting_rank, starting_file))
-        return moves
+    def rook(self, kind, colour, has_moved, starting_rank, starting_file, last_move):
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        return self._to_moves(rook_attacks(square(starting_rank, starting_file), occupied) & ~self.occupied[colour])
 
-    def knight(self, piece_type, colour, has_moved, starting_rank, starting_file, last_move):
-        moves = {}
-        if starting_rank > 0 and starting_file > 1:
-            if self.board[starting_rank-1][starting_file-2] == 0:
-                moves[(starting_rank-1, starting_file-2)] = 0
-            elif self.get_piece(starting_rank-1, starting_file-2).colour != colour:
-                moves[(starting_rank - 1, starting_file - 2)] = self.get_piece(starting_rank-1, starting_file-2)
-        if starting_rank > 0 and starting_file < 6:
-            if self.board[starting_rank - 1][starting_file + 2] == 0:
-                moves[(starting_rank - 1, starting_file + 2)] = 0
-            elif self.get_piece(starting_rank - 1, starting_file + 2).colour != colour:
-                moves[(starting_rank - 1, starting_file + 2)] = self.get_piece(starting_rank - 1, starting_file + 2)
-        if starting_rank > 1 and starting_file > 0:
-            if self.board[starting_rank-2][starting_file-1] == 0:
-                moves[(starting_rank-2, starting_file-1)] = 0
-            elif self.get_piece(starting_rank-2, starting_file-1).colour != colour:
-                moves[(starting_rank - 2, starting_file - 1)] = self.get_piece(starting_rank-2, starting_file-1)
-        if starting_rank > 1 and starting_file < 7:
-            if self.board[starting_rank-2][starting_file+1] == 0:
-                moves[(starting_rank-2, starting_file+1)] = 0
-            elif self.get_piece(starting_rank-2, starting_file+1).colour != colour:
-                moves[(starting_rank - 2, starting_file + 1)] = self.get_piece(starting_rank-2, starting_file+1)
-        if starting_rank < 7 and starting_file > 1:
-            if self.board[starting_rank+1][starting_file-2] == 0:
-                moves[(starting_rank+1, starting_file-2)] = 0
-            elif self.get_piece(starting_rank +1, starting_file - 2).colour != colour:
-                moves[(starting_rank + 1, starting_file - 2)] = self.get_piece(starting_rank +1, starting_file - 2)
-        if starting_rank < 7 and starting_file < 6:
-            if self.board[starting_rank+1][starting_file+2] == 0:
-                moves[(starting_rank+1, starting_file+2)] = 0
-            elif self.get_piece(starting_rank+1, starting_file+2).colour != colour:
-                moves[(starting_rank + 1, starting_file + 2)] = self.get_piece(starting_rank+1, starting_file+2)
-        if starting_rank < 6 and starting_file > 0:
-            if self.board[starting_rank+2][starting_file-1] == 0:
-                moves[(starting_rank+2, starting_file-1)] = 0
-            elif self.get_piece(starting_rank+2, starting_file-1).colour != colour:
-                moves[(starting_rank + 2, starting_file - 1)] = self.get_piece(starting_rank+2, starting_file-1)
-        if starting_rank < 6 and starting_file < 7:
-            if self.board[starting_rank+2][starting_file+1] == 0:
-                moves[(starting_rank+2, starting_file+1)] = 0
-            elif self.get_piece(starting_rank+2, starting_file+1).colour != colour:
-                moves[(starting_rank+2, starting_file+1)] = self.get_piece(starting_rank+2, starting_file+1)
-        return moves
+    def knight(self, kind, colour, has_moved, starting_rank, starting_file, last_move):
+        return self._to_moves(KNIGHT_ATTACKS[square(starting_rank, starting_file)] & ~self.occupied[colour])
 
-    def bishop(self, piece_type, colour, has_moved, starting_rank, starting_file, last_move):
-        moves = {}
-        moves.update(self._traverseUpLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDownLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseUpRight(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDownRight(piece_type, colour, starting_rank, starting_file))
-        return moves
+    def bishop(self, kind, colour, has_moved, starting_rank, starting_file, last_move):
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        return self._to_moves(bishop_attacks(square(starting_rank, starting_file), occupied) & ~self.occupied[colour])
 
-    def queen(self, piece_type, colour, has_moved, starting_rank, starting_file, last_move):
-        moves = {}
-        moves.update(self._traverseUp(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDown(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseRight(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseUpLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDownLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseUpRight(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDownRight(piece_type, colour, starting_rank, starting_file))
-        return moves
+    def queen(self, kind, colour, has_moved, starting_rank, starting_file, last_move):
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        return self._to_moves(queen_attacks(square(starting_rank, starting_file), occupied) & ~self.occupied[colour])
 
-    def king(self, piece_type, colour, has_moved, starting_rank, starting_file, last_move):
-        moves = {}
-        moves.update(self._traverseUp(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDown(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseRight(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseUpLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDownLeft(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseUpRight(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._traverseDownRight(piece_type, colour, starting_rank, starting_file))
-        moves.update(self._castlingRights(piece_type, has_moved, colour, starting_rank, starting_file, last_move))
+    def king(self, kind, colour, has_moved, starting_rank, starting_file, last_move):
+        moves = self._to_moves(KING_ATTACKS[square(starting_rank, starting_file)] & ~self.occupied[colour])
+        moves.update(self._castlingRights(kind, has_moved, colour, starting_rank, starting_file, last_move))
         return moves
 
-    # The following code traverses in a line and returns possible squares that could be a valid move.
-    # If there is a piece occupying the next square, it will stop. If that piece is the opposite colour,
-    # then it can be added to the valid moves list as a capture.
-    def _traverseUp(self, piece_type, colour, starting_rank, starting_file):
-        moves = {}
-        if starting_rank > 0:
-            next_piece = self.get_piece(starting_rank - 1, starting_file)
-            if next_piece == 0:
-                moves[(starting_rank-1, starting_file)] = next_piece
-                if piece_type != "king":
-                    moves.update(self._traverseUp(piece_type, colour, starting_rank - 1, starting_file))
-                else:
-                    return moves
-            elif next_piece.colour != colour:
-                moves[(starting_rank-1, starting_file)] = next_piece
-            else:
-                return moves
-        return moves
-
-    def _traverseDown(self, piece_type, colour, starting_rank, starting_file):
-        moves = {}
-        if starting_rank < 7:
-            next_piece = self.get_piece(starting_rank + 1, starting_file)
-            if next_piece == 0:
-                moves[(starting_rank+1, starting_file)] = 0
-                if piece_type != "king":
-                    moves.update(self._traverseDown(piece_type, colour, starting_rank + 1, starting_file))
-                else:
-                    return moves
-            elif next_piece.colour != colour:
-                moves[(starting_rank + 1, starting_file)] = next_piece
-            else:
-                return moves
-        return moves
-
-    def _traverseLeft(self, piece_type, colour, starting_rank, starting_file):
-        moves = {}
-        if starting_file > 0:
-            next_piece = self.get_piece(starting_rank, starting_file - 1)
-            if next_piece == 0:
-                moves[(starting_rank, starting_file - 1)] = 0
-                if piece_type != "king":
-                    moves.update(self._traverseLeft(piece_type, colour, starting_rank, starting_file - 1))
-                else:
-                    return moves
-            elif next_piece.colour != colour:
-                moves[(starting_rank, starting_file - 1)] = next_piece
-            else:
-                return moves
-        return moves
-
-    def _traverseRight(self, piece_type, colour, starting_rank, starting_file):
-        moves = {}
-        if starting_file < 7:
-            next_piece = self.get_piece(starting_rank, starting_file + 1)
-            if next_piece == 0:
-                moves[(starting_rank, starting_file + 1)] = 0
-                if piece_type != "king":
-                    moves.update(self._traverseRight(piece_type, colour, starting_rank, starting_file + 1))
-                else:
-                    return moves
-            elif next_piece.colour != colour:
-                moves[(starting_rank, starting_file + 1)] = next_piece
-            else:
-                return moves
-        return moves
-
-    def _traverseUpLeft(self, piece_type, colour, starting_rank, starting_file):
-        moves = {}
-        if starting_rank > 0 and starting_file > 0:
-            next_piece = self.get_piece(starting_rank - 1, starting_file - 1)
-            if next_piece == 0:
-                moves[(starting_rank - 1, starting_file - 1)] = 0
-                if piece_type != "king":
-                    moves.update(self._traverseUpLeft(piece_type, colour, starting_rank - 1, starting_file - 1))
-                else:
-                    return moves
-            elif next_piece.colour != colour:
-                moves[(starting_rank - 1, starting_file - 1)] = next_piece
-            else:
-                return moves
-        return moves
-
-    def _traverseUpRight(self, piece_type, colour, starting_rank, starting_file):
-        moves = {}
-        if starting_rank > 0 and starting_file < 7:
-            next_piece = self.get_piece(starting_rank - 1, starting_file + 1)
-            if next_piece == 0:
-                moves[(starting_rank - 1, starting_file + 1)] = 0
-                if piece_type != "king":
-                    moves.update(self._traverseUpRight(piece_type, colour, starting_rank - 1, starting_file + 1))
-                else:
-                    return moves
-            elif next_piece.colour != colour:
-                moves[(starting_rank - 1, starting_file + 1)] = next_piece
-            else:
-                return moves
-        return moves
-
-    def _traverseDownLeft(self, piece_type, colour, starting_rank, starting_file):
-        moves = {}
-        if starting_rank < 7 and starting_file > 0:
-            next_piece = self.get_piece(starting_rank + 1, starting_file - 1)
-            if next_piece == 0:
-                moves[(starting_rank + 1, starting_file - 1)] = 0
-                if piece_type != "king":
-                    moves.update(self._traverseDownLeft(piece_type, colour, starting_rank + 1, starting_file - 1))
+    def generate_moves(self, colour, last_move):
+        """Generates every move for one side as (start, end, tag, promotion) tuples, with squares numbered as in bitboard.py.
+        This is the same move set as calling get_valid_moves on each piece, but it works a whole piece type at a time
+        from the bitboards and never builds a dict. Promotions are expanded into one move per piece that can be chosen.
+        """
+        moves = []
+        append = moves.append
+        bitboards = self.bitboards
+        own = self.occupied[colour]
+        not_own = ~own
+        side = colour << 3
+        enemy_colour = BLACK if colour == WHITE else WHITE
+        enemy = self.occupied[enemy_colour]
+        occupied = own | enemy
+
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            pieces = bitboards[kind | side]
+            while pieces:
+                bit = pieces & -pieces
+                start = bit.bit_length() - 1
+                pieces ^= bit
+                if kind == KNIGHT:
+                    targets = KNIGHT_ATTACKS[start] & not_own
+                elif kind == BISHOP:
+                    targets = bishop_attacks(start, occupied) & not_own
+                elif kind == ROOK:
+                    targets = rook_attacks(start, occupied) & not_own
+                elif kind == QUEEN:
+                    targets = queen_attacks(start, occupied) & not_own
                 else:
-                    return moves
-            elif next_piece.colour != colour:
-                moves[(starting_rank + 1, starting_file - 1)] = next_piece
-            else:
-                return moves
-        return moves
-
-    def _traverseDownRight(self, piece_type, colour, starting_rank, starting_file):
-        moves = {}
-        if starting_rank < 7 and starting_file < 7:
-            next_piece = self.get_piece(starting_rank + 1, starting_file + 1)
-            if next_piece == 0:
-                moves[(starting_rank + 1, starting_file + 1)] = 0
-                if piece_type != "king":
-                    moves.update(self._traverseDownRight(piece_type, colour, starting_rank + 1, starting_file + 1))
+                    targets = KING_ATTACKS[start] & not_own
+                while targets:
+                    bit = targets & -targets
+                    append((start, bit.bit_length() - 1, 0, None))
+                    targets ^= bit
+
+        # castling
+        if self.castling_rights & (WHITE_SHORT | WHITE_LONG if colour == WHITE else BLACK_SHORT | BLACK_LONG):
+            start = bitboards[KING | side].bit_length() - 1
+            king_rank, king_file = rank_file(start)
+            for (rank, file), tag in self._castlingRights(KING, False, colour, king_rank, king_file, last_move).items():
+                append((start, square(rank, file), tag, None))
+
+        # pawns are moved all at once by shifting the whole bitboard one rank forwards
+        pawns = bitboards[PAWN | side]
+        empty = ~occupied
+        if colour == WHITE:
+            forward = -8
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_MASKS[5]) >> 8) & empty
+            left = ((pawns & ~FILE_A) >> 9) & enemy
+            right = ((pawns & ~FILE_H) >> 7) & enemy
+            last_rank = RANK_MASKS[0]
+        else:
+            forward = 8
+            single = (pawns << 8) & empty
+            double = ((single & RANK_MASKS[2]) << 8) & empty
+            left = ((pawns & ~FILE_A) << 7) & enemy
+            right = ((pawns & ~FILE_H) << 9) & enemy
+            last_rank = RANK_MASKS[7]
+        for targets, offset in ((single, forward), (left, forward - 1), (right, forward + 1)):
+            while targets:
+                bit = targets & -targets
+                end = bit.bit_length() - 1
+                targets ^= bit
+                if bit & last_rank:
+                    for promotion in PROMOTION_PIECES:
+                        append((end - offset, end, "promotion", promotion))
                 else:
-                    return moves
-            elif next_piece.colour != colour:
-                moves[(starting_rank + 1, starting_file + 1)] = next_piece
-            else:
-                return moves
+                    append((end - offset, end, 0, None))
+        while double:
+            bit = double & -double
+            end = bit.bit_length() - 1
+            double ^= bit
+            append((end - 2 * forward, end, "pawnTwoSpaces", None))
+
+        # en passant, when the last move was an enemy pawn moving two squares
+        if last_move:
+            passed = square(*last_move)
+            if bitboards[piece_code(enemy_colour, PAWN)] >> passed & 1:
+                end = passed + forward
+                capturers = PAWN_ATTACKS[enemy_colour][end] & pawns
+                while capturers:
+                    bit = capturers & -capturers
+                    capturers ^= bit
+                    append((bit.bit_length() - 1, end, "en passant", None))
         return moves
 
-    def _castlingRights(self, piece_type, has_moved, colour, starting_rank, starting_file, last_move):
-        """Works out whether a selected king can castle or not."""
+    def _castlingRights(self, kind, has_moved, colour, starting_rank, starting_file, last_move):
+        """Works out whether a selected king can castle or not, from the castling rights left and the squares between."""
         moves = {}
-        if not has_moved:
-            # short castle
-            rook = self.get_piece(starting_rank, starting_file+3)
-            if rook != 0 \
-                    and rook.piece_type[2:] == "rook" \
-                    and not rook.has_moved \
-                    and rook.colour == colour \
-                    and self.get_piece(starting_rank, starting_file+1) == 0 \
-                    and self.get_piece(starting_rank, starting_file+2) == 0:
-                # then we can castle
-                moves[starting_rank, starting_file+2] = "shortCastle"
-            # long castle
-            rook = self.get_piece(starting_rank, starting_file-4)
-            if rook != 0 \
-                    and rook.piece_type[2:] == "rook" \
-                    and not rook.has_moved \
-                    and rook.colour == colour \
-                    and self.get_piece(starting_rank, starting_file - 1) == 0 \
-                    and self.get_piece(starting_rank, starting_file - 2) == 0 \
-                    and self.get_piece(starting_rank, starting_file - 3) == 0:
-                moves[starting_rank, starting_file-2] = "longCastle"
+        if colour == WHITE:
+            short, long = WHITE_SHORT, WHITE_LONG
         else:
-            pass
+            short, long = BLACK_SHORT, BLACK_LONG
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        start = square(starting_rank, starting_file)
+        # short castle
+        if self.castling_rights & short and not occupied & (0b11 << (start + 1)):
+            moves[starting_rank, starting_file+2] = "shortCastle"
+        # long castle
+        if self.castling_rights & long and not occupied & (0b111 << (start - 3)):
+            moves[starting_rank, starting_file-2] = "longCastle"
         return moves
 
     # ------------------------------
-    # The following code is specific code that is essentially the same as the move function above.
+    # The following code is essentially the same as the move function above.
     # The difference here is that the pieces/squares affected are not the same as
-    # the pieces/squares selected with the mouse
+    # the pieces/squares selected with the mouse, which make_move works out from the move's tag
     def shortCastle(self, king, rank, file, last_move):
-        start_rank = king.rank
-        start_file = king.file
-        rook = self.get_piece(rank, file + 1)
-        self.board[king.rank][king.file], self.board[rank][file] = self.board[rank][file], self.board[king.rank][king.file]
-        self.board[rank][file - 1], self.board[rook.rank][rook.file] = rook, self.board[rank][file - 1]
-        if not self.isCheck(WHITE if king.colour == BLACK else BLACK, last_move):
-            king.move(rank, file)
-            rook.move(rank, file-1)
-            return True
-        else:
-            # revert to original pos
-            self.board[start_rank][start_file], self.board[rank][file] = king, 0
-            self.board[rook.rank][rook.file], self.board[rank][file-1] = rook, 0
-            return False
+        return self._try_move((square(king.rank, king.file), square(rank, file), "shortCastle", None))
 
     def longCastle(self, king, rank, file, last_move):
-        start_rank = king.rank
-        start_file = king.file
-        rook = self.get_piece(rank, file-2)
-        self.board[king.rank][king.file], self.board[rank][file] = self.board[rank][file], self.board[king.rank][king.file]
-        self.board[rank][file+1], self.board[rook.rank][rook.file] = rook, self.board[rank][file+1]
-        if not self.isCheck(WHITE if king.colour == BLACK else BLACK, last_move):
-            king.move(rank, file)
-            rook.move(rank, file + 1)
-            return True
-        else:
-            self.board[start_rank][start_file], self.board[rank][file] = king, 0
-            self.board[rook.rank][rook.file], self.board[rank][file + 1] = rook, 0
-            return False
+        return self._try_move((square(king.rank, king.file), square(rank, file), "longCastle", None))
 
     def enPassant(self, pawn, rank, file, colour, last_move):
-        new_board = self.board[:]
-        if colour == WHITE:
-            captured_pawn = self.get_piece(rank+1, file)
-        else:
-            captured_pawn = self.get_piece(rank-1, file)
-        if not self.isCheck(WHITE if pawn.colour == BLACK else BLACK, last_move):
-            new_board[pawn.rank][pawn.file], new_board[rank][file] = new_board[rank][file], new_board[pawn.rank][pawn.file]
-            new_board[captured_pawn.rank][captured_pawn.file] = 0
-            pawn.move(rank, file)
-            return True
-        else:
-            return False
+        """Takes the pawn that has just moved two squares by moving diagonally behind it.
+        The check test is done after both pawns have left their squares, as that can uncover an attack on the king.
+        """
+        return self._try_move((square(pawn.rank, pawn.file), square(rank, file), "en passant", None))
 
     # ---------------------------
+    def square_attacked_by(self, square, colour):
+        """Returns true or false depending on whether any piece of the given colour attacks a (rank, file) square.
+        Rather than generating every move of that side, it looks outward from the square itself:
+        a knight jump, a pawn diagonal, a king step or an open line to a slider is all it takes.
+        """
+        rank, file = square
+        return self._attacked(rank * FILES + file, colour)
+
+    def _attacked(self, sq, colour):
+        bitboards = self.bitboards
+        side = colour << 3
+        if KNIGHT_ATTACKS[sq] & bitboards[KNIGHT | side]:
+            return True
+        # a pawn attacks this square if a pawn of the other colour standing here would attack the pawn
+        if PAWN_ATTACKS[BLACK if colour == WHITE else WHITE][sq] & bitboards[PAWN | side]:
+            return True
+        if KING_ATTACKS[sq] & bitboards[KING | side]:
+            return True
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        queens = bitboards[QUEEN | side]
+        if rook_attacks(sq, occupied) & (bitboards[ROOK | side] | queens):
+            return True
+        if bishop_attacks(sq, occupied) & (bitboards[BISHOP | side] | queens):
+            return True
+        return False
+
+    def _attackers(self, sq, colour, occupied):
+        """Returns a bitboard of every piece of the given colour attacking a square, with the sliders' lines
+        worked out from the given occupancy instead of the board's, e.g. with the king lifted off.
+        """
+        bitboards = self.bitboards
+        side = colour << 3
+        queens = bitboards[QUEEN | side]
+        return KNIGHT_ATTACKS[sq] & bitboards[KNIGHT | side] \
+            | PAWN_ATTACKS[BLACK if colour == WHITE else WHITE][sq] & bitboards[PAWN | side] \
+            | KING_ATTACKS[sq] & bitboards[KING | side] \
+            | rook_attacks(sq, occupied) & (bitboards[ROOK | side] | queens) \
+            | bishop_attacks(sq, occupied) & (bitboards[BISHOP | side] | queens)
+
     def isCheck(self, colour, last_move):
         """Returns true or false depending on whether it is check or not.
         The colour parameter is the side that you wish to check if it is putting the other side in check.
         """
-        # checks whether a side is in check on the copy board
-        check_moves = {}
-        for rank in range(RANKS):
-            for file in range(FILES):
-                piece = self.get_piece(rank, file)
-                if piece != 0 and piece.colour == colour:
-                    check_moves.update(self.get_valid_moves(piece, last_move))
-        for (rank, file) in check_moves:
-            try:
-                self.get_piece(rank, file).piece_type[2:] == "king"
-            except AttributeError:
-                pass
-            else:
-                if self.get_piece(rank, file).piece_type[2:] == "king" and self.get_piece(rank, file).colour != colour:
-                    return True
-        return False
+        king = self.bitboards[piece_code(BLACK if colour == WHITE else WHITE, KING)]
+        if not king:
+            return False
+        return self._attacked(king.bit_length() - 1, colour)
 
     def short_castle_through_check(self, colour, last_move):
         """Determines if a king is trying to castle through check"""
-        check_moves = {}
-        for rank in range(RANKS):
-            for file in range(FILES):
-                piece = self.get_piece(rank, file)
-                if piece != 0 and piece.colour != colour:
-                    check_moves.update(self.get_valid_moves(piece, last_move))
         if colour == WHITE:
-            if (7, 5) in check_moves:
-                return True
-            else:
-                return False
+            return self.square_attacked_by((7, 5), BLACK)
         else:
-            if (0, 5) in check_moves:
-                return True
-            else:
-                return False
+            return self.square_attacked_by((0, 5), WHITE)
 
     def long_castle_through_check(self, colour, last_move):
         """Determines if a king is trying to castle through check"""
-        check_moves = {}
-        for rank in range(RANKS):
-            for file in range(FILES):
-                piece = self.get_piece(rank, file)
-                if piece != 0 and piece.colour != colour:
-                    check_moves.update(self.get_valid_moves(piece, last_move))
         if colour == WHITE:
-            if (7, 3) in check_moves:
-                return True
-            else:
-                return False
+            return self.square_attacked_by((7, 3), BLACK)
         else:
-            if (0, 3) in check_moves:
-                return True
-            else:
-                return False
-
-    def pawn_promotion(self, piece, rank, file, last_move):
-        while True:
-            print("Which piece would you like to promote to?")
-            new_piece_type = input("N = Knight, B = Bishop, R = Rook, Q = Queen, C = Cancel: ").upper()
-            if new_piece_type in ["N", "B", "R", "Q", "C"]:
-                break
-            else:
-                print("Please only enter one of the valid options.\n")
-        start_rank = piece.rank
-        start_file = piece.file
-        captured_piece = self.board[rank][file]
-        self.board[piece.rank][piece.file], self.board[rank][file] = 0, self.board[piece.rank][piece.file]
-        if not self.isCheck(WHITE if piece.colour == BLACK else BLACK, last_move):
-            if new_piece_type == 'N':
-                piece.piece_type = piece.piece_type[:2] + "knight"
-                piece.piece_image = piece.piece_dict[piece.piece_type]
-            elif new_piece_type == "B":
-                piece.piece_type = piece.piece_type[:2] + "bishop"
-                piece.piece_image = piece.piece_dict[piece.piece_type]
-            elif new_piece_type == "R":
-                piece.piece_type = piece.piece_type[:2] + "rook"
-                piece.piece_image = piece.piece_dict[piece.piece_type]
-            elif new_piece_type == "Q":
-                piece.piece_type = piece.piece_type[:2] + "queen"
-                piece.piece_image = piece.piece_dict[piece.piece_type]
-            elif new_piece_type == "C":
+            return self.square_attacked_by((0, 3), WHITE)
+
+    def pawn_promotion(self, piece, rank, file, last_move, promotion=None):
+        """Promotes a pawn to the given piece type, or asks on the terminal which piece to promote to if none is given."""
+        if promotion is None:
+            while True:
+                print("Which piece would you like to promote to?")
+                new_piece_type = input("N = Knight, B = Bishop, R = Rook, Q = Queen, C = Cancel: ").upper()
+                if new_piece_type in ["N", "B", "R", "Q", "C"]:
+                    break
+                else:
+                    print("Please only enter one of the valid options.\n")
+            if new_piece_type == "C":
                 return False
-            piece.move(rank, file)
-            return True
-        else:
-            self.board[start_rank][start_file], self.board[rank][file] = piece, captured_piece
-            return False
-            
+            promotion = {"N": "knight", "B": "bishop", "R": "rook", "Q": "queen"}[new_piece_type]
+        return self._try_move((square(piece.rank, piece.file), square(rank, file), "promotion", promotion))
@@ -0,0 +1,169 @@
+"""
+This file reads and builds opening books in the Polyglot file format: 16-byte entries sorted by position key,
+each holding the key, a move, a weight and a learn value, all big-endian.
+A move is packed as to-file in bits 0-2, to-row in bits 3-5, from-file in bits 6-8, from-row in bits 9-11 and
+the promotion piece in bits 12-14 (1 knight to 4 queen), with row 0 being white's back rank,
+and castling is written as the king taking its own rook (e1h1 for white's short castle).
+
+The keys are Polyglot keys, worked out in polyglot.py from Polyglot's own random numbers rather than the engine's
+Zobrist keys, so books built by other programs can be read here and books built here can be read by them.
+
+The book is read through mmap, so every process that opens it shares the one copy in the page cache,
+and a position's moves are found by binary search on the sorted keys.
+
+    python book.py build games.pgn more.pgn --output book.bin --plies 20
+    python book.py probe book.bin --fen "<fen>"
+"""
+import argparse
+import mmap
+import random
+import struct
+from collections import defaultdict
+from constants import WHITE
+from board import Board
+from polyglot import polyglot_key
+from pgn import read_games, parse_san, san, IllegalMoveError
+
+ENTRY = struct.Struct(">QHHI")
+ENTRY_BYTES = ENTRY.size
+_KEY = struct.Struct(">Q")
+PROMOTION_CODES = {None: 0, "knight": 1, "bishop": 2, "rook": 3, "queen": 4}
+MAX_WEIGHT = 0xFFFF
+
+
+def encode_move(move):
+    """Packs a (start, end, tag, promotion) move into a Polyglot move."""
+    start, end, tag, promotion = move
+    if tag == "shortCastle":
+        end = start + 3
+    elif tag == "longCastle":
+        end = start - 4
+    # our ranks count down from black's back rank, Polyglot's rows count up from white's
+    return (end & 7) | (7 - (end >> 3)) << 3 | (start & 7) << 6 | (7 - (start >> 3)) << 9 \
+        | PROMOTION_CODES[promotion] << 12
+
+
+class OpeningBook:
+    """An opening book file, memory-mapped. Use moves(board) for the weighted moves of a position and
+    choose(board) to pick one at random in proportion to its weight. Call close() when done with it.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = self.file.seek(0, 2)
+        if size % ENTRY_BYTES:
+            self.file.close()
+            raise ValueError(f"{path} is not a whole number of {ENTRY_BYTES} byte entries")
+        self.length = size // ENTRY_BYTES
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return self.length
+
+    def _first_index(self, key):
+        """Binary search for the first entry with a key not less than key."""
+        low, high = 0, self.length
+        while low < high:
+            middle = (low + high) // 2
+            if _KEY.unpack_from(self.map, middle * ENTRY_BYTES)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key):
+        """Returns the (move, weight, learn) entries stored for a position key, as packed Polyglot moves."""
+        found = []
+        index = self._first_index(key)
+        while index < self.length:
+            entry_key, move, weight, learn = ENTRY.unpack_from(self.map, index * ENTRY_BYTES)
+            if entry_key != key:
+                break
+            found.append((move, weight, learn))
+            index += 1
+        return found
+
+    def moves(self, board):
+        """Returns the board's legal moves that are in the book, as (move, weight) pairs, heaviest first."""
+        entries = self.entries(polyglot_key(board))
+        if not entries:
+            return []
+        legal = {encode_move(move): move for move in board.legal_moves()}
+        return [(legal[code], weight) for code, weight, learn in entries if code in legal]
+
+    def choose(self, board, rng=random):
+        """Picks one of the board's book moves at random, in proportion to the weights, or returns None.
+        Moves with a weight of 0 are in the book but are never played.
+        """
+        weighted = [(move, weight) for move, weight in self.moves(board) if weight > 0]
+        if not weighted:
+            return None
+        return rng.choices([move for move, weight in weighted], [weight for move, weight in weighted])[0]
+
+    def close(self):
+        if self.length:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_book(pgn_paths, output, plies=20, min_games=1):
+    """Compiles a book from the first plies moves of every game in some PGN files and returns its number of entries.
+    A move scores 2 for each game won by the side that played it, 1 for each draw and 0 for each loss,
+    and the weights are the scores scaled to fit in 16 bits. Moves played in fewer than min_games games are left out.
+    Games with illegal moves are used up to the first illegal move.
+    """
+    scores = defaultdict(int)
+    counts = defaultdict(int)
+    for path in pgn_paths:
+        for game in read_games(path):
+            points = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}.get(game.result, (0, 0))
+            board = game.start_board()
+            try:
+                for text in game.moves[:plies]:
+                    move = parse_san(board, text)
+                    entry = (polyglot_key(board), encode_move(move))
+                    counts[entry] += 1
+                    scores[entry] += points[0] if board.turn == WHITE else points[1]
+                    board.make_move(move)
+            except IllegalMoveError:
+                pass
+    entries = [(key, move, scores[key, move]) for (key, move), count in counts.items() if count >= min_games]
+    highest = max((score for key, move, score in entries), default=0)
+    scale = min(1.0, MAX_WEIGHT / highest) if highest else 1.0
+    entries.sort(key=lambda entry: (entry[0], -entry[2], entry[1]))
+    with open(output, "wb") as file:
+        for key, move, score in entries:
+            file.write(ENTRY.pack(key, move, int(score * scale), 0))
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or look up an opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile a book from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--output", required=True)
+    build.add_argument("--plies", type=int, default=20, help="how many moves of each game to use")
+    build.add_argument("--min-games", type=int, default=1, help="leave out moves played in fewer games")
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", help="the position, the starting position if not given")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"{build_book(args.pgn, args.output, args.plies, args.min_games)} entries written to {args.output}")
+    else:
+        board = Board.from_fen(args.fen) if args.fen else Board()
+        with OpeningBook(args.book) as book:
+            for move, weight in book.moves(board):
+                print(san(board, move), weight)
+
+
+if __name__ == "__main__":
+    main()
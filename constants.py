@@ -4,8 +4,9 @@ HEIGHT = 800
 DARK_SQUARES = "#603601"
 LIGHT_SQUARES = "#CC9544"
 
-BLACK = "#000000"
-WHITE = "#FFFFFF"
+# the two sides, which also index per-colour lists such as Board.occupied
+WHITE = 0
+BLACK = 1
 BLUE = (0,0,255)
 
 RANKS = 8
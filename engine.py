@@ -0,0 +1,378 @@
+"""
+This file is the computer player. It searches the moves of a Board with negamax alpha-beta, one ply deeper at a time
+until it runs out of depth, time or nodes, and finishes each line with a search of captures only (quiescence),
+so it doesn't stop counting in the middle of an exchange.
+
+Moves are tried best-first: the move stored for the position in the transposition table, then captures by most
+valuable victim / least valuable attacker (MVV-LVA), then promotions, then the two quiet moves that last caused
+a cut-off at the same ply (killers), then the rest by how often they have caused cut-offs before (history).
+"""
+import time
+from constants import WHITE, BLACK
+from evaluation import evaluate, PIECE_VALUES
+from piece import KINDS_BY_NAME
+
+MATE = 100000
+INFINITY = 1000000
+# a score beyond this is a forced mate, stored in the transposition table relative to the position, not the root
+MATE_BOUND = MATE - 1000
+MAX_PLY = 128
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+def unsearched_stats(move, source, score=0):
+    """The stats returned with a move taken from the opening book or the tablebases instead of searched.
+    source is "book" or "tablebase", and is set to True in the stats.
+    """
+    return {"depth": 0, "score": score, "nodes": 0, "seconds": 0.0, "nps": 0, "ebf": 0.0, "tt_hit_rate": 0.0,
+            "pv": [move], source: True}
+
+
+def tablebase_score(wdl, plies, ply=0):
+    """Turns a tablebase result for the side to move into a search score, with mates counted from the root."""
+    if wdl > 0:
+        return MATE - ply - plies
+    if wdl < 0:
+        return -MATE + ply + plies
+    return 0
+
+
+class SearchStopped(Exception):
+    """Raised inside the search when a time or node limit is reached or stop() is called."""
+
+
+class TranspositionTable:
+    """A fixed-size table of search results, indexed by the position key modulo the number of slots.
+    A slot is only replaced by a result searched at least as deep, unless what is in it comes from an earlier search.
+    """
+    # a rough size of one stored entry: the slot, the entry tuple and its key and score ints
+    ENTRY_BYTES = 200
+
+    def __init__(self, size_mb=16):
+        self.size = max(1, size_mb * 1024 * 1024 // self.ENTRY_BYTES)
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        self.generation += 1
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """Returns the (key, depth, score, flag, move, generation) entry for a position, or None."""
+        self.probes += 1
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        index = key % self.size
+        entry = self.entries[index]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, score, flag, move, self.generation)
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+
+class Engine:
+    """Chooses moves for a Board. One Engine keeps its transposition table, killers and history between searches."""
+
+    def __init__(self, hash_mb=16, book=None, tablebases=None):
+        self.tt = TranspositionTable(hash_mb)
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = None
+        self.node_limit = None
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [0] * (64 * 64)
+        # a multiprocessing.Event when the engine runs in a worker process of a ParallelEngine
+        self.stop_event = None
+        # a book.OpeningBook whose moves are played without searching
+        self.book = book
+        # a tablebase.Tablebases that settles the positions it covers without searching them
+        self.tablebases = tablebases
+
+    def stop(self):
+        """Asks a running search to stop as soon as it next checks its limits. Safe to call from another thread."""
+        self.stopped = True
+
+    def search(self, board, depth=None, movetime=None, nodes=None, info=None):
+        """Searches the board's position and returns (best move, stats) without changing the board.
+        depth is in plies, at least 1, movetime in seconds and nodes a node count. With no limits the search goes
+        to depth 4.
+        info, if given, is called with the stats dict after every completed depth.
+        If the position is in the engine's opening book, a book move is returned straight away, with stats["book"] set,
+        and the same goes for the tablebases, with stats["tablebase"] set.
+        """
+        if depth is not None and depth < 1:
+            raise ValueError(f"the depth must be at least 1, not {depth}")
+        book_move = self.book.choose(board) if self.book is not None else None
+        if book_move is not None:
+            return book_move, unsearched_stats(book_move, "book")
+        found = self.tablebases.best_move(board) if self.tablebases is not None else None
+        if found is not None:
+            return found[0], unsearched_stats(found[0], "tablebase", tablebase_score(*found[1]))
+        if depth is None and movetime is None and nodes is None:
+            depth = 4
+        max_depth = MAX_PLY - 1 if depth is None else min(depth, MAX_PLY - 1)
+        started = self._start(movetime, nodes)
+        self.tt.new_search()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [value // 8 for value in self.history]
+        history_length = len(board.history)
+
+        root_moves = board.legal_moves()
+        best_move = root_moves[0] if root_moves else None
+        stats = {"depth": 0, "score": 0, "nodes": 0, "seconds": 0.0, "nps": 0, "ebf": 0.0, "tt_hit_rate": 0.0, "pv": []}
+        previous_nodes = 0
+        for current_depth in range(1, max_depth + 1):
+            if not root_moves:
+                stats["score"] = -MATE if board.isCheck(self._enemy(board), board.last_move) else 0
+                break
+            nodes_before = self.nodes
+            try:
+                score, move = self._root(board, root_moves, current_depth)
+            except SearchStopped:
+                while len(board.history) > history_length:
+                    board.unmake_move()
+                break
+            best_move = move
+            # search the best move first next time
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+            iteration_nodes = self.nodes - nodes_before
+            seconds = time.perf_counter() - started
+            stats = {
+                "depth": current_depth,
+                "score": score,
+                "nodes": self.nodes,
+                "seconds": seconds,
+                "nps": int(self.nodes / seconds) if seconds else 0,
+                "ebf": iteration_nodes / previous_nodes if previous_nodes else 0.0,
+                "tt_hit_rate": self.tt.hit_rate(),
+                "pv": self._principal_variation(board, current_depth),
+            }
+            previous_nodes = iteration_nodes
+            if info:
+                info(stats)
+            if abs(score) > MATE_BOUND or len(root_moves) == 1 and movetime is not None:
+                break
+        stats["nodes"] = self.nodes
+        stats["seconds"] = time.perf_counter() - started
+        stats["nps"] = int(self.nodes / stats["seconds"]) if stats["seconds"] else 0
+        return best_move, stats
+
+    def search_move(self, board, move, depth, alpha=-INFINITY, movetime=None, nodes=None):
+        """Searches a single root move to depth with the window (alpha, infinity), for ParallelEngine's workers.
+        Returns the score, which is only an upper bound when it is no better than alpha, or None if a limit was hit.
+        The killers, history and transposition table carry over from one call to the next.
+        """
+        self._start(movetime, nodes)
+        history_length = len(board.history)
+        try:
+            board.make_move(move)
+            score = -self._negamax(board, depth - 1, -INFINITY, -alpha, 1)
+        except SearchStopped:
+            score = None
+        while len(board.history) > history_length:
+            board.unmake_move()
+        return score
+
+    # ---------------------------
+    def _start(self, movetime, nodes):
+        started = time.perf_counter()
+        self.deadline = started + movetime if movetime is not None else None
+        self.node_limit = nodes
+        self.nodes = 0
+        self.stopped = False
+        return started
+
+    def _enemy(self, board):
+        return WHITE if board.turn == BLACK else BLACK
+
+    def _check_limits(self):
+        if self.stopped or self.deadline is not None and time.perf_counter() >= self.deadline \
+                or self.node_limit is not None and self.nodes >= self.node_limit \
+                or self.stop_event is not None and self.stop_event.is_set():
+            self.stopped = True
+            raise SearchStopped()
+
+    def _is_repetition(self, board):
+        """True if the position has already occurred, in the game or earlier in this line of the search."""
+        key = board.key
+        history = board.history
+        length = len(history)
+        for index in range(length - 1, -1, -1):
+            record = history[index]
+            # a capture can never be undone, so nothing before it can repeat
+            if record[1] != 0:
+                break
+            # record[5] is the key before the move, and only every other position has the same side to move
+            if (length - index) % 2 == 0 and record[5] == key:
+                return True
+        return False
+
+    def _root(self, board, moves, depth):
+        alpha = -INFINITY
+        best_move = moves[0]
+        for move in moves:
+            board.make_move(move)
+            score = -self._negamax(board, depth - 1, -INFINITY, -alpha, 1)
+            board.unmake_move()
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self.tt.store(board.key, depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self._check_limits()
+        if self._is_repetition(board):
+            return 0
+        if self.tablebases is not None:
+            result = self.tablebases.probe(board)
+            if result is not None:
+                return tablebase_score(*result, ply)
+        in_check = board.isCheck(self._enemy(board), None)
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self._quiesce(board, alpha, beta, ply)
+
+        tt = self.tt
+        key = board.key
+        tt_move = None
+        entry = tt.probe(key)
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                score = entry[2]
+                if score > MATE_BOUND:
+                    score -= ply
+                elif score < -MATE_BOUND:
+                    score += ply
+                flag = entry[3]
+                if flag == EXACT or flag == LOWER and score >= beta or flag == UPPER and score <= alpha:
+                    return score
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        moves = board.generate_legal_moves()
+        self._order(board, moves, tt_move, ply)
+        for move in moves:
+            quiet = board.board[move[1] >> 3][move[1] & 7] == 0 and not move[3] and move[2] != "en passant"
+            board.make_move(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if quiet:
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            self.history[move[0] * 64 + move[1]] += depth * depth
+                        break
+
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        if best_score >= beta:
+            flag = LOWER
+        elif best_score <= original_alpha:
+            flag = UPPER
+        else:
+            flag = EXACT
+        stored = best_score
+        if stored > MATE_BOUND:
+            stored += ply
+        elif stored < -MATE_BOUND:
+            stored -= ply
+        tt.store(key, depth, stored, flag, best_move)
+        return best_score
+
+    def _quiesce(self, board, alpha, beta, ply):
+        """Searches captures and promotions only, until the position is quiet, so exchanges are seen to the end."""
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self._check_limits()
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        if ply >= MAX_PLY - 1:
+            return alpha
+        squares = board.board
+        moves = [move for move in board.generate_legal_moves()
+                 if squares[move[1] >> 3][move[1] & 7] != 0 or move[3] == "queen" or move[2] == "en passant"]
+        self._order(board, moves, None, ply)
+        for move in moves:
+            board.make_move(move)
+            score = -self._quiesce(board, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order(self, board, moves, tt_move, ply):
+        """Sorts moves in place, most promising first."""
+        squares = board.board
+        killers = self.killers[ply]
+        history = self.history
+
+        def move_score(move):
+            start, end, tag, promotion = move
+            if move == tt_move:
+                return 100000000
+            victim = squares[end >> 3][end & 7]
+            if victim != 0:
+                return 10000000 + 10 * PIECE_VALUES[victim.code] - PIECE_VALUES[squares[start >> 3][start & 7].code]
+            if tag == "en passant":
+                return 10000000 + 900
+            if promotion:
+                return 9000000 + PIECE_VALUES[KINDS_BY_NAME[promotion]]
+            if move == killers[0]:
+                return 8000002
+            if move == killers[1]:
+                return 8000001
+            return history[start * 64 + end]
+
+        moves.sort(key=move_score, reverse=True)
+
+    def _principal_variation(self, board, depth):
+        """Follows the best moves stored in the transposition table from the root."""
+        pv = []
+        seen = set()
+        while len(pv) < depth:
+            entry = self.tt.entries[board.key % self.tt.size]
+            if entry is None or entry[0] != board.key or entry[4] is None or board.key in seen or entry[4] not in board.legal_moves():
+                break
+            seen.add(board.key)
+            pv.append(entry[4])
+            board.make_move(entry[4])
+        for _ in pv:
+            board.unmake_move()
+        return pv
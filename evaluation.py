@@ -0,0 +1,155 @@
+"""
+This file scores a position for the engine: material plus a bonus or penalty for the square each piece stands on.
+The piece-square tables are laid out like Board.board, with white's side at the bottom,
+so a white piece on square sq reads table[sq] and a black piece reads the mirrored square, table[sq ^ 56].
+"""
+from constants import WHITE, BLACK
+from bitboard import squares
+from piece import KNIGHT, BISHOP, ROOK, QUEEN, KING, KIND_NAMES, PIECE_CODES, CODE_COUNT, piece_code
+
+VALUES = {"pawn": 100, "knight": 320, "bishop": 330, "rook": 500, "queen": 900, "king": 20000}
+
+PAWN_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+]
+
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+]
+
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+]
+
+ROOK_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+]
+
+QUEEN_TABLE = [
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+]
+
+# the king hides behind its pawns while there are queens and pieces about, and walks to the centre in the endgame
+KING_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+]
+
+KING_ENDGAME_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+]
+
+TABLES = {
+    "pawn": PAWN_TABLE,
+    "knight": KNIGHT_TABLE,
+    "bishop": BISHOP_TABLE,
+    "rook": ROOK_TABLE,
+    "queen": QUEEN_TABLE,
+    "king": KING_TABLE,
+}
+
+# Once neither side has more than a rook and a minor piece besides pawns, the endgame king table is used
+ENDGAME_MATERIAL = VALUES["rook"] + VALUES["bishop"]
+
+
+def _combined_table(code, table):
+    """Adds the piece value to its table, mirrored for black, and negated for black so white is always positive."""
+    value = VALUES[KIND_NAMES[code & 7]]
+    if code >> 3 == WHITE:
+        return [value + table[sq] for sq in range(64)]
+    return [-(value + table[sq ^ 56]) for sq in range(64)]
+
+
+# the tables and values below are lists indexed by piece code
+PIECE_SQUARE = [None] * CODE_COUNT
+for _code in PIECE_CODES:
+    PIECE_SQUARE[_code] = _combined_table(_code, TABLES[KIND_NAMES[_code & 7]])
+KING_ENDGAME_SQUARE = [None] * CODE_COUNT
+for _colour in (WHITE, BLACK):
+    KING_ENDGAME_SQUARE[piece_code(_colour, KING)] = _combined_table(piece_code(_colour, KING), KING_ENDGAME_TABLE)
+# piece values by piece code, either colour, for move ordering
+PIECE_VALUES = [0] * CODE_COUNT
+for _code in PIECE_CODES:
+    PIECE_VALUES[_code] = VALUES[KIND_NAMES[_code & 7]]
+# every code but the kings, which are scored on their own
+_NON_KING_CODES = tuple(code for code in PIECE_CODES if code & 7 != KING)
+_KING_CODES = (piece_code(WHITE, KING), piece_code(BLACK, KING))
+
+
+def evaluate(board):
+    """Scores the position in centipawns from the point of view of the side to move."""
+    bitboards = board.bitboards
+    score = 0
+    for code in _NON_KING_CODES:
+        bitboard = bitboards[code]
+        if bitboard:
+            table = PIECE_SQUARE[code]
+            for sq in squares(bitboard):
+                score += table[sq]
+    kings = PIECE_SQUARE
+    if is_endgame(board):
+        kings = KING_ENDGAME_SQUARE
+    for code in _KING_CODES:
+        king = bitboards[code]
+        if king:
+            score += kings[code][king.bit_length() - 1]
+    return score if board.turn == WHITE else -score
+
+
+def non_pawn_material(board, colour):
+    total = 0
+    for kind in (KNIGHT, BISHOP, ROOK, QUEEN):
+        total += VALUES[KIND_NAMES[kind]] * bin(board.bitboards[piece_code(colour, kind)]).count("1")
+    return total
+
+
+def is_endgame(board):
+    return non_pawn_material(board, WHITE) <= ENDGAME_MATERIAL and non_pawn_material(board, BLACK) <= ENDGAME_MATERIAL
@@ -1,7 +1,5 @@
-import pygame
-from constants import BLACK, WHITE, SQUARE_SIZE, BLUE
+from constants import BLACK, WHITE, FILES, SQUARE_SIZE
 from board import Board
-from constants import RANKS, FILES
 
 
 class Game:
@@ -12,119 +10,123 @@ class Game:
         self.win = win
         self.turn = WHITE
         self.is_it_check = False
+        # (result, reason) once the game is over, see Board.outcome
+        self.outcome = None
         self.lastMove = None
+        # colour -> (engine, search limits) for each side the computer plays
+        self.engines = {}
+        # the render.BoardView that keeps track of what is on screen, made the first time the game is drawn
+        self.view = None
+        # the width of a square on screen in pixels
+        self.square_size = SQUARE_SIZE
+        # a book.OpeningBook the engines play from while the game is in it
+        self.book = None
+        # a tablebase.Tablebases that ends the game once it reaches a position they decide
+        self.tablebases = None
 
     def _init(self):
         self.selected = None
         self.board = Board()
         self.valid_moves = {}
 
+    def set_fen(self, fen):
+        """Starts the game from the position in a FEN string, including whose turn it is and any en passant capture."""
+        self.board.set_fen(fen)
+        self.turn = self.board.turn
+        self.lastMove = self.board.last_move
+        self.is_it_check = self.board.isCheck(WHITE if self.turn == BLACK else BLACK, self.lastMove)
+        self.outcome = self.board.outcome(self.tablebases)
+        self.right_click()
+
     def right_click(self):
         self.selected = None
         self.valid_moves = {}
 
     def update(self):
-        highlight_square = self.selected
-        self.board.draw_pieces(self.win, highlight_square)
-        self.board.copyBoard = self.board.board[:]
-        self.draw_valid_moves(self.valid_moves)
-        pygame.display.update()
+        """Draws the squares that have changed since the last update and puts just those on the display."""
+        import pygame
+        import render
+        if self.view is None:
+            self.view = render.BoardView(self.square_size)
+        dirty = self.view.draw(self.win, self.board, self.selected, self.valid_moves)
+        if dirty:
+            pygame.display.update(dirty)
+
+    def redraw(self):
+        """Makes the next update draw the whole board again."""
+        if self.view is not None:
+            self.view.invalidate()
+
+    def resize(self, square_size):
+        """Draws the board with squares of a new size from the next update on."""
+        self.square_size = square_size
+        if self.view is not None:
+            self.view.resize(square_size)
 
-    def select(self, rank, file):
+    def select(self, rank, file, promotion=None):
+        """Selects a piece, or moves the selected piece to the square. A pawn reaching the last rank becomes
+        promotion ("queen", "rook", "bishop" or "knight") if given, otherwise the player is asked on the terminal.
+        """
+        if self.turn in self.engines or self.outcome:
+            return False
         if self.selected:
             if self.selected.colour == self.turn:
-                self.valid_moves = self.board.get_valid_moves(self.selected, self.lastMove)
-                result = self._move(rank, file)
+                # valid_moves still holds the selected piece's moves from when it was picked
+                result = self._move(rank, file, promotion)
                 self.selected = None
                 if not result:
                     self.selected = None
                     self.valid_moves = {}
-                    self.select(rank, file)
+                    self.select(rank, file, promotion)
         elif self.selected is None:
             piece = self.board.get_piece(rank, file)
             if piece != 0 and piece.colour == self.turn:
                 self.selected = piece
-                self.valid_moves = self.board.get_valid_moves(self.selected, self.lastMove)
+                self.valid_moves = self.legal_valid_moves(self.selected)
             elif piece == 0:
                 self.selected = None
         return False
 
-    def _move(self, rank, file):
+    def legal_valid_moves(self, piece):
+        """The squares from get_valid_moves that the piece can move to without leaving its king in check,
+        so the dots shown are only the moves that can really be played.
+        """
+        start = piece.rank * FILES + piece.file
+        ends = {move[1] for move in self.board.legal_moves() if move[0] == start}
+        return {(rank, file): tag for (rank, file), tag in self.board.get_valid_moves(piece, self.lastMove).items()
+                if rank * FILES + file in ends}
+
+    def _move(self, rank, file, promotion=None):
+        if (rank, file) not in self.valid_moves:
+            return False
         new_sq = self.board.get_piece(rank, file)
-        if new_sq == 0 and (rank, file) in self.valid_moves:
-            if self.valid_moves[(rank, file)] == "shortCastle":
-                if self.board.isCheck(WHITE if self.turn == BLACK else BLACK, self.lastMove):
-                    return False
-                if self.board.short_castle_through_check(self.selected.colour, self.lastMove):
-                    return False
-                else:
-                    result = self.board.shortCastle(self.selected, rank, file, self.lastMove)
-                    if result:
-                        self.lastMove = None
-                        self.change_turn()
-                    else:
-                        return False
-            elif self.valid_moves[(rank, file)] == "longCastle":
-                if self.board.isCheck(WHITE if self.turn == BLACK else BLACK, self.lastMove):
-                    return False
-                if self.board.long_castle_through_check(self.selected.colour, self.lastMove):
-                    return False
-                else:
-                    result = self.board.longCastle(self.selected, rank, file, self.lastMove)
-                    if result:
-                        self.lastMove = None
-                        self.change_turn()
-                    else:
-                        return False
-            elif self.valid_moves[(rank, file)] == "pawnTwoSpaces":
-                result = self.board.move(self.selected, rank, file, self.lastMove)
-                if result:
-                    self.lastMove = (rank, file)
-                    self.change_turn()
-                    return True
-                else:
-                    return False
-            elif self.valid_moves[(rank, file)] == "en passant":
-                result = self.board.enPassant(self.selected, rank, file, self.selected.colour, self.lastMove)
-                if result:
-                    self.lastMove = None
-                    self.change_turn()
-                else:
-                    return False
-            elif self.valid_moves[(rank, file)] == "promotion":
-                result = self.board.pawn_promotion(self.selected, rank, file, self.lastMove)
-                if result:
-                    self.lastMove = None
-                    self.change_turn()
-                else:
-                    return False
-            else:
-                result = self.board.move(self.selected, rank, file, self.lastMove)
-                if result:
-                    self.lastMove = None
-                    self.change_turn()
-                else:
-                    return False
-        elif new_sq != 0 and (rank, file) in self.valid_moves:
-            if self.valid_moves[(rank, file)] == "promotion":
-                result = self.board.pawn_promotion(self.selected, rank, file, self.lastMove)
-                if result:
-                    self.lastMove = None
-                    self.change_turn()
-                else:
-                    return False
-            elif new_sq.colour != self.selected.colour:
-                result = self.board.capture_piece(self.selected, rank, file, self.lastMove)
-                if result:
-                    self.lastMove = None
-                    self.change_turn()
-                else:
-                    return False
-            else:
+        tag = self.valid_moves[(rank, file)]
+        if tag == "shortCastle":
+            if self.board.isCheck(WHITE if self.turn == BLACK else BLACK, self.lastMove):
                 return False
+            if self.board.short_castle_through_check(self.selected.colour, self.lastMove):
+                return False
+            result = self.board.shortCastle(self.selected, rank, file, self.lastMove)
+        elif tag == "longCastle":
+            if self.board.isCheck(WHITE if self.turn == BLACK else BLACK, self.lastMove):
+                return False
+            if self.board.long_castle_through_check(self.selected.colour, self.lastMove):
+                return False
+            result = self.board.longCastle(self.selected, rank, file, self.lastMove)
+        elif tag == "en passant":
+            result = self.board.enPassant(self.selected, rank, file, self.selected.colour, self.lastMove)
+        elif tag == "promotion":
+            result = self.board.pawn_promotion(self.selected, rank, file, self.lastMove, promotion)
+        elif new_sq == 0:
+            result = self.board.move(self.selected, rank, file, self.lastMove)
+        elif new_sq.colour != self.selected.colour:
+            result = self.board.capture_piece(self.selected, rank, file, self.lastMove)
         else:
             return False
-        return True
+        if result:
+            self.lastMove = self.board.last_move
+            self.change_turn()
+        return result
 
     def change_turn(self):
         if self.turn == WHITE:
@@ -133,10 +135,58 @@ class Game:
         else:
             self.is_it_check = self.board.isCheck(BLACK, self.lastMove)
             self.turn = WHITE
+        self.outcome = self.board.outcome(self.tablebases)
         self.valid_moves = {}
 
+    def play(self, move):
+        """Plays a (start, end, tag, promotion) move that didn't come from the mouse, if it is legal."""
+        if move not in self.board.legal_moves():
+            return False
+        self.board.make_move(move)
+        self.lastMove = self.board.last_move
+        self.change_turn()
+        self.selected = None
+        return True
+
+    def set_engine(self, colour, engine, **limits):
+        """Lets an engine play one colour. The limits are passed on to Engine.search, e.g. movetime=1 or depth=4."""
+        self.engines[colour] = (engine, limits)
+
+    def set_book(self, book):
+        """Has the engines play moves from an opening book, when there are any, before they search."""
+        self.book = book
+
+    def set_tablebases(self, tablebases):
+        """Ends the game as soon as the tablebases know how it will end, as a tablebase win or draw."""
+        self.tablebases = tablebases
+        self.outcome = self.board.outcome(tablebases)
+
+    def engine_to_move(self):
+        return self.turn in self.engines and not self.outcome
+
+    def engine_move(self):
+        """Has the engine for the side to move choose and play its move. Returns the move, or None if there isn't one."""
+        engine, limits = self.engines[self.turn]
+        move = self.book.choose(self.board) if self.book is not None else None
+        if move is None:
+            move, stats = engine.search(self.board, **limits)
+        if move is not None:
+            self.play(move)
+        return move
+
+    def takeback(self):
+        """Takes back the last move played, restoring the board, the side to move and the en passant state."""
+        if not self.board.history:
+            return False
+        self.board.unmake_move()
+        self.turn = self.board.turn
+        self.lastMove = self.board.last_move
+        self.is_it_check = self.board.isCheck(WHITE if self.turn == BLACK else BLACK, self.lastMove)
+        self.outcome = self.board.outcome(self.tablebases)
+        self.right_click()
+        return True
+
     def draw_valid_moves(self, moves):
-        for move in moves:
-            rank, file = move
-            pygame.draw.circle(self.win, BLUE, (file * SQUARE_SIZE + SQUARE_SIZE // 2, rank * SQUARE_SIZE + SQUARE_SIZE // 2), 15)
+        import render
+        render.draw_valid_moves(self.win, moves, self.square_size)
 
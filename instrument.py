@@ -0,0 +1,223 @@
+"""
+This file measures where the time goes in the rules and the game, when asked to. Nothing is counted until enable()
+is called: it swaps the methods it watches for copies that count and time each call, and disable() puts the originals
+back, so the rest of the time they run exactly as written, with no checks for whether to count.
+
+    import instrument
+    instrument.enable()
+    ...  play, serve or replay some games
+    print(instrument.report())
+
+What is watched:
+    Board.make_move, Board.unmake_move calls and time, the moves of the GUI and the engine's search
+    Board.legal_moves                  calls and time, including the calls answered from the move cache
+    Board._legal_moves                 calls and time, working the legal moves out when they aren't cached
+    Board.is_legal                     calls and time, and how many moves it rejected for leaving the king in check
+    Board.isCheck                      calls and time
+    Board.get_valid_moves              calls, per piece type
+    Board.move, Board.capture_piece    calls, the moves made by clicking
+    Game.select                        time per click
+    Game.update                        time per frame
+
+A method that calls itself, directly or through others, is timed once, for its outermost call. Each thread keeps
+track of its own calls, so the UCI search thread or the server's threads don't hide each other's.
+
+stats() returns the same as a dict. profiling(path) runs a block under cProfile and writes the results to a .prof file,
+which pstats reads, snakeviz draws as an icicle chart and flameprof turns into a flame graph.
+"""
+import contextlib
+import cProfile
+import functools
+import pstats
+import sys
+import threading
+import time
+from piece import KIND_NAMES
+
+_counters = {}
+_timers = {}
+# (class, method name) -> the original function, while enabled
+_originals = {}
+
+
+class Timer:
+    """The number of calls to something and the time they took, in seconds."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        if seconds > self.longest:
+            self.longest = seconds
+
+    def as_dict(self):
+        return {"calls": self.calls, "total": self.total, "mean": self.total / self.calls if self.calls else 0.0,
+                "max": self.longest}
+
+
+def _count(name):
+    _counters[name] = _counters.get(name, 0) + 1
+
+
+def _timer(name):
+    timer = _timers.get(name)
+    if timer is None:
+        timer = _timers[name] = Timer()
+    return timer
+
+
+# ---------------------------
+# The wrapped copies of the methods
+def _timed(name, original):
+    timer = _timer(name)
+    clock = time.perf_counter
+    # whether the method is already running in this thread, so the calls it makes to itself aren't counted again
+    running = threading.local()
+
+    @functools.wraps(original)
+    def timed(*args, **kwargs):
+        if getattr(running, "active", False):
+            return original(*args, **kwargs)
+        running.active = True
+        started = clock()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            timer.add(clock() - started)
+            running.active = False
+    return timed
+
+
+def _timed_generator(name, original):
+    """For generators, which run a step at a time: the time of every step is added up into one call,
+    however many of the items the caller takes.
+    """
+    timer = _timer(name)
+    clock = time.perf_counter
+
+    @functools.wraps(original)
+    def timed(*args, **kwargs):
+        elapsed = 0.0
+        started = clock()
+        try:
+            for item in original(*args, **kwargs):
+                elapsed += clock() - started
+                yield item
+                started = clock()
+            elapsed += clock() - started
+        finally:
+            timer.add(elapsed)
+    return timed
+
+
+def _counted_by_piece(name, original):
+    @functools.wraps(original)
+    def counted(self, piece, *args, **kwargs):
+        _count(f"{name}.{KIND_NAMES[piece.kind]}")
+        return original(self, piece, *args, **kwargs)
+    return counted
+
+
+def _counted(name, original):
+    @functools.wraps(original)
+    def counted(*args, **kwargs):
+        _count(name)
+        return original(*args, **kwargs)
+    return counted
+
+
+def _legality_test(name, original):
+    """For is_legal, which makes a move to see whether it leaves the king in check: timed, and its rejections counted."""
+    timed = _timed(name, original)
+
+    @functools.wraps(original)
+    def test(*args, **kwargs):
+        legal = timed(*args, **kwargs)
+        if not legal:
+            _count(name + ".rejected")
+        return legal
+    return test
+
+
+def _watched():
+    from board import Board
+    from game import Game
+    return [
+        (Board, "make_move", _timed),
+        (Board, "unmake_move", _timed),
+        (Board, "legal_moves", _timed),
+        (Board, "_legal_moves", _timed_generator),
+        (Board, "is_legal", _legality_test),
+        (Board, "isCheck", _timed),
+        (Board, "get_valid_moves", _counted_by_piece),
+        (Board, "move", _counted),
+        (Board, "capture_piece", _counted),
+        (Game, "select", _timed),
+        (Game, "update", _timed),
+    ]
+
+
+def enable():
+    """Starts counting. The counts carry on from where they were, use reset() to start again from zero."""
+    for cls, name, wrapper in _watched():
+        if (cls, name) not in _originals:
+            original = cls.__dict__[name]
+            _originals[cls, name] = original
+            setattr(cls, name, wrapper(f"{cls.__name__}.{name}", original))
+
+
+def disable():
+    """Stops counting and puts the original methods back. The counts so far are kept."""
+    for (cls, name), original in _originals.items():
+        setattr(cls, name, original)
+    _originals.clear()
+
+
+def enabled():
+    return bool(_originals)
+
+
+def reset():
+    _counters.clear()
+    for timer in _timers.values():
+        timer.__init__()
+
+
+def stats():
+    """The counts and timings so far: {"counters": {name: count}, "timers": {name: {calls, total, mean, max}}}."""
+    return {
+        "counters": dict(sorted(_counters.items())),
+        "timers": {name: timer.as_dict() for name, timer in sorted(_timers.items()) if timer.calls},
+    }
+
+
+def report():
+    """The stats as a table of text."""
+    current = stats()
+    lines = []
+    for name, count in current["counters"].items():
+        lines.append(f"{name:<36} {count:>10}")
+    for name, timer in current["timers"].items():
+        lines.append(f"{name:<36} {timer['calls']:>10} calls  {timer['total']:8.3f}s total  "
+                     f"{timer['mean'] * 1e6:9.1f}us mean  {timer['max'] * 1e3:8.2f}ms max")
+    return "\n".join(lines) if lines else "nothing counted"
+
+
+# ---------------------------
+@contextlib.contextmanager
+def profiling(path=None, sort="cumulative", limit=30, stream=sys.stderr):
+    """Profiles the block with cProfile, writes the stats to path if given and prints the top entries to stream."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        if stream:
+            pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
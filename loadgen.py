@@ -0,0 +1,73 @@
+"""
+This file is a load generator for server.py. It opens a number of sessions at once, each playing random legal moves
+(and, if asked, letting the engine reply), and reports how long the server took to answer each move.
+
+    python server.py &
+    python loadgen.py --sessions 200 --moves 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from server import DEFAULT_PORT
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def _request(reader, writer, message):
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def run_session(host, port, moves, engine_depth, rng, latencies, engine_latencies):
+    """Plays moves random moves in one session, starting a new game whenever one ends."""
+    reader, writer = await asyncio.open_connection(host, port)
+    state = await _request(reader, writer, {"type": "new"})
+    for _ in range(moves):
+        if state["status"] != "playing":
+            state = await _request(reader, writer, {"type": "new"})
+        started = time.perf_counter()
+        state = await _request(reader, writer, {"type": "move", "move": rng.choice(state["legal_moves"])})
+        latencies.append(time.perf_counter() - started)
+        if engine_depth and state["status"] == "playing":
+            started = time.perf_counter()
+            state = await _request(reader, writer, {"type": "engine", "depth": engine_depth})
+            engine_latencies.append(time.perf_counter() - started)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(host, port, sessions, moves, engine_depth, seed):
+    latencies = []
+    engine_latencies = []
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(host, port, moves, engine_depth, random.Random(rng.random()), latencies, engine_latencies)
+                           for _ in range(sessions)))
+    seconds = time.perf_counter() - started
+    print(f"{sessions} sessions, {len(latencies)} moves in {seconds:.2f}s, {len(latencies) / seconds:.0f} moves/s")
+    for name, values in (("move", latencies), ("engine", engine_latencies)):
+        if values:
+            print(f"{name} response  p50 {percentile(values, 0.5) * 1000:.1f}ms  p90 {percentile(values, 0.9) * 1000:.1f}ms"
+                  f"  p99 {percentile(values, 0.99) * 1000:.1f}ms  max {max(values) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how quickly server.py answers many sessions at once.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--sessions", type=int, default=100, help="sessions to run at the same time")
+    parser.add_argument("--moves", type=int, default=40, help="moves each session plays")
+    parser.add_argument("--engine-depth", type=int, default=0, help="have the engine reply to each move at this depth")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args.host, args.port, args.sessions, args.moves, args.engine_depth, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,48 +3,122 @@ Author: Leo Clough
 Program: A playable game of chess that follows all the rules of the game.
 Date Finished: 15/03/2022
 """
+import argparse
 import pygame
-from constants import HEIGHT, WIDTH, SQUARE_SIZE
+import instrument
+from constants import HEIGHT, WIDTH, RANKS, FILES, WHITE, BLACK
 from game import Game
 
 # --------------- SET UP ---------------
 # A few basic parts of setting up the game
-FPS = 60
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
+WIN = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
 LEFT = 1
 RIGHT = 3
 pygame.display.set_caption("Chess")
 
 
 # --------------- FUNCTIONS ---------------
-def get_rank_file_from_mouse(pos):
+def get_rank_file_from_mouse(pos, square_size):
     x, y = pos
-    rank = y // SQUARE_SIZE
-    file = x // SQUARE_SIZE
+    rank = y // square_size
+    file = x // square_size
     return rank, file
 
 
-def main():
-    run = True
-    clock = pygame.time.Clock()
-    game = Game(WIN)
+def show_outcome(game):
+    """Puts the result in the window title once the game is over, and takes it away again after a takeback."""
+    if game.outcome:
+        result, reason = game.outcome
+        caption = f"Chess - {reason}, {result}"
+    else:
+        caption = "Chess"
+    if pygame.display.get_caption()[0] != caption:
+        pygame.display.set_caption(caption)
 
+
+def play(game):
+    """Runs the window until it is closed."""
+    run = True
+    # Only wake up for the events the game uses, so moving the mouse about doesn't redraw anything
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN, pygame.VIDEOEXPOSE,
+                              pygame.VIDEORESIZE])
+    game.update()
     while run:
-        clock.tick(FPS)
-        for event in pygame.event.get():
+        if game.engine_to_move():
+            events = pygame.event.get()
+        else:
+            # sleep until something happens instead of drawing frames nobody needs
+            events = [pygame.event.wait()] + pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
                 run = False
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == LEFT:
+            elif event.type == pygame.VIDEOEXPOSE:  # the window was uncovered, so draw all of it again
+                game.redraw()
+            elif event.type == pygame.VIDEORESIZE:  # the board fills as much of the new window as it can
+                game.win = pygame.display.get_surface()
+                game.resize(max(1, min(event.w, event.h) // RANKS))
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == LEFT:
                 pos = pygame.mouse.get_pos()
-                rank, file = get_rank_file_from_mouse(pos)
-                game.select(rank, file)
+                rank, file = get_rank_file_from_mouse(pos, game.square_size)
+                if rank < RANKS and file < FILES:
+                    game.select(rank, file)
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == RIGHT:  # Allows user to reset choice
                 game.right_click()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_BACKSPACE:  # Takes back the last move
+                game.takeback()
+                if game.engine_to_move() and len(game.engines) == 1:  # and the move before, if it was the computer's
+                    game.takeback()
 
         game.update()
-        pygame.display.update()
+        if game.engine_to_move() and run:
+            game.engine_move()
+            game.update()
+        show_outcome(game)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play chess.")
+    parser.add_argument("--engine", choices=["white", "black", "both"], help="let the computer play a side")
+    parser.add_argument("--movetime", type=float, default=1.0, help="seconds the computer thinks for per move")
+    parser.add_argument("--workers", type=int, default=1, help="processes the computer searches with")
+    parser.add_argument("--book", help="an opening book for the computer to play from, see book.py")
+    parser.add_argument("--tablebases", help="a directory of endgame tables, see tablebase.py")
+    parser.add_argument("--stats", action="store_true", help="count the calls to the rules and print them at the end")
+    parser.add_argument("--profile", help="profile the game with cProfile and write the stats to this file")
+    args = parser.parse_args()
+
+    game = Game(WIN)
+    tablebases = None
+    if args.tablebases:
+        from tablebase import Tablebases
+        tablebases = Tablebases(args.tablebases)
+        game.set_tablebases(tablebases)
+    if args.engine:
+        if args.workers > 1:
+            from parallel import ParallelEngine
+            engine = ParallelEngine(args.workers, tablebases=tablebases)
+        else:
+            from engine import Engine
+            engine = Engine(tablebases=tablebases)
+        if args.book:
+            from book import OpeningBook
+            game.set_book(OpeningBook(args.book))
+        if args.engine in ("white", "both"):
+            game.set_engine(WHITE, engine, movetime=args.movetime)
+        if args.engine in ("black", "both"):
+            game.set_engine(BLACK, engine, movetime=args.movetime)
 
+    if args.stats:
+        instrument.enable()
+    if args.profile:
+        with instrument.profiling(args.profile):
+            play(game)
+    else:
+        play(game)
     pygame.quit()
+    if args.stats:
+        print(instrument.report())
 
 
 # --------------- MAIN ---------------
@@ -0,0 +1,127 @@
+"""
+This file stores positions in a fixed 32 bytes each, so files of millions of positions can be read from anywhere
+without parsing everything before it. A position is laid out as:
+
+    bytes 0-7     which squares are occupied, a little-endian 64-bit bitboard numbered as in bitboard.py
+    bytes 8-23    a 4-bit code for each occupied square, lowest square first, two to a byte, low half first.
+                  which are the piece codes of piece.py: 1 to 6 for a white pawn, knight, bishop, rook, queen and king,
+                  9 to 14 the same for black
+    byte 24       bit 0 set when black is to move, bits 1-4 the castling rights as in board.py
+    byte 25       the file of the pawn that has just moved two spaces plus 1, or 0 if there isn't one
+    byte 26       the halfmove clock, up to 255
+    bytes 27-28   the fullmove number, little-endian
+    bytes 29-31   unused, always 0
+
+A legal position has at most 32 pieces, so they always fit in the 16 bytes of codes.
+"""
+import mmap
+import struct
+from constants import WHITE, BLACK, RANKS, FILES
+from bitboard import squares
+from piece import PIECE_CODES
+
+POSITION_BYTES = 32
+_LAYOUT = struct.Struct("<Q16sBBBH3x")
+
+
+def pack(board):
+    """Returns the 32 bytes for a Board's position."""
+    codes = [0] * (RANKS * FILES)
+    occupied = 0
+    for code in PIECE_CODES:
+        bitboard = board.bitboards[code]
+        occupied |= bitboard
+        for sq in squares(bitboard):
+            codes[sq] = code
+    nibbles = [codes[sq] for sq in squares(occupied)]
+    if len(nibbles) > 32:
+        raise ValueError("a position with more than 32 pieces can't be packed")
+    nibbles += [0] * (32 - len(nibbles))
+    pieces = bytes(nibbles[index] | nibbles[index + 1] << 4 for index in range(0, 32, 2))
+    flags = (board.turn == BLACK) | board.castling_rights << 1
+    en_passant = board.last_move[1] + 1 if board.last_move is not None else 0
+    return _LAYOUT.pack(occupied, pieces, flags, en_passant, min(board.halfmove_clock, 255), board.fullmove_number)
+
+
+def unpack_position(data):
+    """Decodes 32 bytes into the arguments of Board.set_position:
+    ((square, piece code) pieces, turn, castling rights, last move, halfmove clock, fullmove number).
+    """
+    occupied, pieces_bytes, flags, en_passant, halfmove_clock, fullmove_number = _LAYOUT.unpack(data)
+    pieces = []
+    for index, sq in enumerate(squares(occupied)):
+        code = pieces_bytes[index >> 1] >> (index & 1) * 4 & 15
+        pieces.append((sq, code))
+    turn = BLACK if flags & 1 else WHITE
+    last_move = None
+    if en_passant:
+        # the pawn that moved two spaces belongs to the side not to move, so it stands on that side's fourth rank
+        last_move = (4 if turn == BLACK else 3, en_passant - 1)
+    return pieces, turn, flags >> 1 & 15, last_move, halfmove_clock, fullmove_number
+
+
+def unpack(data, board=None):
+    """Returns a Board set up from 32 bytes, reusing board if one is given to save building a new one."""
+    if board is None:
+        from board import Board
+        board = Board()
+    board.set_position(*unpack_position(data))
+    return board
+
+
+def write_positions(path, boards):
+    """Writes the positions of a sequence of Boards to a file, 32 bytes each, and returns how many were written."""
+    count = 0
+    with open(path, "wb") as file:
+        for board in boards:
+            file.write(pack(board))
+            count += 1
+    return count
+
+
+class PositionFile:
+    """Reads a file of packed positions by memory-mapping it, so only the pages that are read are loaded
+    and any position can be reached straight away by its index.
+    raw(index) returns a memoryview onto the file's bytes without copying them, and file[index] a Board.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.size = self.file.seek(0, 2)
+        if self.size % POSITION_BYTES:
+            self.file.close()
+            raise ValueError(f"{path} is not a whole number of {POSITION_BYTES} byte positions")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.view = memoryview(self.map) if self.map is not None else memoryview(b"")
+
+    def __len__(self):
+        return self.size // POSITION_BYTES
+
+    def raw(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("position index out of range")
+        return self.view[index * POSITION_BYTES:(index + 1) * POSITION_BYTES]
+
+    def __getitem__(self, index):
+        return unpack(self.raw(index))
+
+    def __iter__(self):
+        """Yields every position in turn, all set up on the same Board, which changes as the next one is read."""
+        board = None
+        for index in range(len(self)):
+            board = unpack(self.raw(index), board)
+            yield board
+
+    def close(self):
+        self.view.release()
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
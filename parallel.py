@@ -0,0 +1,201 @@
+"""
+This file spreads the engine's search over several processes, one Engine in each, so it can use more than one core.
+Python threads all share one core for Python code, so the workers have to be processes.
+
+The search splits at the root. Each depth of the iterative deepening hands the root moves out one at a time,
+best move from the last depth first, to whichever worker is free. The workers send back a score per move,
+and the best score so far becomes the alpha for every move handed out after it, so later moves are searched
+with the same cut-offs a single engine would have. Every worker keeps its own transposition table between moves
+and searches, so they share results by passing scores back, not through a shared table.
+"""
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+from engine import Engine, INFINITY, MATE, MATE_BOUND, MAX_PLY, unsearched_stats, tablebase_score
+from constants import WHITE, BLACK
+
+# how far below the last depth's score the first moves of the next depth are searched from.
+# If every move scores below it, the depth is searched again from -INFINITY
+WINDOW = 50
+
+
+def _worker(connection, stop_event, hash_mb):
+    """Runs in each worker process: searches root moves until it is sent None."""
+    engine = Engine(hash_mb)
+    engine.stop_event = stop_event
+    search_id = None
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        task_search_id, board, move, depth, alpha, movetime, nodes = task
+        if task_search_id != search_id:
+            search_id = task_search_id
+            engine.tt.new_search()
+            engine.history = [value // 8 for value in engine.history]
+        probes, hits = engine.tt.probes, engine.tt.hits
+        score = engine.search_move(board, move, depth, alpha, movetime, nodes)
+        pv = [move]
+        if score is not None and score > alpha:
+            board.make_move(move)
+            pv += engine._principal_variation(board, depth - 1)
+            board.unmake_move()
+        connection.send((move, score, engine.nodes, engine.tt.probes - probes, engine.tt.hits - hits, pv))
+    connection.close()
+
+
+class ParallelEngine:
+    """Chooses moves the same way as Engine, with search() and stop() that work the same,
+    but searches with a number of worker processes, by default one per core. Call close() when done with it.
+    """
+
+    def __init__(self, workers=None, hash_mb=16, book=None, tablebases=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        # the opening book and the tablebases are only probed here, at the root, not by the workers
+        self.book = book
+        self.tablebases = tablebases
+        self.stop_event = multiprocessing.Event()
+        self.connections = []
+        self.processes = []
+        self.search_id = 0
+        for _ in range(self.workers):
+            parent_end, child_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, args=(child_end, self.stop_event, hash_mb), daemon=True)
+            process.start()
+            child_end.close()
+            self.connections.append(parent_end)
+            self.processes.append(process)
+
+    def stop(self):
+        """Asks a running search to stop. Safe to call from another thread."""
+        self.stop_event.set()
+
+    def close(self):
+        """Shuts the worker processes down."""
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def search(self, board, depth=None, movetime=None, nodes=None, info=None):
+        """Searches the board's position and returns (best move, stats), with the same limits and stats as Engine.
+        nodes counts the nodes of all the workers together.
+        """
+        if depth is not None and depth < 1:
+            raise ValueError(f"the depth must be at least 1, not {depth}")
+        book_move = self.book.choose(board) if self.book is not None else None
+        if book_move is not None:
+            return book_move, unsearched_stats(book_move, "book")
+        found = self.tablebases.best_move(board) if self.tablebases is not None else None
+        if found is not None:
+            return found[0], unsearched_stats(found[0], "tablebase", tablebase_score(*found[1]))
+        if depth is None and movetime is None and nodes is None:
+            depth = 4
+        max_depth = MAX_PLY - 1 if depth is None else min(depth, MAX_PLY - 1)
+        started = time.perf_counter()
+        self.deadline = started + movetime if movetime is not None else None
+        self.node_limit = nodes
+        self.nodes = 0
+        self.probes = 0
+        self.hits = 0
+        self.stop_event.clear()
+        self.search_id += 1
+
+        root_moves = board.legal_moves()
+        best_move = root_moves[0] if root_moves else None
+        stats = {"depth": 0, "score": 0, "nodes": 0, "seconds": 0.0, "nps": 0, "ebf": 0.0, "tt_hit_rate": 0.0, "pv": []}
+        previous_nodes = 0
+        score = 0
+        for current_depth in range(1, max_depth + 1):
+            if not root_moves:
+                enemy = WHITE if board.turn == BLACK else BLACK
+                stats["score"] = -MATE if board.isCheck(enemy, board.last_move) else 0
+                break
+            nodes_before = self.nodes
+            alpha = score - WINDOW if current_depth > 1 else -INFINITY
+            result = self._root(board, root_moves, current_depth, alpha)
+            if result is not None and result[0] <= alpha:
+                # every move failed low, so none of the scores are exact
+                result = self._root(board, root_moves, current_depth, -INFINITY)
+            if result is None:
+                break
+            score, best_move, pv = result
+            root_moves.remove(best_move)
+            root_moves.insert(0, best_move)
+            iteration_nodes = self.nodes - nodes_before
+            seconds = time.perf_counter() - started
+            stats = {
+                "depth": current_depth,
+                "score": score,
+                "nodes": self.nodes,
+                "seconds": seconds,
+                "nps": int(self.nodes / seconds) if seconds else 0,
+                "ebf": iteration_nodes / previous_nodes if previous_nodes else 0.0,
+                "tt_hit_rate": self.hits / self.probes if self.probes else 0.0,
+                "pv": pv,
+            }
+            previous_nodes = iteration_nodes
+            if info:
+                info(stats)
+            if abs(score) > MATE_BOUND or len(root_moves) == 1 and movetime is not None:
+                break
+        stats["nodes"] = self.nodes
+        stats["seconds"] = time.perf_counter() - started
+        stats["nps"] = int(self.nodes / stats["seconds"]) if stats["seconds"] else 0
+        return best_move, stats
+
+    # ---------------------------
+    def _root(self, board, moves, depth, alpha):
+        """Searches every root move to depth across the workers.
+        Returns (score, best move, pv), or None if the search was stopped before every move was searched.
+        """
+        pending = list(moves)
+        idle = list(self.connections)
+        busy = {}
+        best_score = alpha
+        best_move = None
+        best_pv = []
+        stopped = False
+        while busy or pending and not stopped:
+            while pending and idle and not stopped:
+                connection = idle.pop()
+                move = pending.pop(0)
+                movetime = self.deadline - time.perf_counter() if self.deadline is not None else None
+                nodes = self.node_limit - self.nodes if self.node_limit is not None else None
+                connection.send((self.search_id, board, move, depth, best_score, movetime, nodes))
+                busy[connection] = move
+            # once stopped, the stop has been sent, so just wait for the workers to answer it
+            timeout = None
+            if self.deadline is not None and not stopped:
+                timeout = max(0.0, self.deadline - time.perf_counter())
+            ready = wait(list(busy), timeout)
+            if not ready:
+                # out of time: the workers will see the event at their next limit check and answer with None
+                self.stop_event.set()
+                stopped = True
+                continue
+            for connection in ready:
+                move, score, nodes, probes, hits, pv = connection.recv()
+                del busy[connection]
+                idle.append(connection)
+                self.nodes += nodes
+                self.probes += probes
+                self.hits += hits
+                if score is None or self.stop_event.is_set():
+                    stopped = True
+                    self.stop_event.set()
+                elif score > best_score:
+                    best_score = score
+                    best_move = move
+                    best_pv = pv
+            if self.node_limit is not None and self.nodes >= self.node_limit:
+                stopped = True
+                self.stop_event.set()
+        if stopped:
+            return None
+        if best_move is None:
+            return best_score, moves[0], [moves[0]]
+        return best_score, best_move, best_pv
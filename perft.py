@@ -0,0 +1,148 @@
+"""
+Perft counts every leaf node of the legal move tree to a fixed depth. The counts for the reference positions below
+are known exactly, so it checks the move generator and the legality rules, and timing it measures their speed.
+
+Run the whole suite:                  python perft.py
+One position, split by first move:    python perft.py --fen "<fen>" --depth 3 --divide
+"""
+import argparse
+import sys
+import time
+from board import Board, STARTING_FEN, move_name
+
+# (name, fen, {depth: nodes}). The edge cases come from the well known perft test suites, each with its published
+# deep count, plus shallow counts so that a quick run still covers every one of them.
+REFERENCE_POSITIONS = [
+    ("initial position", STARTING_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("rook endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("promotions and castling", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("promotion by capture", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ("symmetrical middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ("illegal en passant", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", {1: 18, 2: 92, 3: 1670, 6: 1134888}),
+    ("en passant pinned", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", {1: 13, 2: 102, 3: 1266, 6: 1015133}),
+    ("en passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", {1: 15, 2: 126, 3: 1928, 6: 1440467}),
+    ("short castle gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", {1: 15, 2: 66, 3: 1198, 6: 661072}),
+    ("long castle gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", {1: 16, 2: 71, 3: 1286, 6: 803711}),
+    ("castling rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", {1: 26, 2: 1141, 3: 27826, 4: 1274206}),
+    ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", {1: 44, 2: 1494, 3: 50509, 4: 1720476}),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", {1: 11, 2: 133, 3: 1442, 6: 3821001}),
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", {1: 29, 2: 165, 3: 5160, 5: 1004658}),
+    ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", {1: 9, 2: 40, 3: 472, 6: 217342}),
+    ("underpromote to give check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", {1: 6, 2: 27, 3: 273, 6: 92683}),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", {1: 2, 2: 6, 3: 13, 6: 2217}),
+    ("stalemate and checkmate", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", {1: 10, 2: 25, 3: 268, 7: 567584}),
+    ("stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", {1: 37, 2: 183, 3: 6559, 4: 23527}),
+]
+
+
+def perft(board, depth, timings=None):
+    """Counts the leaf nodes of the legal move tree below the board's position.
+    If a timings dict is passed, the count is made the slower way, generating pseudo-legal moves and testing each
+    by making it, and the seconds spent on each are added to its "generate" and "legality" entries.
+    """
+    if timings is not None:
+        return _perft_timed(board, depth, timings)
+    if depth == 0:
+        return 1
+    moves = board.generate_legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def _perft_timed(board, depth, timings):
+    if depth == 0:
+        return 1
+    clock = time.perf_counter
+    started = clock()
+    moves = board.generate_moves(board.turn, board.last_move)
+    generated = clock()
+    legal_moves = [move for move in moves if board.is_legal(move)]
+    timings["generate"] = timings.get("generate", 0) + generated - started
+    timings["legality"] = timings.get("legality", 0) + clock() - generated
+    if depth == 1:
+        return len(legal_moves)
+    nodes = 0
+    for move in legal_moves:
+        board.make_move(move)
+        nodes += _perft_timed(board, depth - 1, timings)
+        board.unmake_move()
+    return nodes
+
+
+def divide(board, depth):
+    """Returns the perft count below each legal first move, as a dict from move name to nodes."""
+    counts = {}
+    for move in board.legal_moves():
+        board.make_move(move)
+        counts[move_name(move)] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+
+def run_suite(max_depth, show_timings):
+    """Runs every reference position at the deepest known depth up to max_depth and prints counts and speed.
+    Returns False if any count is wrong.
+    """
+    all_correct = True
+    total_nodes = 0
+    total_seconds = 0
+    for name, fen, expected in REFERENCE_POSITIONS:
+        depth = max(known_depth for known_depth in expected if known_depth <= max_depth)
+        board = Board.from_fen(fen)
+        timings = {} if show_timings else None
+        started = time.perf_counter()
+        nodes = perft(board, depth, timings)
+        seconds = time.perf_counter() - started
+        correct = nodes == expected[depth]
+        all_correct = all_correct and correct
+        total_nodes += nodes
+        total_seconds += seconds
+        print(f"{name:<28} depth {depth}  nodes {nodes:>9}  {'ok' if correct else 'WRONG, expected ' + str(expected[depth])}"
+              f"  {seconds:7.2f}s  {nodes / seconds:>9,.0f} nodes/s")
+        if timings:
+            print(f"{'':<28} generation {timings['generate']:.2f}s  legality {timings['legality']:.2f}s")
+    print(f"total {total_nodes} nodes in {total_seconds:.2f}s, {total_nodes / total_seconds:,.0f} nodes/s")
+    return all_correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count or benchmark the legal move tree.")
+    parser.add_argument("--fen", help="position to count, instead of running the reference suite")
+    parser.add_argument("--depth", type=int, default=3, help="for the suite, the deepest depth to run")
+    parser.add_argument("--divide", action="store_true", help="print the count below each first move")
+    parser.add_argument("--timings", action="store_true", help="split the time between generation and legality")
+    args = parser.parse_args()
+
+    if args.fen is None:
+        sys.exit(0 if run_suite(args.depth, args.timings) else 1)
+
+    board = Board.from_fen(args.fen)
+    started = time.perf_counter()
+    if args.divide:
+        counts = divide(board, args.depth)
+        for name in sorted(counts):
+            print(name, counts[name])
+        nodes = sum(counts.values())
+        timings = None
+    else:
+        timings = {} if args.timings else None
+        nodes = perft(board, args.depth, timings)
+    seconds = time.perf_counter() - started
+    print(f"nodes {nodes}  {seconds:.2f}s  {nodes / seconds:,.0f} nodes/s")
+    if timings:
+        print(f"generation {timings['generate']:.2f}s  legality {timings['legality']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
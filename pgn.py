@@ -0,0 +1,227 @@
+"""
+This file reads and writes games in PGN, the standard text format for chess games.
+
+read_games goes through a file one line at a time and yields one PGNGame at a time, so an archive of any size is
+read in the memory of a single game. The moves are kept as the SAN text (e.g. "Nbd7", "exd6", "O-O", "e8=Q+")
+until the game is replayed, when each one is matched against the moves Board generates.
+write_game does the reverse, writing the moves played on a Board (or a Game's board) as SAN.
+"""
+import re
+from constants import WHITE
+from bitboard import square
+from board import Board, STARTING_FEN, square_name
+from piece import PAWN, KIND_NAMES, KINDS_BY_NAME, piece_code
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+# the order PGN lists its seven required tags in
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+SEVEN_TAG_DEFAULTS = {"Event": "?", "Site": "?", "Date": "????.??.??", "Round": "?", "White": "?", "Black": "?"}
+LINE_LENGTH = 80
+
+SAN_LETTERS = {"knight": "N", "bishop": "B", "rook": "R", "queen": "Q", "king": "K"}
+SAN_PIECES = {letter: piece_type for piece_type, letter in SAN_LETTERS.items()}
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_TOKEN = re.compile(r"\{[^}]*\}?|;[^\n]*|\$\d+|\(|\)|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s{};()$.]+")
+_SAN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+
+class IllegalMoveError(ValueError):
+    """Raised when a SAN move doesn't match exactly one legal move in the position."""
+
+
+class PGNGame:
+    """One game read from a PGN file: its tags, its moves as SAN text and its result."""
+
+    def __init__(self, headers, moves, result):
+        self.headers = headers
+        self.moves = moves
+        self.result = result
+
+    def start_board(self):
+        """A Board at the game's starting position, which is set by the FEN tag if the game has one."""
+        return Board.from_fen(self.headers["FEN"]) if "FEN" in self.headers else Board()
+
+    def positions(self, board=None):
+        """Replays the game, yielding (move, board) after each move is made. The same Board is yielded every time,
+        so copy what is needed from it before asking for the next position.
+        Raises IllegalMoveError at the first move that isn't legal.
+        """
+        if board is None:
+            board = self.start_board()
+        for text in self.moves:
+            move = parse_san(board, text)
+            board.make_move(move)
+            yield move, board
+
+
+def read_games(source):
+    """Yields a PGNGame for each game in a file, or in the file at a path, reading it one line at a time.
+    Comments, variations and annotation glyphs are skipped.
+    """
+    if isinstance(source, str):
+        with open(source, encoding="utf-8", errors="replace") as file:
+            yield from read_games(file)
+        return
+    headers = {}
+    movetext = []
+    in_comment = False
+    for line in source:
+        stripped = line.strip()
+        if not in_comment and stripped.startswith("["):
+            if movetext:
+                yield _parse_game(headers, movetext)
+                headers = {}
+                movetext = []
+            match = _TAG.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            continue
+        if stripped.startswith("%"):
+            continue
+        if stripped:
+            movetext.append(stripped)
+            # a comment in braces can run over several lines, and a '[' inside one isn't the start of a tag
+            for char in stripped:
+                if char == "{":
+                    in_comment = True
+                elif char == "}":
+                    in_comment = False
+                elif char == ";" and not in_comment:
+                    break
+    if headers or movetext:
+        yield _parse_game(headers, movetext)
+
+
+def _parse_game(headers, movetext):
+    moves = []
+    result = headers.get("Result", "*")
+    variation_depth = 0
+    for token in _TOKEN.findall("\n".join(movetext)):
+        first = token[0]
+        if first == "(":
+            variation_depth += 1
+        elif first == ")":
+            variation_depth -= 1
+        elif variation_depth or first in "{;$" or first.isdigit() and token.endswith("."):
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+    return PGNGame(headers, moves, result)
+
+
+def parse_san(board, text):
+    """Finds the legal move a SAN string stands for in the board's position."""
+    san_text = text.rstrip("+#!?")
+    colour = board.turn
+    if san_text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        tag = "shortCastle" if len(san_text) == 3 else "longCastle"
+        candidates = [move for move in board.generate_moves(colour, board.last_move) if move[2] == tag]
+    else:
+        match = _SAN.match(san_text)
+        if not match:
+            raise IllegalMoveError(f"can't read the move {text!r}")
+        letter, file, rank, target, promotion = match.groups()
+        code = piece_code(colour, KINDS_BY_NAME[SAN_PIECES[letter]] if letter else PAWN)
+        end = square(8 - int(target[1]), ord(target[0]) - ord("a"))
+        promotion = SAN_PIECES[promotion] if promotion else None
+        pieces = board.bitboards[code]
+        candidates = []
+        for move in board.generate_moves(colour, board.last_move):
+            start = move[0]
+            if move[1] != end or not pieces >> start & 1 or move[3] != promotion or move[2] in ("shortCastle", "longCastle"):
+                continue
+            name = square_name(start)
+            if file and name[0] != file or rank and name[1] != rank:
+                continue
+            candidates.append(move)
+    legal = [move for move in candidates if board.is_legal(move)]
+    if len(legal) != 1:
+        raise IllegalMoveError(f"{text!r} is {'ambiguous' if legal else 'not a legal move'} in {board.to_fen()}")
+    return legal[0]
+
+
+def san(board, move):
+    """Writes a legal move of the board's position in SAN, with + or # if it gives check or mate."""
+    start, end, tag, promotion = move
+    if tag == "shortCastle":
+        text = "O-O"
+    elif tag == "longCastle":
+        text = "O-O-O"
+    else:
+        piece = board.board[start >> 3][start & 7]
+        capture = board.board[end >> 3][end & 7] != 0 or tag == "en passant"
+        if piece.kind == PAWN:
+            text = (square_name(start)[0] + "x" if capture else "") + square_name(end)
+            if promotion:
+                text += "=" + SAN_LETTERS[promotion]
+        else:
+            text = SAN_LETTERS[KIND_NAMES[piece.kind]]
+            # name the start file, rank or square if another piece of the same kind could also go there
+            others = [other[0] for other in board.generate_moves(board.turn, board.last_move)
+                      if other[1] == end and other[0] != start and board.board[other[0] >> 3][other[0] & 7].code == piece.code
+                      and board.is_legal(other)]
+            if others:
+                name = square_name(start)
+                if all(square_name(other)[0] != name[0] for other in others):
+                    text += name[0]
+                elif all(square_name(other)[1] != name[1] for other in others):
+                    text += name[1]
+                else:
+                    text += name
+            text += ("x" if capture else "") + square_name(end)
+    mover = board.turn
+    board.make_move(move)
+    if board.isCheck(mover, board.last_move):
+        text += "#" if not board.legal_moves() else "+"
+    board.unmake_move()
+    return text
+
+
+def write_game(file, game, headers=None, result=None):
+    """Writes every move played on a Board, or on a Game's board, to an open text file as one PGN game.
+    The board is taken back to the start and played forward again to name the moves, and ends up as it was.
+    headers adds to or replaces the seven required tags, and the game starts from a FEN tag if it didn't start
+    from the usual starting position.
+    """
+    board = game if isinstance(game, Board) else game.board
+    moves = []
+    while board.history:
+        moves.append(board.unmake_move())
+    moves.reverse()
+    start_fen = board.to_fen()
+
+    tags = dict(SEVEN_TAG_DEFAULTS)
+    tags.update(headers or {})
+    result = result or tags.get("Result", "*")
+    tags["Result"] = result
+    if start_fen != STARTING_FEN:
+        tags["SetUp"] = "1"
+        tags["FEN"] = start_fen
+    for name in SEVEN_TAG_ROSTER:
+        file.write(f'[{name} "{_escape(tags[name])}"]\n')
+    for name, value in tags.items():
+        if name not in SEVEN_TAG_ROSTER:
+            file.write(f'[{name} "{_escape(value)}"]\n')
+    file.write("\n")
+
+    line = ""
+    for index, move in enumerate(moves):
+        token = san(board, move)
+        if board.turn == WHITE:
+            token = f"{board.fullmove_number}. {token}"
+        elif index == 0:
+            token = f"{board.fullmove_number}... {token}"
+        board.make_move(move)
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            file.write(line + "\n")
+            line = token
+        else:
+            line = line + " " + token if line else token
+    file.write((line + " " + result if line else result) + "\n\n")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
@@ -1,46 +1,54 @@
-import pygame
-from constants import SQUARE_SIZE, BLUE
-from asset_imgs import *
+"""
+Pieces are small integer codes: the kind of piece, PAWN to KING (1 to 6), plus 8 for a black piece,
+so the white pieces are 1-6 and the black ones 9-14. code & 7 gives the kind and code >> 3 the colour,
+as WHITE is 0 and BLACK is 1. Board keeps a bitboard per code in a list indexed by the code.
+The names ("w_pawn" and so on) are only for showing a piece, such as picking its image in render.py.
+"""
+from constants import WHITE, BLACK
+
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+KINDS = (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)
+KIND_NAMES = {PAWN: "pawn", KNIGHT: "knight", BISHOP: "bishop", ROOK: "rook", QUEEN: "queen", KING: "king"}
+KINDS_BY_NAME = {name: kind for kind, name in KIND_NAMES.items()}
+# one more than the highest code, the length of a list indexed by piece code
+CODE_COUNT = 15
+
+
+def piece_code(colour, kind):
+    return kind | colour << 3
+
+
+PIECE_CODES = tuple(piece_code(colour, kind) for colour in (WHITE, BLACK) for kind in KINDS)
+PIECE_NAMES = {code: ("w_" if code >> 3 == WHITE else "b_") + KIND_NAMES[code & 7] for code in PIECE_CODES}
+CODES_BY_NAME = {name: code for code, name in PIECE_NAMES.items()}
 
 
 class Piece:
-    RADIUS = 20
-    piece_dict = {
-        "b_pawn": B_PAWN,
-        "b_rook": B_ROOK,
-        "b_knight": B_KNIGHT,
-        "b_bishop": B_BISHOP,
-        "b_queen": B_QUEEN,
-        "b_king": B_KING,
-        "w_pawn": W_PAWN,
-        "w_rook": W_ROOK,
-        "w_knight": W_KNIGHT,
-        "w_bishop": W_BISHOP,
-        "w_queen": W_QUEEN,
-        "w_king": W_KING
-    }
-
-    def __init__(self, rank, file, colour, piece_type):
+    """A piece on the board: its square, its code and whether it has moved. How it looks is up to render.py."""
+    __slots__ = ("rank", "file", "colour", "code", "has_moved")
+
+    def __init__(self, rank, file, code):
         self.rank = rank
         self.file = file
-        self.colour = colour
-        self.piece_image = self.piece_dict[piece_type]
-        self.x = 0
-        self.y = 0
-        self.calc_pos()
-        self.piece_type = piece_type
+        self.colour = code >> 3
+        self.code = code
         self.has_moved = False
-        self.is_selected = False
 
-    def calc_pos(self):
-        self.x = SQUARE_SIZE * self.file + SQUARE_SIZE // 2
-        self.y = SQUARE_SIZE * self.rank + SQUARE_SIZE // 2
+    @property
+    def kind(self):
+        return self.code & 7
 
-    def draw(self, win):
-        win.blit(self.piece_image, (self.x - (self.piece_image.get_width() // 2), self.y - (self.piece_image.get_height() // 2)))
+    @property
+    def piece_type(self):
+        """The piece's name, e.g. "w_knight"."""
+        return PIECE_NAMES[self.code]
 
     def move(self, rank, file):
         self.rank = rank
         self.file = file
-        self.calc_pos()
         self.has_moved = True
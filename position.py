@@ -0,0 +1,178 @@
+"""
+This file holds positions that never change once made, for keeping many related positions at once,
+such as the nodes of an analysis tree, the lines of a variation explorer or the positions of a server session.
+
+    position = Position.from_fen(fen)        or board.snapshot()
+    next_position = position.after(move)
+
+after(move) returns a new Position and leaves the old one as it was, so a position can be branched any number of
+times without copying a Board or sharing Piece objects between them. A position is just its bitboards and state:
+the new one shares every bitboard the move didn't touch with the one before, and holds the one before as its parent
+instead of a copy of the moves that led to it, so a line of positions costs a few small tuples per move.
+
+Positions don't generate moves themselves. legal_moves() looks them up in Board.move_cache by key, and only sets up
+a Board to work them out when they aren't there, and to_board() gives a Board to search or play on.
+"""
+from constants import WHITE, BLACK
+from bitboard import squares
+from piece import PAWN, ROOK, KINDS_BY_NAME, PIECE_CODES, piece_code
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS
+from board import Board, CASTLING_MASKS, en_passant_key
+
+
+class Position:
+    """A position that can't be changed. The attributes have the same names and meanings as on Board,
+    except that bitboards and occupied are tuples. parent is the position before and move the move that led here,
+    both None for a position that was made from a Board or FEN.
+    """
+    __slots__ = ("bitboards", "occupied", "turn", "castling_rights", "last_move", "halfmove_clock",
+                 "fullmove_number", "key", "parent", "move")
+
+    def __init__(self, bitboards, occupied, turn, castling_rights, last_move, halfmove_clock, fullmove_number,
+                 key, parent=None, move=None):
+        set_slot = object.__setattr__
+        set_slot(self, "bitboards", tuple(bitboards))
+        set_slot(self, "occupied", tuple(occupied))
+        set_slot(self, "turn", turn)
+        set_slot(self, "castling_rights", castling_rights)
+        set_slot(self, "last_move", last_move)
+        set_slot(self, "halfmove_clock", halfmove_clock)
+        set_slot(self, "fullmove_number", fullmove_number)
+        set_slot(self, "key", key)
+        set_slot(self, "parent", parent)
+        set_slot(self, "move", move)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a Position can't be changed, use after(move) for the next one")
+
+    def __delattr__(self, name):
+        raise AttributeError("a Position can't be changed, use after(move) for the next one")
+
+    def __repr__(self):
+        return f"Position({self.to_fen()!r})"
+
+    def __reduce__(self):
+        # pickled by its constructor arguments, as __setattr__ would refuse the usual way of filling in the slots,
+        # so positions can be sent to the worker processes of a pool. The line before it goes with it
+        return Position, (self.bitboards, self.occupied, self.turn, self.castling_rights, self.last_move,
+                          self.halfmove_clock, self.fullmove_number, self.key, self.parent, self.move)
+
+    def __copy__(self):
+        # a position can't change, so a copy of it may as well be the position itself
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @classmethod
+    def from_board(cls, board):
+        return cls(board.bitboards, board.occupied, board.turn, board.castling_rights, board.last_move,
+                   board.halfmove_clock, board.fullmove_number, board.key)
+
+    @classmethod
+    def from_fen(cls, fen):
+        return cls.from_board(Board.from_fen(fen))
+
+    @classmethod
+    def initial(cls):
+        return cls.from_board(Board())
+
+    def to_board(self):
+        """Sets up a new Board in this position. The Board's undo stack starts empty."""
+        board = Board()
+        board.set_position(self.pieces(), self.turn, self.castling_rights, self.last_move,
+                           self.halfmove_clock, self.fullmove_number)
+        return board
+
+    def to_fen(self):
+        return self.to_board().to_fen()
+
+    def pieces(self):
+        """The (square, piece code) pieces, as Board.set_position takes them."""
+        return [(sq, code) for code in PIECE_CODES for sq in squares(self.bitboards[code])]
+
+    def piece_at(self, sq):
+        """The code of the piece on a square, or 0 if it is empty."""
+        bit = 1 << sq
+        if not (self.occupied[WHITE] | self.occupied[BLACK]) & bit:
+            return 0
+        for code in PIECE_CODES:
+            if self.bitboards[code] & bit:
+                return code
+        return 0
+
+    def _en_passant_key(self):
+        return en_passant_key(self.bitboards, self.turn, self.last_move)
+
+    def after(self, move):
+        """Returns the position after a (start, end, tag, promotion) move, the same as Board.make_move would
+        leave it. No legality test is made here, see legal_moves.
+        """
+        start, end, tag, promotion = move
+        colour = self.turn
+        enemy = BLACK if colour == WHITE else WHITE
+        bitboards = list(self.bitboards)
+        occupied = list(self.occupied)
+        key = self.key ^ self._en_passant_key() ^ CASTLING_KEYS[self.castling_rights] ^ SIDE_KEY
+
+        code = self.piece_at(start)
+        key ^= _toggle(bitboards, occupied, code, start)
+        captured_sq = (start & ~7) | (end & 7) if tag == "en passant" else end
+        captured = self.piece_at(captured_sq)
+        if captured:
+            key ^= _toggle(bitboards, occupied, captured, captured_sq)
+        key ^= _toggle(bitboards, occupied, code & 8 | KINDS_BY_NAME[promotion] if promotion else code, end)
+        if tag == "shortCastle":
+            rook = piece_code(colour, ROOK)
+            key ^= _toggle(bitboards, occupied, rook, end + 1) ^ _toggle(bitboards, occupied, rook, end - 1)
+        elif tag == "longCastle":
+            rook = piece_code(colour, ROOK)
+            key ^= _toggle(bitboards, occupied, rook, end - 2) ^ _toggle(bitboards, occupied, rook, end + 1)
+
+        castling_rights = self.castling_rights & CASTLING_MASKS[start] & CASTLING_MASKS[end]
+        last_move = (end >> 3, end & 7) if tag == "pawnTwoSpaces" else None
+        halfmove_clock = 0 if captured or code & 7 == PAWN else self.halfmove_clock + 1
+        fullmove_number = self.fullmove_number + 1 if colour == BLACK else self.fullmove_number
+        key ^= CASTLING_KEYS[castling_rights] ^ en_passant_key(bitboards, enemy, last_move)
+        return Position(bitboards, occupied, enemy, castling_rights, last_move, halfmove_clock, fullmove_number,
+                        key, self, move)
+
+    def legal_moves(self):
+        """Every legal move, from Board.move_cache if the position is in it."""
+        moves = Board.move_cache.get(self.key)
+        if moves is not None:
+            return list(moves)
+        return self.to_board().legal_moves()
+
+    def line(self):
+        """The moves from the first position of the line, the one with no parent, to this one."""
+        moves = []
+        position = self
+        while position.parent is not None:
+            moves.append(position.move)
+            position = position.parent
+        moves.reverse()
+        return moves
+
+    def repetition_count(self):
+        """How many times this position has occurred in its line, counting this time, as in Board.repetition_count."""
+        count = 1
+        position = self
+        for _ in range(self.halfmove_clock // 2):
+            position = position.parent
+            if position is None or position.parent is None:
+                break
+            position = position.parent
+            if position.key == self.key:
+                count += 1
+        return count
+
+
+def _toggle(bitboards, occupied, code, sq):
+    """Puts a piece on, or takes it off, a square of the lists being built for a new position,
+    and returns what to XOR into the key.
+    """
+    bit = 1 << sq
+    bitboards[code] ^= bit
+    occupied[code >> 3] ^= bit
+    return PIECE_KEYS[code][sq]
@@ -0,0 +1,110 @@
+"""
+This file handles everything that is drawn with pygame: the squares of the board, the piece images and the valid move dots.
+It is only imported once something needs drawing, so the rules in board.py and piece.py can run without pygame or images.
+"""
+import pygame
+from constants import LIGHT_SQUARES, DARK_SQUARES, RANKS, FILES, SQUARE_SIZE, BLUE
+from asset_imgs import piece_images
+
+
+def dot_radius(size):
+    """The radius of a valid move dot, 15 pixels on a 100 pixel square."""
+    return max(2, size * 15 // 100)
+
+
+def square_centre(rank, file, size=SQUARE_SIZE):
+    """The pixel position of the middle of a square."""
+    return file * size + size // 2, rank * size + size // 2
+
+
+def draw_squares(win, highlight_square, size=SQUARE_SIZE):
+    """Draws the visual dark and light squares for the board.
+    If a square is currently selected by a player, colour it blue.
+    """
+    win.fill(DARK_SQUARES)
+    for rank in range(RANKS):
+        for file in range(rank % 2, RANKS, 2):
+            pygame.draw.rect(win, LIGHT_SQUARES, (rank * size, file * size, size, size))
+    if highlight_square:
+        pygame.draw.rect(win, BLUE, [highlight_square.file * size, highlight_square.rank * size, size, size])
+
+
+def draw_piece(win, piece, size=SQUARE_SIZE):
+    """Blits a single piece image centred on its square.
+    The image is looked up from the piece code, so promoted pieces are drawn correctly.
+    """
+    piece_image = piece_images(size)[piece.code]
+    win.blit(piece_image, piece_image.get_rect(center=square_centre(piece.rank, piece.file, size)))
+
+
+def draw_pieces(win, board, highlight_square, size=SQUARE_SIZE):
+    """Draws or blits the piece images onto the squares of the board."""
+    draw_squares(win, highlight_square, size)
+    for rank in range(RANKS):
+        for file in range(FILES):
+            piece = board.get_piece(rank, file)
+            if piece != 0:
+                draw_piece(win, piece, size)
+
+
+class BoardView:
+    """Draws a board onto the window one square at a time, remembering what each square shows,
+    so that only the squares that have changed since the last draw are drawn again.
+    The squares are drawn once onto a background surface, and a changed square is wiped by copying its part of it.
+    """
+
+    def __init__(self, square_size=SQUARE_SIZE):
+        self.square_size = square_size
+        self.background = None
+        # (piece code or None, highlighted, move dot) for each square as it is on screen, None if not drawn yet
+        self.shown = [None] * (RANKS * FILES)
+
+    def invalidate(self):
+        """Forgets what is on screen, so the next draw covers every square, e.g. after the window is uncovered."""
+        self.shown = [None] * (RANKS * FILES)
+
+    def resize(self, square_size):
+        """Draws the board with squares of a new size from the next draw on, e.g. after the window is resized.
+        The piece images for each size are only loaded once, see asset_imgs.piece_images.
+        """
+        self.square_size = square_size
+        self.background = None
+        self.invalidate()
+
+    def draw(self, win, board, highlight_square, valid_moves):
+        """Draws the squares that have changed and returns their rects, to pass to pygame.display.update."""
+        if self.background is None:
+            self.background = pygame.Surface(win.get_size()).convert()
+            draw_squares(self.background, None, self.square_size)
+        highlight = (highlight_square.rank, highlight_square.file) if highlight_square else None
+        dirty = []
+        for rank in range(RANKS):
+            row = board.board[rank]
+            for file in range(FILES):
+                piece = row[file]
+                state = (piece.code if piece != 0 else None, (rank, file) == highlight, (rank, file) in valid_moves)
+                index = rank * FILES + file
+                if self.shown[index] != state:
+                    self.shown[index] = state
+                    dirty.append(self._draw_square(win, rank, file, state))
+        return dirty
+
+    def _draw_square(self, win, rank, file, state):
+        code, highlighted, dot = state
+        size = self.square_size
+        rect = pygame.Rect(file * size, rank * size, size, size)
+        win.blit(self.background, rect, rect)
+        if highlighted:
+            pygame.draw.rect(win, BLUE, rect)
+        if code:
+            piece_image = piece_images(size)[code]
+            win.blit(piece_image, piece_image.get_rect(center=rect.center))
+        if dot:
+            pygame.draw.circle(win, BLUE, rect.center, dot_radius(size))
+        return rect
+
+
+def draw_valid_moves(win, moves, size=SQUARE_SIZE):
+    for move in moves:
+        rank, file = move
+        pygame.draw.circle(win, BLUE, square_centre(rank, file, size), dot_radius(size))
@@ -0,0 +1,164 @@
+"""
+This file serves games over TCP with asyncio, so one process can host many games at once.
+Each connection is one session with its own headless Game. Messages are JSON objects, one per line, both ways:
+
+    {"type": "new", "fen": "<fen, optional>"}       start again, from the starting position or a FEN
+    {"type": "move", "move": "e7e8q"}               play a move, with the promotion piece as its last letter
+    {"type": "engine", "depth": 3}                  have the engine play a move (or "movetime" in seconds)
+    {"type": "takeback"}                            take back the last move
+    {"type": "state"}                               ask for the state again
+    {"type": "stats"}                               the server's instrument.stats(), if started with --stats
+
+Every message is answered with the state of the game:
+
+    {"type": "state", "fen": ..., "turn": "white", "check": false, "status": "playing", "result": null,
+     "last_move": "e2e4", "legal_moves": ["a7a6", ...]}
+
+status is "playing" or the reason the game ended, as in Board.outcome, e.g. "checkmate" or "threefold repetition".
+
+or {"type": "error", "message": ...} if the message can't be carried out.
+Engine searches run in a pool of processes, so they don't hold up the other sessions while they think.
+
+    python server.py --port 8765 --engine-workers 2 --book book.bin
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
+import instrument
+from constants import WHITE
+from game import Game
+from board import STARTING_FEN, move_name
+
+DEFAULT_PORT = 8765
+DEFAULT_ENGINE_DEPTH = 3
+# the largest search a client may ask for
+MAX_ENGINE_DEPTH = 6
+MAX_ENGINE_MOVETIME = 10.0
+
+_engine = None
+
+
+def _start_engine(book_path):
+    """Runs once in each executor process, setting up its engine. Every process maps the same book file."""
+    global _engine
+    from engine import Engine
+    book = None
+    if book_path:
+        from book import OpeningBook
+        book = OpeningBook(book_path)
+    _engine = Engine(book=book)
+
+
+def _search(board, limits):
+    """Runs in an executor process: searches the board with the process's own engine and returns the move."""
+    move, stats = _engine.search(board, **limits)
+    return move
+
+
+def game_state(game):
+    """The state message for a game: its position, the legal moves in it and whether it is over."""
+    board = game.board
+    legal_moves = board.legal_moves()
+    status = game.outcome[1] if game.outcome else "playing"
+    last_move = move_name(board.history[-1][0]) if board.history else None
+    return {
+        "type": "state",
+        "fen": board.to_fen(),
+        "turn": "white" if game.turn == WHITE else "black",
+        "check": game.is_it_check,
+        "status": status,
+        "result": game.outcome[0] if game.outcome else None,
+        "last_move": last_move,
+        "legal_moves": [move_name(move) for move in legal_moves],
+    }
+
+
+class GameServer:
+    """Keeps a Game per connection and answers its messages."""
+
+    def __init__(self, engine_workers=1, book_path=None):
+        self.executor = ProcessPoolExecutor(engine_workers, initializer=_start_engine, initargs=(book_path,))
+        self.sessions = 0
+
+    async def handle(self, reader, writer):
+        game = Game(None)
+        self.sessions += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    reply = await self.answer(game, message)
+                except (ValueError, KeyError, TypeError) as error:
+                    reply = {"type": "error", "message": str(error)}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def answer(self, game, message):
+        kind = message["type"]
+        if kind == "new":
+            game.set_fen(message.get("fen") or STARTING_FEN)
+        elif kind == "move":
+            moves = {move_name(move): move for move in game.board.legal_moves()}
+            if game.outcome:
+                raise ValueError("the game is over")
+            if message["move"] not in moves:
+                raise ValueError(f"{message['move']} is not a legal move")
+            game.play(moves[message["move"]])
+        elif kind == "engine":
+            if game.outcome:
+                raise ValueError("the game is over")
+            if "movetime" in message:
+                limits = {"movetime": min(float(message["movetime"]), MAX_ENGINE_MOVETIME)}
+            else:
+                limits = {"depth": min(int(message.get("depth", DEFAULT_ENGINE_DEPTH)), MAX_ENGINE_DEPTH)}
+            loop = asyncio.get_running_loop()
+            move = await loop.run_in_executor(self.executor, _search, game.board, limits)
+            game.play(move)
+        elif kind == "takeback":
+            if not game.takeback():
+                raise ValueError("there is no move to take back")
+        elif kind == "stats":
+            return {"type": "stats", "enabled": instrument.enabled(), **instrument.stats()}
+        elif kind != "state":
+            raise ValueError(f"unknown message type {kind!r}")
+        return game_state(game)
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve chess games over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--engine-workers", type=int, default=1, help="processes for engine searches")
+    parser.add_argument("--book", help="an opening book for the engine to play from, see book.py")
+    parser.add_argument("--stats", action="store_true", help="count the calls to the rules, see instrument.py")
+    args = parser.parse_args()
+    if args.stats:
+        instrument.enable()
+    game_server = GameServer(args.engine_workers, args.book)
+    try:
+        asyncio.run(game_server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        game_server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,536 @@
+"""
+This file generates and probes endgame tablebases. A table covers every position of a king and a few pieces against
+a lone king, and says whether the side to move wins, draws or loses and in how many plies it is mate with best play.
+
+    python tablebase.py generate KQK KRK KPK KBNK --directory tablebases
+    python tablebase.py probe --directory tablebases --fen "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+    python tablebase.py check KBNK --directory tablebases
+
+A table is named by its material, the side with the pieces first, e.g. KBNK for king, bishop and knight against king.
+It is worked out by retrograde analysis: starting from the checkmates, positions are settled backwards one ply at a time
+through the moves that lead into them, so every position is visited once and gets its true distance to mate.
+Captures and promotions lead out of a table into a smaller one, which is generated first.
+The moves come from the attack tables in bitboard.py that Board uses, and check compares a sample of a table
+against Board's own legal moves.
+
+Only one of each set of mirror-image positions is stored: the board is flipped or turned so that the king of the side
+with the pieces is in the a1-d1-d4 triangle, or on files a-d when there are pawns, as they can't be flipped top to bottom.
+Each position is one byte, 0 for a draw (or an impossible position) or the plies to mate plus one,
+with all the positions with the pieces' side to move followed by all of those with the lone king to move.
+The files are read through mmap, so a probe is a few list lookups and one byte read.
+The tables are laid out with white holding the pieces, and positions where black has them are probed with the board
+turned round and the colours swapped.
+"""
+import argparse
+import itertools
+import mmap
+import os
+import random
+import re
+import struct
+import time
+from collections import defaultdict
+from constants import WHITE, BLACK
+from piece import KING, KINDS_BY_NAME, piece_code
+from bitboard import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks, queen_attacks, \
+    squares, lowest_square
+
+MAGIC = b"CTB1"
+# the magic, the table's name and the number of positions for each side to move
+HEADER = struct.Struct("<4s8sI")
+SUFFIX = ".tb"
+PIECE_ORDER = ("queen", "rook", "bishop", "knight", "pawn")
+LETTERS = {"queen": "Q", "rook": "R", "bishop": "B", "knight": "N", "pawn": "P"}
+PIECES_BY_LETTER = {letter: piece for piece, letter in LETTERS.items()}
+PROMOTIONS = ("queen", "rook", "bishop", "knight")
+# the move counter of a position the lone king can't lose, as one of its moves leads to a draw
+NEVER_LOST = 255
+
+_NAME = re.compile(r"^K[QRBNP]+K$")
+
+
+# ---------------------------
+# Symmetry. Rows are counted from white's side, so row 0 is rank 1.
+def _compose(first, then):
+    return [then[first[sq]] for sq in range(64)]
+
+
+IDENTITY = list(range(64))
+MIRROR_FILE = [sq ^ 7 for sq in range(64)]
+MIRROR_RANK = [sq ^ 56 for sq in range(64)]
+# turns the board over the a1-h8 diagonal, swapping rows and files
+TRANSPOSE = [63 - ((sq & 7) * 8 + (sq >> 3)) for sq in range(64)]
+TRIANGLE = [sq for sq in range(64) if 7 - (sq >> 3) <= (sq & 7) <= 3]
+PAWN_KING_SQUARES = [sq for sq in range(64) if sq & 7 <= 3]
+# which side of the a1-h8 diagonal a square is on: 1 the same side as the triangle, -1 the other side, 0 on it
+DIAGONAL_SIDE = [(7 - (sq >> 3) < (sq & 7)) - (7 - (sq >> 3) > (sq & 7)) for sq in range(64)]
+
+
+def _pawnless_transform(king):
+    """The symmetry that takes a king's square into the triangle."""
+    transform = MIRROR_FILE if king & 7 > 3 else IDENTITY
+    if 7 - (transform[king] >> 3) > 3:
+        transform = _compose(transform, MIRROR_RANK)
+    if DIAGONAL_SIDE[transform[king]] < 0:
+        transform = _compose(transform, TRANSPOSE)
+    return transform
+
+
+PAWNLESS_TRANSFORMS = [_pawnless_transform(sq) for sq in range(64)]
+TRANSPOSED_TRANSFORMS = [_compose(transform, TRANSPOSE) for transform in PAWNLESS_TRANSFORMS]
+PAWN_TRANSFORMS = [IDENTITY if sq & 7 <= 3 else MIRROR_FILE for sq in range(64)]
+
+
+def _knight_attacks(sq, occupied):
+    return KNIGHT_ATTACKS[sq]
+
+
+def _pawn_attacks(sq, occupied):
+    return PAWN_ATTACKS[WHITE][sq]
+
+
+ATTACKS = {"queen": queen_attacks, "rook": rook_attacks, "bishop": bishop_attacks, "knight": _knight_attacks,
+           "pawn": _pawn_attacks}
+
+
+def material_name(pieces):
+    """The name of the table for a list of piece types against a lone king, e.g. ["knight", "bishop"] -> "KBNK"."""
+    return "K" + "".join(LETTERS[piece] for piece in sorted(pieces, key=PIECE_ORDER.index)) + "K"
+
+
+def drawn_material(pieces):
+    """True for the pieces that can never mate a lone king, so need no table: nothing, or a single bishop or knight."""
+    return len(pieces) <= 1 and not any(piece in ("queen", "rook", "pawn") for piece in pieces)
+
+
+def table_path(directory, name):
+    return os.path.join(directory, name + SUFFIX)
+
+
+class Table:
+    """One table, with white holding the pieces. index() finds a position's place in it, folding in the symmetry,
+    and probe() reads its value once the table has been generated or loaded with open().
+    """
+
+    def __init__(self, name):
+        if not _NAME.match(name):
+            raise ValueError(f"{name!r} isn't a table name like KQK or KBNK")
+        self.name = name
+        self.pieces = [PIECES_BY_LETTER[letter] for letter in name[1:-1]]
+        if material_name(self.pieces) != name:
+            raise ValueError(f"{name} should be written {material_name(self.pieces)}")
+        self.pawns = "pawn" in self.pieces
+        self.king_squares = PAWN_KING_SQUARES if self.pawns else TRIANGLE
+        self.king_index = [-1] * 64
+        for index, sq in enumerate(self.king_squares):
+            self.king_index[sq] = index
+        self.size = len(self.king_squares) * 64 ** (len(self.pieces) + 1)
+        self.values = None
+        self.file = None
+        self.map = None
+
+    @classmethod
+    def open(cls, path):
+        """Maps a table file into memory."""
+        with open(path, "rb") as file:
+            magic, name, size = HEADER.unpack(file.read(HEADER.size))
+        table = cls(name.rstrip(b"\0").decode())
+        if magic != MAGIC or size != table.size:
+            raise ValueError(f"{path} isn't a {table.name} table")
+        table.file = open(path, "rb")
+        table.map = mmap.mmap(table.file.fileno(), 0, access=mmap.ACCESS_READ)
+        table.values = memoryview(table.map)[HEADER.size:]
+        return table
+
+    def close(self):
+        if self.file is not None:
+            self.values.release()
+            self.map.close()
+            self.file.close()
+            self.file = None
+        self.values = None
+
+    def index(self, white_king, black_king, others):
+        """The index of a position, given the squares of the kings and of the pieces in the order of the name."""
+        if self.pawns:
+            transform = PAWN_TRANSFORMS[white_king]
+        else:
+            transform = PAWNLESS_TRANSFORMS[white_king]
+            if not DIAGONAL_SIDE[transform[white_king]]:
+                # the king is on the diagonal, so the first piece off it decides whether to turn the board over it too
+                for sq in (black_king, *others):
+                    side = DIAGONAL_SIDE[transform[sq]]
+                    if side:
+                        if side < 0:
+                            transform = TRANSPOSED_TRANSFORMS[white_king]
+                        break
+        index = self.king_index[transform[white_king]] * 64 + transform[black_king]
+        for sq in others:
+            index = index * 64 + transform[sq]
+        return index
+
+    def squares(self, index):
+        """The (white king, black king, pieces) squares of an index, the reverse of index()."""
+        others = [0] * len(self.pieces)
+        for slot in range(len(others) - 1, -1, -1):
+            index, others[slot] = divmod(index, 64)
+        index, black_king = divmod(index, 64)
+        return self.king_squares[index], black_king, others
+
+    def probe(self, white_to_move, index):
+        """Returns (wdl, plies) for the side to move: wdl is 1 for a win, 0 for a draw and -1 for a loss,
+        and plies is how long the mate takes with best play, 0 for a draw.
+        """
+        value = self.values[index if white_to_move else self.size + index]
+        if not value:
+            return 0, 0
+        return (1 if white_to_move else -1), value - 1
+
+
+class Tablebases:
+    """The tables in a directory. Each one is mapped into memory the first time a position needs it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        names = [file[:-len(SUFFIX)] for file in os.listdir(directory) if file.endswith(SUFFIX)] \
+            if os.path.isdir(directory) else []
+        self.names = set(names)
+        # a table's name has a letter for every piece on the board
+        self.max_pieces = max(map(len, names), default=0)
+
+    def table(self, name):
+        table = self.tables.get(name)
+        if table is None and name in self.names:
+            table = self.tables[name] = Table.open(table_path(self.directory, name))
+        return table
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+    def probe(self, board):
+        """Returns (wdl, plies) for the side to move, as in Table.probe, or None if no table covers the position.
+        Positions with castling rights aren't covered, as the tables don't know about castling.
+        """
+        white = board.occupied[WHITE]
+        black = board.occupied[BLACK]
+        if bin(white | black).count("1") > self.max_pieces or board.castling_rights:
+            return None
+        bitboards = board.bitboards
+        if black == bitboards[piece_code(BLACK, KING)]:
+            strong, weak, flip = WHITE, BLACK, 0
+        elif white == bitboards[piece_code(WHITE, KING)]:
+            strong, weak, flip = BLACK, WHITE, 56
+        else:
+            return None
+        pieces = []
+        others = []
+        for piece in PIECE_ORDER:
+            for sq in squares(bitboards[piece_code(strong, KINDS_BY_NAME[piece])]):
+                pieces.append(piece)
+                others.append(sq ^ flip)
+        if drawn_material(pieces):
+            return 0, 0
+        table = self.table(material_name(pieces))
+        if table is None:
+            return None
+        white_king = lowest_square(bitboards[piece_code(strong, KING)]) ^ flip
+        black_king = lowest_square(bitboards[piece_code(weak, KING)]) ^ flip
+        return table.probe((board.turn == WHITE) != bool(flip), table.index(white_king, black_king, others))
+
+    def best_move(self, board):
+        """Returns (move, (wdl, plies)) for the best legal move in a covered position, or None.
+        The quickest mate is chosen when winning, the slowest when losing, and any move that keeps a draw otherwise.
+        """
+        best = None
+        best_rank = None
+        for move in board.legal_moves():
+            board.make_move(move)
+            result = self.probe(board)
+            board.unmake_move()
+            if result is None:
+                return None
+            wdl = -result[0]
+            plies = result[1] + 1 if wdl else 0
+            rank = (wdl, -plies if wdl > 0 else plies)
+            if best_rank is None or rank > best_rank:
+                best = move, (wdl, plies)
+                best_rank = rank
+        return best
+
+    def adjudicate(self, board):
+        """Returns (result, reason) for a position the tables decide, as in Board.outcome, or None.
+        The reason is "tablebase win" or "tablebase draw".
+        """
+        result = self.probe(board)
+        if result is None:
+            return None
+        wdl, plies = result
+        if not wdl:
+            return "1/2-1/2", "tablebase draw"
+        white_wins = (wdl > 0) == (board.turn == WHITE)
+        return ("1-0" if white_wins else "0-1"), "tablebase win"
+
+
+# ---------------------------
+def _table_for(pieces, directory, progress):
+    """Opens the table for some pieces, generating it first if there isn't one, or returns None if they can't win."""
+    if drawn_material(pieces):
+        return None
+    name = material_name(pieces)
+    if not os.path.exists(table_path(directory, name)):
+        generate(name, directory, progress)
+    return Table.open(table_path(directory, name))
+
+
+def _white_unmoves(table, white_king, black_king, others, occupied):
+    """Yields the indices of the positions, white to move, that a white move leads from into this one."""
+    for sq in squares(KING_ATTACKS[white_king] & ~occupied & ~KING_ATTACKS[black_king]):
+        yield table.index(sq, black_king, others)
+    for slot, piece in enumerate(table.pieces):
+        sq = others[slot]
+        if piece == "pawn":
+            back = sq + 8
+            # a pawn can't have come from rank 1, and if it is on rank 4 it could have come from rank 2 in one move
+            if back >> 3 == 7 or occupied >> back & 1:
+                continue
+            origins = [back]
+            if sq >> 3 == 4 and not occupied >> (back + 8) & 1:
+                origins.append(back + 8)
+        else:
+            origins = squares(ATTACKS[piece](sq, occupied) & ~occupied)
+        for origin in origins:
+            others[slot] = origin
+            yield table.index(white_king, black_king, others)
+        others[slot] = sq
+
+
+def generate(name, directory, progress=None):
+    """Works out a table and writes it to the directory, generating the smaller tables its captures and promotions
+    lead into first if they aren't there. progress, if given, is called with a line of text now and then.
+    """
+    table = Table(name)
+    pieces = table.pieces
+    size = table.size
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    # the tables a capture of each piece leads into, and for each pawn the tables its promotions lead into,
+    # with the order the pieces are listed in there
+    captures = [_table_for(pieces[:slot] + pieces[slot + 1:], directory, progress) for slot in range(len(pieces))]
+    promotions = {}
+    for slot, piece in enumerate(pieces):
+        if piece == "pawn":
+            promotions[slot] = []
+            for promotion in PROMOTIONS:
+                promoted = pieces[:slot] + [promotion] + pieces[slot + 1:]
+                order = sorted(range(len(promoted)), key=lambda other: PIECE_ORDER.index(promoted[other]))
+                promotions[slot].append((_table_for(promoted, directory, progress), order))
+    if progress:
+        progress(f"{name}: setting up {2 * size} positions")
+
+    white_values = bytearray(size)
+    black_values = bytearray(size)
+    white_valid = bytearray(size)
+    black_valid = bytearray(size)
+    # for each position with black to move, its moves that stay in the table and aren't known to lose yet,
+    # and the longest loss its captures lead to
+    counters = bytearray(size)
+    exits = bytearray(size)
+    # the positions settled at each distance from mate, waiting to be worked back from
+    white_buckets = defaultdict(list)
+    black_buckets = defaultdict(list)
+    attacks = [ATTACKS[piece] for piece in pieces]
+    pawn_slots = list(promotions)
+    all_squares = [range(64)] * (len(pieces) + 1)
+    for index, (white_king, black_king, *others) in enumerate(itertools.product(table.king_squares, *all_squares)):
+        white = 1 << white_king
+        for sq in others:
+            white |= 1 << sq
+        occupied = white | 1 << black_king
+        if bin(occupied).count("1") != len(pieces) + 2 or KING_ATTACKS[white_king] >> black_king & 1:
+            continue
+        if any(others[slot] >> 3 in (0, 7) for slot in pawn_slots):
+            continue
+        if not table.pawns and not DIAGONAL_SIDE[white_king] and table.index(white_king, black_king, others) != index:
+            continue
+        black_valid[index] = 1
+        # black's king doesn't block the lines it would move along
+        without_king = occupied ^ 1 << black_king
+        attacked = KING_ATTACKS[white_king]
+        for attack, sq in zip(attacks, others):
+            attacked |= attack(sq, without_king)
+        in_check = attacked >> black_king & 1
+        targets = KING_ATTACKS[black_king] & ~attacked
+        counter = len({table.index(white_king, sq, others) for sq in squares(targets & ~white)})
+        longest = 0
+        # the pieces black's king can take are the ones nothing else defends
+        for sq in squares(targets & white):
+            slot = others.index(sq)
+            sub = captures[slot]
+            value = sub.values[sub.index(white_king, sq, others[:slot] + others[slot + 1:])] if sub else 0
+            if not value:
+                counter = NEVER_LOST
+                break
+            # white wins in value - 1 plies from there, so black loses in value plies from here
+            longest = max(longest, value)
+        if not counter:
+            if longest:
+                black_values[index] = longest + 1
+                black_buckets[longest].append(index)
+            elif in_check:
+                black_values[index] = 1
+                black_buckets[0].append(index)
+        counters[index] = counter
+        exits[index] = longest
+        if in_check:
+            continue
+
+        white_valid[index] = 1
+        quickest = 0
+        for slot in pawn_slots:
+            sq = others[slot]
+            if sq >> 3 != 1 or occupied >> (sq - 8) & 1:
+                continue
+            others[slot] = sq - 8
+            for sub, order in promotions[slot]:
+                if sub is None:
+                    continue
+                value = sub.values[sub.size + sub.index(white_king, black_king, [others[other] for other in order])]
+                # black loses in value - 1 plies from there, so white wins in value plies from here
+                if value and (not quickest or value < quickest):
+                    quickest = value
+            others[slot] = sq
+        if quickest:
+            white_values[index] = quickest + 1
+            white_buckets[quickest].append(index)
+
+    plies = 0
+    while white_buckets or black_buckets:
+        if plies % 2 == 0:
+            # black to move loses in plies, so every white move into here wins in plies + 1
+            for index in black_buckets.pop(plies, ()):
+                white_king, black_king, others = table.squares(index)
+                occupied = 1 << white_king | 1 << black_king
+                for sq in others:
+                    occupied |= 1 << sq
+                for previous in _white_unmoves(table, white_king, black_king, others, occupied):
+                    value = white_values[previous]
+                    if white_valid[previous] and (not value or value > plies + 2):
+                        white_values[previous] = plies + 2
+                        white_buckets[plies + 1].append(previous)
+        else:
+            # white wins in plies, so a black position loses once every one of its moves leads somewhere like this
+            for index in white_buckets.pop(plies, ()):
+                if white_values[index] != plies + 1:
+                    continue
+                white_king, black_king, others = table.squares(index)
+                occupied = 1 << white_king | 1 << black_king
+                for sq in others:
+                    occupied |= 1 << sq
+                origins = KING_ATTACKS[black_king] & ~occupied & ~KING_ATTACKS[white_king]
+                for previous in {table.index(white_king, sq, others) for sq in squares(origins)}:
+                    if not black_valid[previous] or black_values[previous] or counters[previous] == NEVER_LOST:
+                        continue
+                    counters[previous] -= 1
+                    if not counters[previous]:
+                        loss = max(plies + 1, exits[previous])
+                        black_values[previous] = loss + 1
+                        black_buckets[loss].append(previous)
+        plies += 1
+        if progress and plies % 10 == 0:
+            progress(f"{name}: {plies} plies from mate")
+
+    for sub in captures + [sub for tables in promotions.values() for sub, order in tables]:
+        if sub is not None:
+            sub.close()
+    path = table_path(directory, name)
+    with open(path + ".tmp", "wb") as file:
+        file.write(HEADER.pack(MAGIC, name.encode(), size))
+        file.write(white_values)
+        file.write(black_values)
+    os.replace(path + ".tmp", path)
+    if progress:
+        wins = size - white_values.count(0)
+        losses = size - black_values.count(0)
+        progress(f"{name}: {wins} wins and {losses} losses, the longest mate {max(white_values) - 1} plies, "
+                 f"in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def check(name, directory, positions=1000, seed=1):
+    """Compares random positions of a table with the legal moves Board generates: each one's value should be the
+    best of the values of the positions its moves lead to. Prints any that aren't and returns how many there were.
+    """
+    from board import Board
+    tablebases = Tablebases(directory)
+    table = tablebases.table(name)
+    if table is None:
+        raise ValueError(f"there is no {name} table in {directory}")
+    rng = random.Random(seed)
+    board = Board()
+    checked = 0
+    wrong = 0
+    while checked < positions:
+        white_king, black_king, others = table.squares(rng.randrange(table.size))
+        placed = [(white_king, piece_code(WHITE, KING)), (black_king, piece_code(BLACK, KING))] \
+            + [(sq, piece_code(WHITE, KINDS_BY_NAME[piece])) for sq, piece in zip(others, table.pieces)]
+        if len({sq for sq, code in placed}) != len(placed) or KING_ATTACKS[white_king] >> black_king & 1 \
+                or any(piece == "pawn" and sq >> 3 in (0, 7) for sq, piece in zip(others, table.pieces)):
+            continue
+        board.set_position(placed, rng.choice((WHITE, BLACK)), 0, None)
+        if board.turn == WHITE and board.isCheck(WHITE, None):
+            continue
+        checked += 1
+        stored = tablebases.probe(board)
+        best = tablebases.best_move(board)
+        if best is not None:
+            expected = best[1]
+        elif board.isCheck(WHITE if board.turn == BLACK else BLACK, None):
+            expected = (-1, 0)
+        else:
+            expected = (0, 0)
+        if stored != expected:
+            wrong += 1
+            print(f"{board.to_fen()}: the table has {stored}, the moves give {expected}")
+    tablebases.close()
+    return wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate, probe or check endgame tablebases.")
+    parser.add_argument("--directory", default="tablebases", help="where the tables are kept")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="generate tables, e.g. KQK KRK KPK KBNK")
+    generate_parser.add_argument("names", nargs="+")
+    probe_parser = commands.add_parser("probe", help="look up a position")
+    probe_parser.add_argument("--fen", required=True)
+    check_parser = commands.add_parser("check", help="compare a table with Board's legal moves")
+    check_parser.add_argument("name")
+    check_parser.add_argument("--positions", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        for name in args.names:
+            generate(name, args.directory, print)
+    elif args.command == "probe":
+        from board import Board, move_name
+        board = Board.from_fen(args.fen)
+        tablebases = Tablebases(args.directory)
+        best = tablebases.best_move(board)
+        result = tablebases.probe(board)
+        if result is None:
+            print("not in the tables")
+        else:
+            wdl, plies = result
+            print({1: f"win, mate in {plies} plies", 0: "draw", -1: f"loss, mated in {plies} plies"}[wdl])
+            if best is not None:
+                print("best move", move_name(best[0]))
+    else:
+        wrong = check(args.name, args.directory, args.positions)
+        print(f"{args.positions} positions checked, {wrong} wrong")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+This file plays matches between two engine configurations, with nobody at the mouse, to find out whether a change
+to the engine makes it stronger:
+
+    python tournament.py --first "name=new" --second "name=old,module=engine_old" \\
+        --openings openings.pgn --nodes 20000 --games 1000 --workers 8 --sprt
+
+A configuration is a list of key=value pairs separated by commas:
+    name          what to call it in the results
+    module        the module to take the Engine class from, engine by default, e.g. a copy of an older engine.py
+    hash          transposition table size in MB
+    depth, movetime, nodes
+                  its own search limits, in place of the ones given for both on the command line
+    book, tablebases
+                  an opening book file or a directory of endgame tables for it to use
+
+Every opening is played twice, once with each configuration as white, so neither side gains from the openings.
+Openings are read from .pgn files, taking the first --opening-plies moves of each game, or from any other file
+as one FEN per line. Without any, every game starts from the starting position.
+
+The games are spread across a pool of processes, each with its own pair of engines, and the rules are Board's,
+so a game ends in checkmate, stalemate or a draw by rule, or as a draw after --max-plies plies.
+Results are reported from the first configuration's point of view: wins, draws and losses, the Elo difference
+with a 95% error margin and, with --sprt, the log-likelihood ratio of a sequential probability ratio test of
+elo0 against elo1, which stops the match as soon as it is sure either way. Games per second and the average nodes
+per second of each worker show how fast the engines and the rules are running.
+"""
+import argparse
+import importlib
+import math
+import multiprocessing
+import os
+import sys
+import time
+from board import Board, STARTING_FEN
+from pgn import read_games, parse_san, IllegalMoveError
+
+PROGRESS_SECONDS = 2.0
+# the z-score of a two-sided 95% confidence interval
+Z_95 = 1.959964
+
+_engines = {}
+_max_plies = 0
+
+
+# ---------------------------
+# Configurations
+class EngineConfig:
+    """How to build and run one of the two engines of a match."""
+
+    def __init__(self, name, module="engine", hash_mb=16, limits=None, book=None, tablebases=None):
+        self.name = name
+        self.module = module
+        self.hash_mb = hash_mb
+        # the keyword arguments of Engine.search that this configuration sets itself
+        self.limits = limits or {}
+        self.book = book
+        self.tablebases = tablebases
+
+    @classmethod
+    def parse(cls, text, default_name):
+        """Reads a configuration from its "key=value,key=value" form."""
+        settings = {}
+        for item in filter(None, (part.strip() for part in text.split(","))):
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError(f"{item!r} should be key=value")
+            settings[key.strip()] = value.strip()
+        limits = {}
+        for key in ("depth", "nodes"):
+            if key in settings:
+                limits[key] = int(settings.pop(key))
+        if "movetime" in settings:
+            limits["movetime"] = float(settings.pop("movetime"))
+        config = cls(settings.pop("name", default_name), settings.pop("module", "engine"),
+                     int(settings.pop("hash", 16)), limits, settings.pop("book", None), settings.pop("tablebases", None))
+        if settings:
+            raise ValueError(f"unknown settings {', '.join(sorted(settings))}")
+        return config
+
+    def build(self):
+        """Makes the engine, in the process that is going to use it."""
+        book = tablebases = None
+        if self.book:
+            from book import OpeningBook
+            book = OpeningBook(self.book)
+        if self.tablebases:
+            from tablebase import Tablebases
+            tablebases = Tablebases(self.tablebases)
+        return importlib.import_module(self.module).Engine(self.hash_mb, book=book, tablebases=tablebases)
+
+
+# ---------------------------
+# Openings
+def read_openings(paths, plies=8):
+    """Returns the FEN of every opening in the files: the position after the first plies moves of each PGN game,
+    or each line of any other file. Games with an illegal move among those moves are left out.
+    """
+    openings = []
+    for path in paths:
+        if path.endswith(".pgn"):
+            for game in read_games(path):
+                board = game.start_board()
+                try:
+                    for text in game.moves[:plies]:
+                        board.make_move(parse_san(board, text))
+                except IllegalMoveError:
+                    continue
+                openings.append(board.to_fen())
+        else:
+            with open(path) as file:
+                for line in file:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        # EPD lines have operations after the four position fields, which FEN doesn't
+                        fields = line.split(";")[0].split()
+                        clocks = len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit()
+                        openings.append(" ".join(fields[:6] if clocks else fields[:4]))
+    return openings
+
+
+# ---------------------------
+# Playing games, in the worker processes
+def _start_worker(configs, max_plies):
+    """Runs once in each worker process, building its own engine for each configuration."""
+    global _max_plies
+    _max_plies = max_plies
+    for index, config in enumerate(configs):
+        _engines[index] = (config.build(), config)
+
+
+def play_game(task):
+    """Runs in a worker: plays one game and returns what happened in it.
+    task is (game number, opening FEN, index of the white configuration, the search limits of both).
+    """
+    number, fen, white, limits = task
+    board = Board.from_fen(fen)
+    players = (white, 1 - white)
+    nodes = [0, 0]
+    seconds = [0.0, 0.0]
+    for index in players:
+        engine = _engines[index][0]
+        # each game starts afresh, the same as a GUI's ucinewgame
+        if hasattr(engine, "tt"):
+            engine.tt.clear()
+    plies = 0
+    started = time.perf_counter()
+    while True:
+        outcome = board.outcome()
+        if outcome is not None:
+            result, reason = outcome
+            break
+        if plies >= _max_plies:
+            result, reason = "1/2-1/2", "move limit"
+            break
+        side = players[plies % 2]
+        engine, config = _engines[side]
+        # a configuration's own limits replace the ones given for both, they aren't added to them
+        move, stats = engine.search(board, **(config.limits or limits))
+        if move is None:
+            result, reason = "1/2-1/2", "no move"
+            break
+        nodes[side] += stats["nodes"]
+        seconds[side] += stats["seconds"]
+        board.make_move(move)
+        plies += 1
+    return {"number": number, "white": white, "result": result, "reason": reason, "plies": plies,
+            "nodes": sum(nodes), "search_seconds": sum(seconds), "seconds": time.perf_counter() - started,
+            "worker": os.getpid()}
+
+
+# ---------------------------
+# The statistics
+def score_of(result, first_is_white):
+    """The first configuration's score for a game, 1, 0.5 or 0."""
+    if result == "1/2-1/2":
+        return 0.5
+    return 1.0 if (result == "1-0") == first_is_white else 0.0
+
+
+def elo_from_score(score):
+    if score <= 0.0:
+        return -math.inf
+    if score >= 1.0:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+def score_from_elo(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def _mean_variance(wins, draws, losses):
+    games = wins + draws + losses
+    mean = (wins + draws / 2) / games
+    variance = (wins * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2 + losses * mean ** 2) / games
+    return mean, variance
+
+
+def elo_interval(wins, draws, losses):
+    """Returns (Elo difference, margin) with a 95% confidence interval of difference +- margin,
+    from the mean and variance of the first configuration's per-game scores. The margin is infinite when the games
+    say nothing about it: none have been played, or every one has had the same score, such as all draws.
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0, math.inf
+    mean, variance = _mean_variance(wins, draws, losses)
+    elo = elo_from_score(mean)
+    if variance <= 0.0:
+        return elo, math.inf
+    spread = Z_95 * math.sqrt(variance / games)
+    low, high = elo_from_score(mean - spread), elo_from_score(mean + spread)
+    return elo, (high - low) / 2
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """The log-likelihood ratio of elo1 against elo0 for the results so far, with the usual normal approximation
+    to the trinomial distribution of wins, draws and losses.
+    """
+    games = wins + draws + losses
+    if not games or not wins + losses:
+        return 0.0
+    mean, variance = _mean_variance(wins, draws, losses)
+    if variance <= 0.0:
+        return 0.0
+    score0, score1 = score_from_elo(elo0), score_from_elo(elo1)
+    return games * (score1 - score0) * (2 * mean - score0 - score1) / (2 * variance)
+
+
+def sprt_bounds(alpha, beta):
+    """The (lower, upper) LLR bounds at which the test accepts elo0 or elo1."""
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+class MatchStats:
+    """Adds up the games of a match as they come in."""
+
+    def __init__(self, sprt=None):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        # (elo0, elo1, alpha, beta), or None for a match of a fixed number of games
+        self.sprt = sprt
+        self.reasons = {}
+        # worker pid -> [games, nodes, seconds spent searching]
+        self.workers = {}
+        self.started = time.perf_counter()
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, game):
+        score = score_of(game["result"], game["white"] == 0)
+        if score == 1.0:
+            self.wins += 1
+        elif score == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        self.reasons[game["reason"]] = self.reasons.get(game["reason"], 0) + 1
+        worker = self.workers.setdefault(game["worker"], [0, 0, 0.0])
+        worker[0] += 1
+        worker[1] += game["nodes"]
+        worker[2] += game["search_seconds"]
+
+    def llr(self):
+        if self.sprt is None:
+            return None
+        elo0, elo1, alpha, beta = self.sprt
+        return sprt_llr(self.wins, self.draws, self.losses, elo0, elo1)
+
+    def decision(self):
+        """"H1" once the SPRT accepts elo1, "H0" once it accepts elo0, otherwise None."""
+        llr = self.llr()
+        if llr is None:
+            return None
+        lower, upper = sprt_bounds(*self.sprt[2:])
+        if llr >= upper:
+            return "H1"
+        if llr <= lower:
+            return "H0"
+        return None
+
+    def games_per_second(self):
+        seconds = time.perf_counter() - self.started
+        return self.games / seconds if seconds else 0.0
+
+    def worker_nps(self):
+        """The nodes per second of each worker, over the time its engines spent searching."""
+        return {pid: int(nodes / seconds) if seconds else 0 for pid, (games, nodes, seconds) in self.workers.items()}
+
+    def summary(self):
+        elo, margin = elo_interval(self.wins, self.draws, self.losses)
+        margin_text = f"{margin:.1f}" if math.isfinite(margin) else "n/a"
+        text = f"{self.games} games  +{self.wins} ={self.draws} -{self.losses}  elo {elo:+.1f} +- {margin_text}"
+        if self.sprt is not None:
+            lower, upper = sprt_bounds(*self.sprt[2:])
+            text += f"  llr {self.llr():.2f} ({lower:.2f}, {upper:.2f})"
+        nps = self.worker_nps()
+        average = sum(nps.values()) / len(nps) if nps else 0
+        return text + f"  {self.games_per_second():.2f} games/s  {average:,.0f} nodes/s per worker"
+
+
+# ---------------------------
+def run(first, second, openings, games, limits, workers=None, max_plies=400, sprt=None, progress=sys.stderr):
+    """Plays a match of up to games games and returns its MatchStats. Stops early if the SPRT is decided."""
+    workers = workers or multiprocessing.cpu_count()
+    openings = openings or [STARTING_FEN]
+    stats = MatchStats(sprt)
+    # each opening twice in a row, with the colours swapped
+    tasks = ((number, openings[number // 2 % len(openings)], number % 2, limits) for number in range(games))
+    last_report = stats.started
+    with multiprocessing.Pool(workers, initializer=_start_worker, initargs=((first, second), max_plies)) as pool:
+        for game in pool.imap_unordered(play_game, tasks):
+            stats.add(game)
+            now = time.perf_counter()
+            decision = stats.decision()
+            if progress and (now - last_report >= PROGRESS_SECONDS or decision):
+                last_report = now
+                print(stats.summary(), file=progress, flush=True)
+            if decision:
+                # the games still being played are thrown away when the pool is closed
+                break
+    return stats
+
+
+def report(stats, first, second):
+    lines = [f"{first.name} vs {second.name}: {stats.summary()}"]
+    decision = stats.decision()
+    if decision:
+        lines.append(f"SPRT: {'elo1' if decision == 'H1' else 'elo0'} accepted ({decision})")
+    elif stats.sprt is not None:
+        lines.append("SPRT: no decision yet")
+    lines.append("endings: " + ", ".join(f"{reason} {count}" for reason, count in sorted(stats.reasons.items())))
+    for pid, nps in sorted(stats.worker_nps().items()):
+        lines.append(f"worker {pid}: {stats.workers[pid][0]} games, {nps:,} nodes/s")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a match between two engine configurations.")
+    parser.add_argument("--first", default="name=first", help='the first configuration, e.g. "name=new,hash=32"')
+    parser.add_argument("--second", default="name=second", help="the second configuration")
+    parser.add_argument("--openings", nargs="*", default=[], help=".pgn files, or files of one FEN per line")
+    parser.add_argument("--opening-plies", type=int, default=8, help="moves of each PGN game to use as the opening")
+    parser.add_argument("--games", type=int, default=100, help="the most games to play")
+    parser.add_argument("--workers", type=int, help="processes to play in, one per core if not given")
+    parser.add_argument("--movetime", type=float, help="seconds per move for both")
+    parser.add_argument("--nodes", type=int, help="nodes per move for both")
+    parser.add_argument("--depth", type=int, help="plies per move for both")
+    parser.add_argument("--max-plies", type=int, default=400, help="call the game a draw after this many plies")
+    parser.add_argument("--sprt", action="store_true", help="stop as soon as the SPRT is decided")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=5.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args()
+
+    first = EngineConfig.parse(args.first, "first")
+    second = EngineConfig.parse(args.second, "second")
+    limits = {key: value for key, value in (("movetime", args.movetime), ("nodes", args.nodes), ("depth", args.depth))
+              if value is not None}
+    if not limits and not (first.limits and second.limits):
+        limits = {"movetime": 0.1}
+    openings = read_openings(args.openings, args.opening_plies)
+    sprt = (args.elo0, args.elo1, args.alpha, args.beta) if args.sprt else None
+    stats = run(first, second, openings, args.games, limits, args.workers, args.max_plies, sprt)
+    print(report(stats, first, second))
+
+
+if __name__ == "__main__":
+    main()
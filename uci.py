@@ -0,0 +1,322 @@
+"""
+This file lets the engine be run by chess GUIs and tournament managers that speak the Universal Chess Interface
+(UCI), as an alternative to the pygame window in main.py:
+
+    python uci.py [--hash 16] [--workers 1] [--book book.bin] [--tablebases tables/]
+
+Commands are read from stdin, one per line, and answers written to stdout. The searches run on a background thread,
+so "stop", "ponderhit" and "isready" are answered while the engine is thinking, and a search is stopped within
+a few milliseconds of being asked to. Supported: uci, isready, setoption (Hash), ucinewgame,
+position startpos/fen ... moves ..., go with depth, nodes, movetime, wtime, btime, winc, binc, movestogo, infinite
+and ponder, stop, ponderhit and quit.
+
+Moves are written in coordinate notation (e2e4, e1g1 for white's short castle, e7e8q) and read by matching them
+against the legal moves of the Board, so castling, en passant and promotion get their tags from the rules.
+"""
+import argparse
+import sys
+import threading
+from constants import WHITE
+from board import Board, STARTING_FEN, move_name
+from engine import Engine, MATE, MATE_BOUND, MAX_PLY
+
+NAME = "python-chess"
+AUTHOR = "Leo Clough"
+# time kept back from every move for reading and writing the commands, in seconds
+MOVE_OVERHEAD = 0.05
+# with no movestogo, the moves the remaining time is shared between
+DEFAULT_MOVES_TO_GO = 30
+
+
+def movetime_from_clock(time_left, increment=0.0, moves_to_go=None):
+    """The seconds to spend on a move, given the seconds on the clock and the increment per move."""
+    share = time_left / (moves_to_go or DEFAULT_MOVES_TO_GO) + increment * 0.8
+    return max(0.01, min(share, time_left - MOVE_OVERHEAD))
+
+
+def score_text(score):
+    """A search score as UCI writes it, "cp 35" or "mate 3", the mate counted in moves and negative when losing."""
+    if abs(score) > MATE_BOUND:
+        plies = MATE - abs(score)
+        moves = (plies + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+
+def parse_move(board, text):
+    """Finds the legal move written as text in the board's position, or returns None."""
+    for move in board.legal_moves():
+        if move_name(move) == text:
+            return move
+    return None
+
+
+class UCI:
+    """The state of a UCI session: the position to search and the search running on its thread, if there is one.
+    handle(line) carries out one command and returns False once the session should end.
+    """
+
+    def __init__(self, engine, output=sys.stdout, make_engine=None):
+        self.engine = engine
+        self.output = output
+        # builds a new engine with a given hash size in MB, for setoption name Hash
+        self.make_engine = make_engine
+        self.board = Board()
+        self.thread = None
+        self.lock = threading.Lock()
+        # set by stop or ponderhit, which an infinite or pondering search waits for before giving its move
+        self.released = threading.Event()
+        # the limits to switch to on ponderhit
+        self.ponder_limits = None
+        # the timer that stops a pondering search once its movetime has run out after ponderhit
+        self.timer = None
+        # the depth a search stops after, once it has been set by ponderhit, and the last depth it completed
+        self.depth_limit = None
+        self.depth_done = 0
+
+    def send(self, text):
+        with self.lock:
+            self.output.write(text + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "uci":
+            self.send(f"id name {NAME}")
+            self.send(f"id author {AUTHOR}")
+            if self.make_engine is not None:
+                self.send("option name Hash type spin default 16 min 1 max 4096")
+            self.send("option name Ponder type check default false")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.stop()
+            if hasattr(self.engine, "tt"):
+                self.engine.tt.clear()
+            self.board = Board()
+        elif command == "position":
+            self.stop()
+            self.set_position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            self.stop()
+            return False
+        else:
+            self.send(f"info string unknown command {command}")
+        return True
+
+    # ---------------------------
+    def set_option(self, args):
+        text = " ".join(args)
+        if not text.startswith("name "):
+            return
+        name, _, value = text[5:].partition(" value ")
+        if name.strip().lower() == "hash" and self.make_engine is not None:
+            try:
+                hash_mb = max(1, int(value))
+            except ValueError:
+                self.send(f"info string Hash should be a whole number of MB, not {value!r}")
+                return
+            self.stop()
+            if hasattr(self.engine, "close"):
+                self.engine.close()
+            self.engine = self.make_engine(hash_mb)
+
+    def set_position(self, args):
+        """position startpos [moves ...] or position fen <six fields> [moves ...]"""
+        if not args:
+            return
+        moves = []
+        if "moves" in args:
+            index = args.index("moves")
+            args, moves = args[:index], args[index + 1:]
+        if args[0] == "fen":
+            fen = " ".join(args[1:])
+        else:
+            fen = STARTING_FEN
+        try:
+            self.board = Board.from_fen(fen)
+        except ValueError as error:
+            self.send(f"info string {error}")
+            return
+        for text in moves:
+            move = parse_move(self.board, text)
+            if move is None:
+                self.send(f"info string illegal move {text} in {self.board.to_fen()}")
+                break
+            self.board.make_move(move)
+
+    def _limits(self, options, infinite):
+        """Turns the go options into the keyword arguments of Engine.search."""
+        limits = {}
+        if "depth" in options:
+            limits["depth"] = max(1, int(options["depth"]))
+        if "nodes" in options:
+            limits["nodes"] = int(options["nodes"])
+        if "movetime" in options:
+            limits["movetime"] = int(options["movetime"]) / 1000
+        else:
+            clock, increment = ("wtime", "winc") if self.board.turn == WHITE else ("btime", "binc")
+            if clock in options:
+                limits["movetime"] = movetime_from_clock(int(options[clock]) / 1000,
+                                                         int(options.get(increment, 0)) / 1000,
+                                                         int(options["movestogo"]) if "movestogo" in options else None)
+        if infinite or not limits:
+            # keep going until told to stop, the depth only stops it at the deepest it can go
+            limits = {"depth": MAX_PLY - 1}
+        return limits
+
+    def go(self, args):
+        options = {}
+        flags = set()
+        index = 0
+        while index < len(args):
+            word = args[index]
+            if word in ("infinite", "ponder"):
+                flags.add(word)
+                index += 1
+            elif word == "searchmoves":
+                # not supported, the rest of the line is the moves to search
+                break
+            else:
+                if index + 1 < len(args):
+                    options[word] = args[index + 1]
+                index += 2
+        pondering = "ponder" in flags
+        infinite = "infinite" in flags or pondering
+        try:
+            self.ponder_limits = self._limits(options, False) if pondering else None
+            limits = self._limits(options, infinite)
+        except ValueError as error:
+            # the GUI is waiting for a move all the same, so it is told there isn't one
+            self.ponder_limits = None
+            self.send(f"info string bad go command: {error}")
+            self.send("bestmove 0000")
+            return
+        self.released.clear()
+        self.depth_limit = None
+        self.depth_done = 0
+        self.timer = None
+        if pondering and "movetime" in self.ponder_limits:
+            # started by ponderhit, and cancelled by this search once it has given its move, never by another
+            self.timer = threading.Timer(self.ponder_limits["movetime"], self.engine.stop)
+            self.timer.daemon = True
+        # the search makes and takes back moves on the board, which is left alone until it has finished,
+        # as every command that changes the position stops the search first
+        self.thread = threading.Thread(target=self._search, args=(self.board, limits, infinite, self.timer),
+                                       daemon=True)
+        self.thread.start()
+
+    def _search(self, board, limits, infinite, timer):
+        try:
+            move, stats = self.engine.search(board, info=self._info, **limits)
+        except Exception as error:
+            # nothing can be raised to the GUI from this thread, and it waits for a bestmove whatever happens
+            self.send(f"info string search failed: {error!r}")
+            move, stats = None, {}
+        if infinite:
+            # a GUI that asked for an infinite or pondering search doesn't expect the move until it says so
+            self.released.wait()
+        if timer is not None:
+            timer.cancel()
+        if move is None:
+            self.send("bestmove 0000")
+            return
+        pv = stats.get("pv") or [move]
+        text = f"bestmove {move_name(move)}"
+        if len(pv) > 1 and pv[0] == move:
+            text += f" ponder {move_name(pv[1])}"
+        self.send(text)
+
+    def _info(self, stats):
+        pv = " ".join(move_name(move) for move in stats["pv"])
+        self.send(f"info depth {stats['depth']} score {score_text(stats['score'])} nodes {stats['nodes']} "
+                  f"nps {stats['nps']} time {int(stats['seconds'] * 1000)} pv {pv}")
+        with self.lock:
+            self.depth_done = stats["depth"]
+            if self.depth_limit is not None and self.depth_done >= self.depth_limit:
+                self.engine.stop()
+
+    def ponderhit(self):
+        """The opponent played the move being pondered on, so the search carries on as a normal one,
+        with the depth, nodes and movetime of the go command, counted from now, or stops if it had none.
+        """
+        limits = self.ponder_limits
+        self.ponder_limits = None
+        if self.thread is None or limits is None:
+            return
+        with self.lock:
+            # the limits are in place before the search is released, so it can't give its move without them
+            if "movetime" in limits:
+                self.timer.start()
+            if "nodes" in limits:
+                self.engine.node_limit = self.engine.nodes + limits["nodes"]
+            if limits.get("depth", MAX_PLY - 1) < MAX_PLY - 1:
+                self.depth_limit = limits["depth"]
+                if self.depth_done >= self.depth_limit:
+                    self.engine.stop()
+            elif "movetime" not in limits and "nodes" not in limits:
+                # go ponder with no limits of its own
+                self.engine.stop()
+        self.released.set()
+
+    def stop(self):
+        """Stops the search running, if there is one, and waits for it to give its move."""
+        thread = self.thread
+        if thread is None:
+            return
+        self.released.set()
+        # asked again until it ends, in case the search hadn't started counting when first asked
+        while thread.is_alive():
+            self.engine.stop()
+            thread.join(0.005)
+        self.thread = None
+        self.ponder_limits = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the engine over the Universal Chess Interface.")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB")
+    parser.add_argument("--workers", type=int, default=1, help="processes to search with")
+    parser.add_argument("--book", help="an opening book to play from, see book.py")
+    parser.add_argument("--tablebases", help="a directory of endgame tables, see tablebase.py")
+    args = parser.parse_args()
+
+    book = tablebases = None
+    if args.book:
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    if args.tablebases:
+        from tablebase import Tablebases
+        tablebases = Tablebases(args.tablebases)
+    if args.workers > 1:
+        from parallel import ParallelEngine
+
+        def make_engine(hash_mb):
+            return ParallelEngine(args.workers, hash_mb, book=book, tablebases=tablebases)
+    else:
+        def make_engine(hash_mb):
+            return Engine(hash_mb, book=book, tablebases=tablebases)
+
+    session = UCI(make_engine(args.hash), make_engine=make_engine)
+    for line in sys.stdin:
+        if not session.handle(line):
+            break
+    if hasattr(session.engine, "close"):
+        session.engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+This file holds the random numbers for Zobrist hashing, which gives every position a 64-bit key.
+The key is the XOR of one number per piece on its square, one for the side to move, one for the castling rights
+and one for the en passant file, so Board can update it a few XORs at a time as moves are made.
+The numbers come from a fixed seed, so the same position always gets the same key, in any process or run.
+"""
+import random
+from constants import RANKS, FILES, WHITE
+from bitboard import squares
+from piece import PIECE_CODES, CODE_COUNT
+
+SEED = 20220315
+
+_random = random.Random(SEED)
+
+# indexed by piece code, then square. The codes in between the two colours have no pieces and no numbers
+PIECE_KEYS = [None] * CODE_COUNT
+for _code in PIECE_CODES:
+    PIECE_KEYS[_code] = [_random.getrandbits(64) for _ in range(RANKS * FILES)]
+
+# XORed in when it is black to move
+SIDE_KEY = _random.getrandbits(64)
+
+# one number per castling right, combined into a key for each of the 16 sets of rights
+_CASTLING_RIGHT_KEYS = [_random.getrandbits(64) for _ in range(4)]
+CASTLING_KEYS = []
+for _rights in range(16):
+    _key = 0
+    for _bit in range(4):
+        if _rights >> _bit & 1:
+            _key ^= _CASTLING_RIGHT_KEYS[_bit]
+    CASTLING_KEYS.append(_key)
+
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(FILES)]
+
+
+def hash_board(board):
+    """Works out a board's key from scratch. Board keeps its own key up to date, so this is for setting it up
+    and for checking the incremental key.
+    """
+    key = 0
+    for code in PIECE_CODES:
+        piece_keys = PIECE_KEYS[code]
+        for sq in squares(board.bitboards[code]):
+            key ^= piece_keys[sq]
+    if board.turn != WHITE:
+        key ^= SIDE_KEY
+    key ^= CASTLING_KEYS[board.castling_rights]
+    key ^= board._en_passant_key()
+    return key